@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares per-listener overhead of promise based Dispatcher.notify
+with coroutine based AsyncDispatcher.notify.
+
+Usage: PYTHONPATH=../src python asyncio_notify.py
+"""
+
+##
+# python standard library
+#
+from __future__ import print_function
+import asyncio
+import time
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher
+from pyevent_asyncio import AsyncDispatcher
+
+
+def listener(event, deferred):
+    deferred.resolve()
+
+
+async def coroutine_listener(event):
+    pass
+
+
+def prepare(dispatcher_class, callback, listeners):
+    d = dispatcher_class()
+    for i in range(listeners):
+        d.attach('bench', callback)
+    return d
+
+
+def bench_promise(listeners, number):
+    d = prepare(Dispatcher, listener, listeners)
+    event = Event(None)
+    start = time.perf_counter()
+    for i in range(number):
+        d.notify('bench', event)
+    return time.perf_counter() - start
+
+
+def bench_asyncio(callback, listeners, number):
+    d = prepare(AsyncDispatcher, callback, listeners)
+    event = Event(None)
+
+    async def run():
+        start = time.perf_counter()
+        for i in range(number):
+            await d.notify('bench', event)
+        return time.perf_counter() - start
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+
+def per_listener(total, listeners, number):
+    return total / number / listeners * 1e6
+
+
+def main():
+    print('%-10s %16s %16s %16s' % ('listeners', 'promise [us]',
+        'bridged [us]', 'coroutine [us]'))
+    for listeners in (1, 10, 100, 1000):
+        number = max(10, 20000 // listeners)
+        print('%-10d %16.3f %16.3f %16.3f' % (listeners,
+            per_listener(bench_promise(listeners, number), listeners,
+                number),
+            per_listener(bench_asyncio(listener, listeners, number),
+                listeners, number),
+            per_listener(bench_asyncio(coroutine_listener, listeners,
+                number), listeners, number)))
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares events/sec of single Dispatcher.notify calls
+with batched Dispatcher.notify_many calls.
+
+Usage: PYTHONPATH=../src python batch.py
+"""
+
+##
+# python standard library
+#
+from __future__ import print_function
+import timeit
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher, synchronous, batched
+
+
+def listener(event, deferred):
+    deferred.resolve()
+
+
+@synchronous
+def sync_listener(event):
+    pass
+
+
+@batched
+@synchronous
+def batch_listener(events):
+    pass
+
+
+def prepare(callback, listeners=10):
+    d = Dispatcher()
+    for i in range(listeners):
+        d.attach('bench', callback)
+    return d
+
+
+def single(d, events):
+    for event in events:
+        d.notify('bench', event)
+
+
+def many(d, events):
+    d.notify_many('bench', events)
+
+
+def rate(function, d, events, number=5):
+    total = min(timeit.repeat(lambda: function(d, events), number=number,
+        repeat=3))
+    return len(events) * number / total
+
+
+def main():
+    events = [Event(None) for i in range(1000)]
+    print('%-22s %14s %14s' % ('listeners (x10)', 'notify [ev/s]',
+        'notify_many'))
+    for label, callback in (('deferred', listener),
+            ('synchronous', sync_listener), ('batched', batch_listener)):
+        d = prepare(callback)
+        print('%-22s %14d %14d' % (label, rate(single, d, events),
+            rate(many, d, events)))
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures throughput and round-trip latency of SocketBus
+between two processes.
+
+Usage: PYTHONPATH=../src python bus.py
+"""
+
+##
+# python standard library
+#
+from __future__ import print_function
+import multiprocessing
+import select
+import shutil
+import tempfile
+import time
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher, synchronous
+from pyevent_bus import SocketBus
+
+
+EVENTS = 20000
+PINGS = 2000
+
+
+def wait(bus, expected):
+    received = 0
+    while received < expected:
+        select.select([bus], [], [])
+        received += bus.receive()
+
+
+def sender(directory, batch, ready):
+    d = Dispatcher()
+    bus = SocketBus(d, directory, ['bench'], batch=batch, ident='sender',
+            timeout=None)
+    ready.wait()
+    for i in range(EVENTS):
+        d.notify('bench', Event(None, {'key': 'item:%d' % i}))
+    bus.flush()
+    bus.close()
+
+
+def echo(directory, ready):
+    d = Dispatcher()
+    bus = SocketBus(d, directory, ['pong'], ident='echo', timeout=None)
+    d.attach('ping', synchronous(lambda e: d.notify('pong', Event(None))))
+    ready.set()
+    wait(bus, PINGS)
+    bus.close()
+
+
+def throughput(batch):
+    directory = tempfile.mkdtemp()
+    d = Dispatcher()
+    bus = SocketBus(d, directory, ident='receiver')
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=sender,
+            args=(directory, batch, ready))
+    process.start()
+    start = time.time()
+    ready.set()
+    wait(bus, EVENTS)
+    total = time.time() - start
+    process.join()
+    bus.close()
+    shutil.rmtree(directory)
+    return EVENTS / total
+
+
+def latency():
+    directory = tempfile.mkdtemp()
+    d = Dispatcher()
+    bus = SocketBus(d, directory, ['ping'], ident='pinger', timeout=None)
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=echo, args=(directory, ready))
+    process.start()
+    ready.wait()
+    samples = []
+    for i in range(PINGS):
+        start = time.time()
+        d.notify('ping', Event(None))
+        wait(bus, 1)
+        samples.append(time.time() - start)
+    process.join()
+    bus.close()
+    shutil.rmtree(directory)
+    samples.sort()
+    return samples[len(samples) // 2], samples[len(samples) * 99 // 100]
+
+
+def main():
+    print('%-22s %14s' % ('batch', 'events/s'))
+    for batch in (1, 16, 256):
+        print('%-22d %14d' % (batch, throughput(batch)))
+    p50, p99 = latency()
+    print('round trip: p50 %.1f us, p99 %.1f us' % (p50 * 1e6, p99 * 1e6))
+
+
+if "__main__" == __name__:
+    main()
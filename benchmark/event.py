@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures memory used by single event and event construction time.
+
+Compares __dict__ based event used by previous releases with slotted
+Event and LightEvent.
+
+Usage: PYTHONPATH=../src python event.py
+"""
+
+##
+# python standard library
+#
+from __future__ import print_function
+import timeit
+import tracemalloc
+
+##
+# event modules
+#
+from pyevent import Event, LightEvent
+
+
+class DictEvent(object):
+    """
+    Event implementation used by previous releases
+    """
+
+    def __init__(self, subject, parameters={}):
+        self.subject = subject
+        self.name = None
+        self.parameters = parameters
+        self._processed = False
+        self._propagate = True
+
+
+def memory_per_event(factory, number=10000):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    events = [factory() for i in range(number)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # list holding events is not counted
+    return (after - before) / float(number) - 8
+
+
+def construction_time(factory, number=100000):
+    return min(timeit.repeat(factory, number=number, repeat=3)) / \
+            number * 1e9
+
+
+def main():
+    cases = (
+        ('dict based event', lambda: DictEvent(None)),
+        ('dict based + params', lambda: DictEvent(None, {'a': 1})),
+        ('Event', lambda: Event(None)),
+        ('Event + params', lambda: Event(None, {'a': 1})),
+        ('LightEvent', LightEvent),
+    )
+    print('%-22s %14s %14s' % ('event', 'memory [B]', 'create [ns]'))
+    for label, factory in cases:
+        print('%-22s %14.1f %14.1f' % (label, memory_per_event(factory),
+            construction_time(factory)))
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares queue depth and time spent in the queue of EventQueue overflow
+policies when producer outpaces the listener.
+
+Usage: PYTHONPATH=../src python event_queue.py
+"""
+
+##
+# python standard library
+#
+from __future__ import print_function
+import threading
+import time
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher, EventQueue, synchronous
+
+
+EVENTS = 20000
+
+
+@synchronous
+def slow_listener(event):
+    sum(range(200))
+
+
+def run(capacity, overflow):
+    d = Dispatcher()
+    d.attach('bench', slow_listener)
+    queue = EventQueue(d, capacity, overflow)
+    worker = threading.Thread(target=queue.run)
+    worker.start()
+    start = time.time()
+    for i in range(EVENTS):
+        queue.put('bench', Event(None))
+    queue.close()
+    worker.join()
+    return queue.snapshot(), time.time() - start
+
+
+def main():
+    print('%-24s %10s %10s %12s %12s' % ('policy', 'dispatched',
+        'max depth', 'p50 [us]', 'p99 [us]'))
+    for label, capacity, overflow in (
+            ('unbounded', EVENTS, EventQueue.REJECT),
+            ('block.100', 100, EventQueue.BLOCK),
+            ('drop_oldest.100', 100, EventQueue.DROP_OLDEST),
+            ('drop_newest.100', 100, EventQueue.DROP_NEWEST),
+            ('reject.100', 100, EventQueue.REJECT)):
+        snapshot, elapsed = run(capacity, overflow)
+        print('%-24s %10d %10d %12d %12d' % (label, snapshot['dispatched'],
+            snapshot['max_depth'], snapshot['latency']['p50'],
+            snapshot['latency']['p99']))
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures events/sec of journaling notified events and of reading
+them back.
+
+Usage: PYTHONPATH=../src python journal.py
+"""
+
+##
+# python standard library
+#
+from __future__ import print_function
+import shutil
+import tempfile
+import time
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher
+from pyevent_journal import Journal, read
+
+
+EVENTS = 100000
+
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        d = Dispatcher()
+        journal = Journal(directory, segment_size=4 * 1024 * 1024).attach(d)
+        events = [Event(None, {'key': 'item:%d' % i, 'value': i}) \
+                for i in range(EVENTS)]
+        start = time.time()
+        for event in events:
+            d.notify('cache.invalidate', event)
+        journal.close()
+        write = time.time() - start
+        start = time.time()
+        count = sum(1 for record in read(directory))
+        reading = time.time() - start
+        print('%-22s %14d' % ('notify+journal [ev/s]', EVENTS / write))
+        print('%-22s %14d' % ('read [ev/s]', count / reading))
+    finally:
+        shutil.rmtree(directory)
+
+
+if "__main__" == __name__:
+    main()
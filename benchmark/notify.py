@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures per-listener overhead of Dispatcher.notify.
+
+Compares current iterative dispatch loop with recursive implementation
+used by previous releases and deferred listeners with synchronous ones.
+
+Usage: PYTHONPATH=../src python notify.py
+"""
+
+##
+# python standard library
+#
+from __future__ import print_function
+import timeit
+from functools import partial
+
+##
+# pypromise modules
+#
+from promise import Deferred
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher, synchronous
+
+
+class RecursiveDispatcher(Dispatcher):
+    """
+    Dispatcher using recursive listener chain (one stack frame per listener)
+    """
+
+    def _async_notify(self, listeners, event, deferred):
+        try:
+            if event.is_propagation_stopped():
+                raise StopIteration()
+            Deferred(partial(next(listeners)[0], event))\
+                    .done(partial(self._async_notify, listeners, event,
+                        deferred=deferred))\
+                    .fail(deferred.reject)
+        except StopIteration:
+            deferred.resolve(event)
+
+
+def listener(event, deferred):
+    deferred.resolve()
+
+
+@synchronous
+def sync_listener(event):
+    pass
+
+
+def bench(dispatcher_class, listeners, number, callback=listener,
+        method='notify'):
+    d = dispatcher_class()
+    for i in range(listeners):
+        d.attach('bench', callback)
+    event = Event(None)
+    total = min(timeit.repeat(partial(getattr(d, method), 'bench', event),
+            number=number, repeat=3))
+    return total / number / listeners * 1e6
+
+
+def format_bench(dispatcher_class, listeners, number):
+    try:
+        return '%16.3f' % bench(dispatcher_class, listeners, number)
+    except RuntimeError:
+        # RecursionError on Python 3, RuntimeError on Python 2
+        return '%16s' % 'stack overflow'
+
+
+def main():
+    print('%-10s %16s %16s' % ('listeners', 'recursive [us]', 'iterative [us]'))
+    for listeners in (1, 10, 100, 1000, 5000):
+        number = max(10, 20000 // listeners)
+        print('%-10d %s %s' % (listeners,
+            format_bench(RecursiveDispatcher, listeners, number),
+            format_bench(Dispatcher, listeners, number)))
+    print()
+    print('%-10s %16s %16s %16s' % ('listeners', 'deferred [us]',
+        'synchronous [us]', 'notify_sync [us]'))
+    for listeners in (1, 10, 100, 1000):
+        number = max(10, 20000 // listeners)
+        print('%-10d %16.3f %16.3f %16.3f' % (listeners,
+            bench(Dispatcher, listeners, number),
+            bench(Dispatcher, listeners, number, sync_listener),
+            bench(Dispatcher, listeners, number, sync_listener,
+                'notify_sync')))
+
+
+if "__main__" == __name__:
+    main()
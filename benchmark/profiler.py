@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Measures overhead of dispatch profiling.
+
+Compares notify without profiling support at all, notify with profiling
+disabled and notify with profiling enabled.
+
+Usage: PYTHONPATH=../src python profiler.py
+"""
+
+##
+# python standard library
+#
+from __future__ import print_function
+import timeit
+from functools import partial
+
+##
+# pypromise modules
+#
+from promise import Deferred
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher, synchronous
+
+
+class BareDispatcher(Dispatcher):
+    """
+    Dispatcher without profiling support
+    """
+
+    def notify(self, name, event):
+        event.start_propagation().name = name
+        return Deferred(partial(self._async_notify,
+                iter(self._snapshot(name)), event)).promise()
+
+
+def listener(event, deferred):
+    deferred.resolve()
+
+
+@synchronous
+def sync_listener(event):
+    pass
+
+
+def bench(dispatcher, callback, listeners, number=20000):
+    for i in range(listeners):
+        dispatcher.attach('bench', callback)
+    event = Event(None)
+    return min(timeit.repeat(partial(dispatcher.notify, 'bench', event),
+            number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    print('%-24s %14s %14s %14s' % ('listeners', 'bare [us]', 'disabled [us]',
+        'enabled [us]'))
+    for label, callback in (('deferred', listener),
+            ('synchronous', sync_listener)):
+        for listeners in (1, 10):
+            enabled = Dispatcher()
+            enabled.enable_profiling()
+            print('%-24s %14.3f %14.3f %14.3f' % (
+                '%d x %s' % (listeners, label),
+                bench(BareDispatcher(), callback, listeners),
+                bench(Dispatcher(), callback, listeners),
+                bench(enabled, callback, listeners)))
+
+
+if "__main__" == __name__:
+    main()
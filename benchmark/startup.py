@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compares startup time (fresh interpreter) of registering listeners from
+many modules eagerly (imported at boot) and lazily (as "module:attribute"
+strings imported on first notify).
+
+Usage: PYTHONPATH=../src python startup.py
+"""
+
+##
+# python standard library
+#
+from __future__ import print_function
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+MODULES = 200
+
+# every listener module does some work at import time (as real ones do)
+MODULE = '''
+TABLE = dict((i, str(i)) for i in range(2000))
+
+def on_event(event, deferred):
+    deferred.resolve(TABLE.get(event.parameters.get('id')))
+'''
+
+EAGER = '''
+from pyevent import Dispatcher, Event
+import importlib
+d = Dispatcher()
+for i in range(%(modules)d):
+    module = importlib.import_module('bench_listeners_%%d' %% i)
+    d.attach('event.%%d' %% i, module.on_event)
+d.notify('event.0', Event(None))
+'''
+
+LAZY = '''
+from pyevent import Dispatcher, Manager, Event
+d = Dispatcher()
+Manager(d).register_lazy([('event.%%d' %% i,
+    'bench_listeners_%%d:on_event' %% i) for i in range(%(modules)d)])
+d.notify('event.0', Event(None))
+'''
+
+
+def run(code, path, repeat=5):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([path] + \
+            [p for p in env.get('PYTHONPATH', '').split(os.pathsep) if p])
+    env['PYTHONDONTWRITEBYTECODE'] = '1'
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code], env=env)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    path = tempfile.mkdtemp()
+    try:
+        for i in range(MODULES):
+            with open(os.path.join(path, 'bench_listeners_%d.py' % i),
+                    'w') as f:
+                f.write(MODULE)
+        # interpreter start and import of pyevent itself
+        baseline = run('import pyevent', path)
+        print('%-22s %12s' % ('registration', 'startup [ms]'))
+        for label, code in (('eager', EAGER), ('lazy', LAZY)):
+            elapsed = run(code % {'modules': MODULES}, path) - baseline
+            print('%-22s %12.1f' % (label, max(elapsed, 0) * 1e3))
+    finally:
+        shutil.rmtree(path)
+
+
+if "__main__" == __name__:
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for dispatcher hot paths.
+
+Runs timeit based benchmarks and writes results as JSON, so results of
+different releases can be compared.
+
+Usage:
+
+PYTHONPATH=../src python suite.py [-o results.json] [-c previous.json]
+        [-f name_filter]
+"""
+
+##
+# python standard library
+#
+from __future__ import print_function
+import argparse
+import gc
+import json
+import itertools
+import platform
+import sys
+import time
+import timeit
+from functools import partial
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher, Manager, Listener, Coalescer, \
+        MergeByKey, ShardedDispatcher, cached, synchronous
+
+
+def listener(event, deferred):
+    deferred.resolve()
+
+
+@synchronous
+def sync_listener(event):
+    pass
+
+
+class BenchListener(Listener):
+
+    def __init__(self, names):
+        self.names = names
+
+    def mapping(self):
+        return [(name, self.handle, i % 10) for (i, name) in \
+                enumerate(self.names)]
+
+    def handle(self, event, deferred):
+        deferred.resolve()
+
+
+def prepared(listeners, callback, names=1):
+    d = Dispatcher()
+    for i in range(listeners):
+        for n in range(names):
+            d.attach('event.%d' % n, callback, i % 10)
+    return d
+
+
+def bench_notify(listeners, callback, frozen=False):
+    d = prepared(listeners, callback)
+    if frozen:
+        d = d.freeze()
+    event = Event(None)
+    return partial(d.notify, 'event.0', event)
+
+
+def bench_notify_sync(listeners):
+    d = prepared(listeners, sync_listener)
+    event = Event(None)
+    return partial(d.notify_sync, 'event.0', event)
+
+
+def bench_large_registry(names):
+    d = prepared(10, sync_listener, names)
+    event = Event(None)
+    keys = itertools.cycle(['event.%d' % n for n in range(names)])
+
+    def run():
+        d.notify(next(keys), event)
+    return run
+
+
+def bench_attach_detach(listeners):
+    d = prepared(listeners, listener)
+    event = Event(None)
+
+    def run():
+        d.attach('event.0', sync_listener, 5)
+        d.notify('event.0', event)
+        d.detach('event.0', sync_listener)
+    return run
+
+
+def bench_register(listeners, names=10):
+    objects = [BenchListener(['event.%d' % ((i + n) % 100) \
+            for n in range(names)]) for i in range(listeners)]
+
+    def run():
+        manager = Manager(Dispatcher())
+        for o in objects:
+            manager.register(o)
+    return run
+
+
+def bench_register_many(listeners, names=10):
+    objects = [BenchListener(['event.%d' % ((i + n) % 100) \
+            for n in range(names)]) for i in range(listeners)]
+
+    def run():
+        Manager(Dispatcher()).register_many(objects)
+    return run
+
+
+def bench_burst(events, coalesce=False):
+    d = prepared(10, sync_listener)
+    burst = [Event(None, {'key': i % 10}) for i in range(events)]
+    if not coalesce:
+        def run():
+            for event in burst:
+                d.notify('event.0', event)
+        return run
+    coalescer = Coalescer(d).policy('event.0',
+            MergeByKey(lambda e: e.parameters['key'], 60))
+
+    def run():
+        for event in burst:
+            coalescer.notify('event.0', event)
+        coalescer.flush()
+    return run
+
+
+@synchronous
+def pure_listener(event):
+    return sum(range(event.parameters['sku'] % 10 * 10 + 1000))
+
+
+def bench_cached(cache=False):
+    d = Dispatcher()
+    d.attach('event.0', cached(pure_listener, lambda event: \
+            event.parameters['sku']) if cache else pure_listener)
+    events = itertools.cycle([Event(None, {'sku': i}) for i in range(100)])
+
+    def run():
+        d.notify('event.0', next(events))
+    return run
+
+
+def bench_tenants(tenants, filtered=True):
+    d = Dispatcher()
+    for tenant in range(tenants):
+        if filtered:
+            d.attach('event.0', listener, where={'tenant': tenant})
+        else:
+            d.attach('event.0', partial(tenant_listener, tenant))
+    event = Event(None, {'tenant': tenants // 2})
+    return partial(d.notify, 'event.0', event)
+
+
+def bench_sharded(tenants, listeners=10):
+    d = ShardedDispatcher(lambda event: event.parameters.get('tenant'))
+    for i in range(listeners):
+        d.attach('event.0', listener)
+    for tenant in range(tenants):
+        d.shard(tenant).attach('event.0', listener)
+    events = itertools.cycle([Event(None, {'tenant': tenant}) \
+            for tenant in range(tenants)])
+
+    def run():
+        d.notify('event.0', next(events))
+    return run
+
+
+def tenant_listener(tenant, event, deferred):
+    if event.parameters.get('tenant') != tenant:
+        return deferred.resolve()
+    deferred.resolve()
+
+
+BENCHMARKS = [
+    ('notify.deferred.1', partial(bench_notify, 1, listener)),
+    ('notify.deferred.10', partial(bench_notify, 10, listener)),
+    ('notify.deferred.1000', partial(bench_notify, 1000, listener)),
+    ('notify.sync.1', partial(bench_notify, 1, sync_listener)),
+    ('notify.sync.10', partial(bench_notify, 10, sync_listener)),
+    ('notify.sync.1000', partial(bench_notify, 1000, sync_listener)),
+    ('frozen.notify.deferred.10', partial(bench_notify, 10, listener, True)),
+    ('frozen.notify.sync.10', partial(bench_notify, 10, sync_listener, True)),
+    ('frozen.notify.sync.1000',
+        partial(bench_notify, 1000, sync_listener, True)),
+    ('notify_sync.10', partial(bench_notify_sync, 10)),
+    ('notify_sync.1000', partial(bench_notify_sync, 1000)),
+    ('registry.names.10000', partial(bench_large_registry, 10000)),
+    ('churn.attach_detach.100', partial(bench_attach_detach, 100)),
+    ('manager.register.100x10', partial(bench_register, 100)),
+    ('startup.register.2000x10', partial(bench_register, 2000)),
+    ('startup.register_many.2000x10', partial(bench_register_many, 2000)),
+    ('burst.notify.1000', partial(bench_burst, 1000)),
+    ('burst.coalesced.1000', partial(bench_burst, 1000, True)),
+    ('pure.notify', bench_cached),
+    ('pure.cached', partial(bench_cached, True)),
+    ('tenants.if.1000', partial(bench_tenants, 1000, False)),
+    ('tenants.where.1000', partial(bench_tenants, 1000)),
+    ('tenants.where.10000', partial(bench_tenants, 10000)),
+    ('tenants.sharded.1000', partial(bench_sharded, 1000)),
+    ('tenants.sharded.10000', partial(bench_sharded, 10000)),
+]
+
+
+def measure(factory, min_time=0.2, repeat=5):
+    """
+    Returns best time of single call (in seconds) of function
+    returned by given factory
+    """
+    function = factory()
+    number = 1
+    while True:
+        elapsed = timeit.timeit(function, number=number)
+        if elapsed >= min_time / repeat:
+            break
+        number *= 10
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+
+def memory_per_listener(listeners=10000):
+    """
+    Returns number of bytes used by single registered listener
+    """
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        d = prepared(listeners, listener)
+        d.get_listeners('event.0')
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return (after - before) / float(listeners)
+
+
+def run(name_filter=None):
+    results = {}
+    for name, factory in BENCHMARKS:
+        if name_filter and name_filter not in name:
+            continue
+        results[name] = measure(factory)
+        print('%-30s %12.3f us' % (name, results[name] * 1e6))
+    if not name_filter or name_filter in 'memory.per_listener':
+        results['memory.per_listener'] = memory_per_listener()
+        print('%-30s %12s B' % ('memory.per_listener',
+            results['memory.per_listener']))
+    return results
+
+
+def compare(results, previous):
+    print()
+    print('%-30s %12s %12s %8s' % ('benchmark', 'previous', 'current',
+        'change'))
+    for name in sorted(results):
+        if name not in previous or not previous[name] or not results[name]:
+            continue
+        print('%-30s %12.4g %12.4g %+7.1f%%' % (name, previous[name],
+            results[name], (results[name] / previous[name] - 1) * 100))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='pyevent benchmark suite')
+    parser.add_argument('-o', '--output', help='write results to JSON file')
+    parser.add_argument('-c', '--compare',
+            help='compare results with given JSON file')
+    parser.add_argument('-f', '--filter', help='run matching benchmarks only')
+    args = parser.parse_args(argv)
+
+    results = run(args.filter)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'python': platform.python_version(),
+                'platform': platform.platform(), 'time': time.time(),
+                'results': results}, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)['results'])
+
+
+if "__main__" == __name__:
+    main(sys.argv[1:])
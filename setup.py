@@ -16,6 +16,7 @@ setup(name='PyEvent',
     author='Michał Bachowski',
     author_email='michal@bachowski.pl',
     package_dir={'': 'src'},
-    py_modules=['pyevent'],
+    py_modules=['pyevent', 'pyevent_asyncio', 'pyevent_bus',
+        'pyevent_journal'],
     install_requires='PyPromise==1.1.2',
     dependency_links = ['http://github.com/michalbachowski/pypromise/archive/1.1.2.zip#egg=PyPromise-1.1.2'])
@@ -1,11 +1,65 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import bisect
+import collections
 import heapq
+import importlib
 import itertools
+import sys
+import threading
+import time
+import types
+import weakref
 from functools import partial, wraps
 from promise import Deferred
 
 
+class ListenerError(Exception):
+    """
+    Raised when listener rejects its deferred object.
+    Arguments given to 'reject' are available as 'args'
+    """
+
+
+class ListenerTimeout(ListenerError):
+    """
+    Raised when listener (or the whole notification) does not finish
+    within given time
+    """
+
+
+class FrozenDispatcherError(TypeError):
+    """
+    Raised on attempt to change listeners of frozen dispatcher
+    """
+
+
+class QueueFull(Exception):
+    """
+    Reason of rejection of events that did not fit into full EventQueue
+    """
+
+
+class ListenerErrors(ListenerError):
+    """
+    Raised when one or more listeners notified concurrently fail.
+    List of errors is available as 'errors'
+    """
+
+    def __init__(self, errors):
+        super(ListenerErrors, self).__init__(errors)
+        self.errors = errors
+
+
+def _error(args):
+    """
+    Converts arguments given to 'reject' into exception instance
+    """
+    if len(args) == 1 and isinstance(args[0], BaseException):
+        return args[0]
+    return ListenerError(*args)
+
+
 class Event(object):
     """
     Class that represents single event to be handled
@@ -28,18 +82,36 @@ class Event(object):
     e.is_processed()    # False
     e.mark_procesed()
     e.is_propagation_stopped() # false
+
+    Event uses __slots__; parameters dictionary is created on first access
+    when not given.
     """
+    __slots__ = ('subject', 'name', '_parameters', '_processed',
+            '_propagate')
 
-    def __init__(self, subject, parameters={}):
+    def __init__(self, subject, parameters=None):
         """
         Initializes class instance
         """
         self.subject = subject
         self.name = None
-        self.parameters = parameters
+        self._parameters = parameters
         self._processed = False
         self._propagate = True
 
+    @property
+    def parameters(self):
+        """
+        Event parameters
+        """
+        if self._parameters is None:
+            self._parameters = {}
+        return self._parameters
+
+    @parameters.setter
+    def parameters(self, parameters):
+        self._parameters = parameters
+
     # propagation
     def is_propagation_stopped(self):
         """
@@ -70,9 +142,33 @@ class Event(object):
         return self
 
 
+class LightEvent(Event):
+    """
+    Event variant meant for high volume dispatching: subject is optional.
+    Creating new events is cheaper than reusing old ones (CPython keeps
+    free lists of small objects itself), so events are not pooled
+    """
+    __slots__ = ()
+
+    def __init__(self, subject=None, parameters=None):
+        """
+        Initializes class instance
+        """
+        self.subject = subject
+        self.name = None
+        self._parameters = parameters
+        self._processed = False
+        self._propagate = True
+
+
 class Dispatcher(object):
     """
     Dispatches given events according to previously set listeners
+
+    Dispatcher can be shared between threads. Listener lists are never
+    changed in place: writers (attach, detach, ...) build new copies under
+    a lock and publish them, while readers (notify, get_listeners, ...)
+    never lock and always work on consistent, immutable snapshots.
     """
 
     def __init__(self):
@@ -80,136 +176,3150 @@ class Dispatcher(object):
         Initializes class instance
         """
         self._listeners = {}
-        self._dirty = False
+        self._keys = {}
+        self._snapshots = {}
+        self._bands = {}
+        self._patterns = _PatternIndex()
+        self._generation = 0
+        self._unlisted = 0
+        self._lock = threading.Lock()
+        self._graveyard = collections.deque()
         self.priority = 400
         self.counter = itertools.count()
+        self.profiler = None
+        self.scheduler = None
+        # number of compiled lists of event names without own listeners
+        # (matched by patterns only) kept before all of them are dropped
+        self.pattern_cache_size = 4096
+
+    def attach(self, name, listener, priority=None, executor=None,
+            weak=False, timeout=None, cache=None, when=None, where=None):
+        """
+        Attaches new listener to dispatcher.
+
+        When executor (e.g. concurrent.futures thread or process pool)
+        is given, listener is called as listener(event) within the executor
+        (see 'executed' function).
+        When 'weak' is True dispatcher holds only weak reference to the
+        listener (for bound methods - to its instance); listener is
+        detached automatically once its target is garbage collected.
+        When 'timeout' is given, listener that does not finish within
+        'timeout' seconds fails with ListenerTimeout (see 'timed').
+        When 'cache' is given (key function or True for default key)
+        results of the listener are memoized (see 'cached').
+        Listener is called only for events accepted by 'when' predicate
+        (callable taking the event) and matching 'where' filter:
+        dictionary {parameter: value} requiring equal parameters
+        or {parameter: set (list, tuple) of values} requiring one
+        of the values. 'where' filters are indexed, so events are matched
+        against listeners without scanning them.
+        """
+        item = self._prepare(listener, priority, executor,
+                weak and _Detacher(self, '_detach', name), timeout,
+                cache, when, where)
+        with self._lock:
+            listeners = list(self._listeners.get(name, ()))
+            bisect.insort(listeners, item)
+            self._keys.setdefault(name, {})\
+                    .setdefault(_key(item[2]), []).append(item)
+            self._listeners[name] = listeners
+            self._invalidate(name)
+            self._bury()
+
+    def attach_many(self, mappings, weak=False):
+        """
+        Attaches many listeners at once.
+
+        Takes iterable of (event name, listener[, priority]) tuples
+        (the same as returned by Listener.mapping). Listeners are grouped
+        by event name and each list is sorted once.
+        """
+        grouped = {}
+        counter = self.counter
+        for t in mappings:
+            priority = t[2] if len(t) > 2 else None
+            if weak:
+                item = self._prepare(t[1], priority, None,
+                        _Detacher(self, '_detach', t[0]))
+            else:
+                item = (self.priority if priority is None else priority,
+                        next(counter), t[1])
+            try:
+                grouped[t[0]].append(item)
+            except KeyError:
+                grouped[t[0]] = [item]
+        with self._lock:
+            for name, items in grouped.items():
+                listeners = list(self._listeners.get(name, ()))
+                listeners.extend(items)
+                listeners.sort()
+                keys = self._keys.setdefault(name, {})
+                for item in items:
+                    keys.setdefault(_key(item[2]), []).append(item)
+                self._listeners[name] = listeners
+                self._invalidate(name)
+            self._bury()
+
+    def attach_lazy(self, name, target, priority=None):
+        """
+        Attaches listener given as "module:attribute" string
+        (e.g. "myapp.listeners:on_order" or "myapp.listeners:cache.handle").
+        The module is imported when listeners of the event are needed
+        for the first time (e.g. on first 'notify'), see 'lazy'.
+        Listener can be detached using the same string.
+        """
+        self.attach(name, lazy(target), priority)
+
+    def detach(self, name, listener):
+        """
+        Detaches listener (attached to given event name by 'attach')
+        from dispatcher. Does nothing when listener is not attached.
+        """
+        with self._lock:
+            self._detach(name, listener)
+            self._bury()
+
+    def _detach(self, name, listener):
+        """
+        Detaches listener. Requires lock to be held
+        """
+        try:
+            items = self._keys[name].pop(_key(listener))
+        except KeyError:
+            return
+        listeners = list(self._listeners[name])
+        for item in items:
+            del listeners[bisect.bisect_left(listeners, item[:2])]
+        if listeners:
+            self._listeners[name] = listeners
+        else:
+            del self._listeners[name]
+            del self._keys[name]
+        self._invalidate(name)
+
+    def attach_pattern(self, pattern, listener, priority=None, executor=None,
+            weak=False, timeout=None, cache=None, when=None, where=None):
+        """
+        Attaches new listener to all events which names match given pattern.
 
-    def attach(self, name, listener, priority=None):
+        Event names are split into dot separated segments. In pattern
+        '*' matches exactly one segment and '#' matches zero or more
+        segments, e.g. 'order.*', 'order.#', '*.created'.
+        Listeners attached by pattern are merged with the other listeners
+        according to priority; merged list is compiled once per event name.
+        See 'attach' for description of the other arguments.
         """
-        Attaches new listener to dispatcher
+        item = self._prepare(listener, priority, executor,
+                weak and _Detacher(self, '_detach_pattern', pattern),
+                timeout, cache, when, where)
+        with self._lock:
+            patterns = self._patterns.copy()
+            patterns.add(pattern, item)
+            self._patterns = patterns
+            self._invalidate_all()
+            self._bury()
+
+    def detach_pattern(self, pattern, listener):
+        """
+        Detaches listener attached to given pattern by 'attach_pattern'
+        """
+        with self._lock:
+            self._detach_pattern(pattern, listener)
+            self._bury()
+
+    def _detach_pattern(self, pattern, listener):
+        """
+        Detaches listener attached to pattern. Requires lock to be held
+        """
+        patterns = self._patterns.copy()
+        if patterns.remove(pattern, listener):
+            self._patterns = patterns
+            self._invalidate_all()
+
+    def _prepare(self, listener, priority=None, executor=None, detach=None,
+            timeout=None, cache=None, when=None, where=None):
+        """
+        Prepares internal listener structure.
+        When 'detach' callback is given, listener is held by weak reference
+        and the callback is called once it dies.
         """
         if priority is None:
             priority = self.priority
-        if name not in self._listeners:
-            self._listeners[name] = []
-        heapq.heappush(self._listeners[name], self._prepare(listener, priority))
-        self._dirty = True
+        if detach:
+            listener = _WeakListener(listener, detach)
+        if executor is not None:
+            listener = executed(listener, executor)
+        if timeout is not None:
+            listener = timed(listener, timeout, scheduler=self.scheduler)
+        if cache is not None:
+            listener = cached(listener, None if cache is True else cache)
+        if when is not None or where:
+            listener = _Filtered(listener, when, where)
+        return (priority, next(self.counter), listener)
 
-    def _prepare(self, listener, priority=0):
+    def _died(self, detach, name, listener):
         """
-        Prepares internal listener structure
+        Called when target of weak listener dies.
+
+        Garbage collection may happen anywhere (also while the lock is
+        held), so dead listeners are queued and detached by whoever
+        holds the lock next.
         """
-        return (priority, next(self.counter), listener)
+        self._graveyard.append((detach, name, listener))
+        if self._lock.acquire(False):
+            try:
+                self._bury()
+            finally:
+                self._lock.release()
+
+    def _bury(self):
+        """
+        Detaches queued dead listeners. Requires lock to be held
+        """
+        while self._graveyard:
+            detach, name, listener = self._graveyard.popleft()
+            detach(name, listener)
+
+    def _invalidate(self, name):
+        """
+        Drops compiled list of listeners for given event name.
+        Requires lock to be held
+        """
+        self._generation += 1
+        self._snapshots.pop(name, None)
+        self._bands.pop(name, None)
+
+    def _invalidate_all(self):
+        """
+        Drops compiled lists of listeners for all event names.
+        Requires lock to be held
+        """
+        self._generation += 1
+        self._clear_compiled()
+
+    def _clear_compiled(self):
+        """
+        Drops compiled lists of listeners for all event names
+        """
+        self._snapshots.clear()
+        self._bands.clear()
+
+    def _snapshot(self, name):
+        """
+        Returns compiled tuple of listeners attached to given event name,
+        ordered by priority. Tuple is reused until listeners change.
+        """
+        try:
+            return self._snapshots[name]
+        except KeyError:
+            if name not in self._listeners and not self._patterns:
+                return ()
+            generation = self._generation
+            return self._store(self._snapshots, name, self._compile(name),
+                    generation, name in self._listeners)
+
+    def _store(self, cache, key, value, generation, listed=True):
+        """
+        Stores compiled value in given cache and returns it.
+
+        Writers bump generation before dropping compiled values, so value
+        compiled from listeners changed in the meantime ('generation'
+        is no longer current) is dropped again after it has been stored.
+
+        Values of event names without own listeners ('listed' is False)
+        are counted; once there are more of them than 'pattern_cache_size'
+        (or number of event names with listeners) all compiled values are
+        dropped, so notifying many distinct event names matched only
+        by patterns does not grow memory without bound
+        """
+        cache[key] = value
+        if generation != self._generation:
+            cache.pop(key, None)
+        elif not listed:
+            self._unlisted += 1
+            if self._unlisted > max(self.pattern_cache_size,
+                    len(self._listeners)):
+                self._unlisted = 0
+                self._clear_compiled()
+        return value
+
+    def _compile(self, name):
+        """
+        Builds tuple of (listener, synchronous function) pairs
+        for listeners attached to given event name
+        (_Selection when some of them are filtered)
+        """
+        return self._compile_items(self._sorted(name))
+
+    def _compile_items(self, items):
+        """
+        Builds compiled entries of given (priority, counter, listener)
+        items (see '_compile')
+        """
+        entries = tuple(self._entry(l[2]) for l in items)
+        filters = [l[2] if isinstance(l[2], _Filtered) else None \
+                for l in items]
+        if not any(filters):
+            return entries
+        return _Selection(entries, [e if f is None else \
+                self._entry(f.listener) for (e, f) in zip(entries, filters)],
+                filters, [l[0] for l in items])
+
+    def _select(self, name, event):
+        """
+        Returns compiled entries of listeners attached to given event name
+        which accept given event
+        """
+        snapshot = self._snapshot(name)
+        if type(snapshot) is tuple:
+            return snapshot
+        return snapshot.select(event)
+
+    def _select_bands(self, name, event):
+        """
+        Returns compiled entries of listeners attached to given event name
+        which accept given event, grouped by priority
+        """
+        snapshot = self._snapshot(name)
+        if type(snapshot) is tuple:
+            return self._priority_bands(name)
+        return snapshot.bands(event)
+
+    def _select_batches(self, snapshot, events):
+        """
+        Returns (entry, events) pairs: compiled entries of given snapshot
+        ordered by priority with events (of given ones) they accept
+        """
+        if type(snapshot) is tuple:
+            return [(entry, events) for entry in snapshot]
+        return snapshot.batches(events)
+
+    def _sorted(self, name):
+        """
+        Returns (priority, counter, listener) items attached to given
+        event name (directly or by pattern), ordered by priority
+        """
+        items = self._listeners.get(name, ())
+        patterns = self._patterns
+        if not patterns:
+            return items
+        matches = patterns.match(name)
+        if not matches:
+            return items
+        return sorted(itertools.chain(items, matches))
+
+    def _priority_bands(self, name):
+        """
+        Returns compiled listener entries grouped by priority
+        (tuple of tuples). Cached until listeners change.
+        """
+        try:
+            return self._bands[name]
+        except KeyError:
+            generation = self._generation
+            items = self._sorted(name)
+            if not items:
+                return ()
+            return self._store(self._bands, name, self._compile_bands(items),
+                    generation, name in self._listeners)
+
+    def _compile_bands(self, items):
+        """
+        Builds compiled entries of given (priority, counter, listener)
+        items grouped by priority (see '_priority_bands')
+        """
+        return tuple(tuple(self._entry(i[2]) for i in band) \
+                for (p, band) in itertools.groupby(items, lambda i: i[0]))
+
+    def _entry(self, listener):
+        """
+        Prepares compiled listener entry: (listener, synchronous function).
+        Synchronous listeners can be called directly, without deferred.
+        Subclasses may append own fields to the entry.
+        """
+        if isinstance(listener, _LazyListener):
+            listener = listener.resolve()
+        return (listener, _marker(listener, '__synchronous__'))
+
+    def freeze(self):
+        """
+        Returns FrozenDispatcher with listeners attached to this dispatcher.
+        Later changes of this dispatcher do not affect returned one.
+        """
+        return FrozenDispatcher(self)
+
+    def _copy_registry(self, other):
+        """
+        Copies listeners attached to other dispatcher
+        """
+        with other._lock:
+            self._listeners = dict(other._listeners)
+            self._patterns = other._patterns
+        self._keys = {}
+        for name, items in self._listeners.items():
+            keys = self._keys[name] = {}
+            for item in items:
+                keys.setdefault(_key(item[2]), []).append(item)
+                _watch(item[2], self, '_detach', name)
+        for pattern, item in self._patterns.walk():
+            _watch(item[2], self, '_detach_pattern', pattern)
+        self.priority = other.priority
+        self.scheduler = other.scheduler
+        self.pattern_cache_size = other.pattern_cache_size
+        self.counter = itertools.count(next(other.counter))
+        with self._lock:
+            self._invalidate_all()
 
     def __contains__(self, name):
         """
         Returns information whether there are any listeners
         attached to given event name
         """
-        return name in self._listeners and len(self._listeners[name])>0
+        return len(self._snapshot(name)) > 0
 
     def get_listeners(self, name):
         """
         Fetches list of listeners attached to given event.
         Returns iterator
         """
-        # sort list in order to iterate over elements (heapq changes order)
-        if self._dirty:
-            self._dirty = False
-            self._listeners[name].sort()
-        if name not in self._listeners:
-            return iter([])
-        return (l[2] for l in self._listeners[name])
+        return (l[0] for l in self._snapshot(name))
 
-    def notify(self, name, event):
+    def notify(self, name, event, timeout=None):
         """
-        Notifies each listener about new event
+        Notifies each listener about new event.
+        When 'timeout' is given and listeners do not finish within
+        'timeout' seconds, propagation of the event is stopped
+        and promise is rejected with ListenerTimeout
         """
         event.start_propagation().name = name
+        if timeout is not None:
+            return _deadline(partial(self._notify, name, event), event,
+                    timeout, self.scheduler)
+        return self._notify(name, event)
+
+    def _notify(self, name, event):
+        """
+        Notifies each listener about new event. Returns promise
+        """
+        if self.profiler is not None:
+            return Deferred(partial(self._profiled_notify, name,
+                    iter(self._select(name, event)), event)).promise()
         # asynchronous call
-        return Deferred(partial(self._async_notify, self.get_listeners(name),
-                event)).promise()
+        return Deferred(partial(self._async_notify,
+                iter(self._select(name, event)), event)).promise()
+
+    def enable_profiling(self, profiler=None):
+        """
+        Starts recording statistics of 'notify' calls.
+        Returns used Profiler instance
+        """
+        self.profiler = profiler or Profiler()
+        return self.profiler
+
+    def disable_profiling(self):
+        """
+        Stops recording statistics. Returns used Profiler instance
+        """
+        profiler, self.profiler = self.profiler, None
+        return profiler
+
+    def _profiled_notify(self, name, listeners, event, deferred,
+            pending=None):
+        """
+        Works the same way as '_async_notify' but records statistics
+        of the event and each listener call in the profiler.
+        'pending' is (listener statistics, start time) of listener
+        the loop has been suspended for
+        """
+        profiler = self.profiler or Profiler()
+        clock = profiler.clock
+        stats = profiler.event(name)
+        if pending is None:
+            stats.notifications += 1
+        else:
+            pending[0].record(clock() - pending[1], False)
+
+        def fail(listener_stats, *args, **kwargs):
+            listener_stats.failures += 1
+            stats.failures += 1
+            deferred.reject(*args, **kwargs)
+
+        for entry in listeners:
+            if event.is_propagation_stopped():
+                stats.stopped += 1
+                break
+            listener_stats = profiler.listener(name, entry[0])
+            start = clock()
+            if entry[1] is not None:
+                try:
+                    entry[1](event)
+                except Exception:
+                    fail(listener_stats)
+                    raise
+                listener_stats.record(clock() - start, True)
+                continue
+            step = _Step()
+            Deferred(partial(entry[0], event)).done(step.done)\
+                    .fail(partial(fail, listener_stats))
+            if not step.finished() and step.suspend(partial(
+                    self._profiled_notify, name, listeners, event, deferred,
+                    (listener_stats, start))):
+                return
+            listener_stats.record(clock() - start, True)
+        deferred.resolve(event)
+
+    def notify_collect(self, name, event):
+        """
+        Notifies each listener about new event.
+        Returns promise resolved with list of values returned (resolved)
+        by listeners
+        """
+        event.start_propagation().name = name
+        return Deferred(partial(self._reduce_notify,
+                iter(self._select(name, event)), event, _append, [])).promise()
+
+    def notify_until(self, name, event):
+        """
+        Notifies listeners about new event until one of them returns
+        (resolves with) value other than None. Such listener marks the
+        event as processed and remaining listeners are not called.
+        Returns promise resolved with the value (or None)
+        """
+        event.start_propagation().name = name
+        return Deferred(partial(self._reduce_notify,
+                iter(self._select(name, event)), event, None, None)).promise()
+
+    def notify_reduce(self, name, event, function, initial=None):
+        """
+        Notifies each listener about new event.
+        Returns promise resolved with result of folding values returned
+        (resolved) by listeners: function(function(initial, v1), v2)...
+        """
+        event.start_propagation().name = name
+        return Deferred(partial(self._reduce_notify,
+                iter(self._select(name, event)), event, function, initial))\
+                .promise()
+
+    def _reduce_notify(self, listeners, event, function, result, deferred,
+            step=None):
+        """
+        Notifies listeners like '_async_notify' and folds their values
+        with given function; no function means stopping at the first
+        value other than None
+        """
+        if step is not None:
+            if function is None:
+                if step.value is not None:
+                    event.mark_processed()
+                    deferred.resolve(step.value)
+                    return
+            else:
+                result = function(result, step.value)
+        for entry in listeners:
+            if event.is_propagation_stopped():
+                break
+            if entry[1] is not None:
+                value = entry[1](event)
+            else:
+                step = _ValueStep()
+                Deferred(partial(entry[0], event)).done(step.done)\
+                        .fail(deferred.reject)
+                if not step.finished() and step.suspend(partial(
+                        self._reduce_notify, listeners, event, function,
+                        result, deferred, step)):
+                    return
+                value = step.value
+            if function is not None:
+                result = function(result, value)
+            elif value is not None:
+                event.mark_processed()
+                deferred.resolve(value)
+                return
+        deferred.resolve(result)
+
+    def notify_parallel(self, name, event, limit=None):
+        """
+        Notifies listeners about new event concurrently.
+
+        Listeners with the same priority are called without waiting
+        for each other (at most 'limit' of them at once); next priority
+        band is notified once the previous one finishes. Propagation is
+        checked between bands. Promise is rejected with ListenerErrors
+        when any listener in a band fails.
+        """
+        event.start_propagation().name = name
+        return Deferred(partial(self._parallel_notify,
+                iter(self._select_bands(name, event)), event, limit))\
+                .promise()
+
+    def _parallel_notify(self, bands, event, limit, deferred, previous=None):
+        """
+        Notifies priority bands one after another
+        """
+        if previous is not None and previous.errors:
+            deferred.reject(ListenerErrors(previous.errors))
+            return
+        for band in bands:
+            if event.is_propagation_stopped():
+                break
+            step = _Step()
+            fan = _FanOut(band, event, limit, step.done)
+            fan.start()
+            if not step.finished() and step.suspend(partial(
+                    self._parallel_notify, bands, event, limit, deferred,
+                    fan)):
+                return
+            if fan.errors:
+                deferred.reject(ListenerErrors(fan.errors))
+                return
+        deferred.resolve(event)
+
+    def notify_many(self, name, events):
+        """
+        Notifies listeners about each of given events.
+
+        Listeners are resolved once for the whole batch. Listeners marked
+        with 'batched' decorator are called once with list of events
+        (whose propagation has not been stopped and which they accept),
+        the others are called for each event. Returns promise resolved
+        with list of events.
+        """
+        events = list(events)
+        for event in events:
+            event.start_propagation().name = name
+        return Deferred(partial(self._drive,
+                self._batch_calls(self._select_batches(self._snapshot(name),
+                    events)), events)).promise()
+
+    def _batch_calls(self, batches):
+        """
+        Generates (function, argument, is synchronous) calls notifying
+        listeners about events of given (entry, events) pairs
+        """
+        for entry, events in batches:
+            batch = _marker(entry[0], '__batched__')
+            if batch is not None:
+                live = [e for e in events if not e.is_propagation_stopped()]
+                if not live:
+                    continue
+                sync = _marker(batch, '__synchronous__')
+                yield (sync or batch, live, sync is not None)
+                continue
+            for event in events:
+                if not event.is_propagation_stopped():
+                    yield (entry[1] or entry[0], event, entry[1] is not None)
+
+    def _drive(self, calls, result, deferred):
+        """
+        Makes given (function, argument, is synchronous) calls
+        one after another and resolves deferred with given result.
+        Works the same way as '_async_notify'.
+        """
+        for function, argument, sync in calls:
+            if sync:
+                function(argument)
+                continue
+            step = _Step()
+            Deferred(partial(function, argument)).done(step.done)\
+                    .fail(deferred.reject)
+            if not step.finished() and step.suspend(partial(self._drive,
+                    calls, result, deferred)):
+                return
+        deferred.resolve(result)
+
+    def notify_stream(self, name, events, size=1000):
+        """
+        Notifies listeners about events taken from given iterable
+        (e.g. generator) in batches of given size (see 'notify_many').
+        Next batch is taken once the previous one has been handled.
+        Returns promise resolved with number of notified events.
+        """
+        return Deferred(partial(self._stream_notify, name, iter(events),
+                size, 0)).promise()
+
+    def _stream_notify(self, name, events, size, count, deferred):
+        """
+        Notifies listeners about consecutive batches of events
+        """
+        while True:
+            batch = list(itertools.islice(events, size))
+            if not batch:
+                deferred.resolve(count)
+                return
+            count += len(batch)
+            step = _Step()
+            self.notify_many(name, batch).done(step.done)\
+                    .fail(deferred.reject)
+            if not step.finished() and step.suspend(partial(
+                    self._stream_notify, name, events, size, count,
+                    deferred)):
+                return
+
+    def notify_sync(self, name, event):
+        """
+        Notifies each listener about new event and returns the event.
+        Works only when all listeners attached to given event name
+        (accepting the event) are synchronous.
+        """
+        listeners = self._select(name, event)
+        for entry in listeners:
+            if entry[1] is None:
+                raise TypeError('Listener %r attached to %r is not ' \
+                        'synchronous' % (entry[0], name))
+        event.start_propagation().name = name
+        for entry in listeners:
+            if event.is_propagation_stopped():
+                break
+            entry[1](event)
+        return event
 
     def _async_notify(self, listeners, event, deferred):
         """
-        Notifies listeners about new event until any of then returns True
-        in asynchronous manner
+        Notifies listeners about new event until propagation is stopped.
+
+        Listeners are called in a loop; the loop is suspended only when
+        a listener does not resolve its deferred immediately and is resumed
+        from within its 'done' callback, so the stack does not grow with
+        the number of listeners
         """
-        try:
+        for entry in listeners:
             if event.is_propagation_stopped():
-                raise StopIteration()
-            Deferred(partial(next(listeners), event))\
-                    .done(partial(self._async_notify, listeners, event,
-                        deferred=deferred))\
-                    .fail(deferred.fail)
-        except StopIteration:
-            deferred.resolve(event)
+                break
+            if entry[1] is not None:
+                entry[1](event)
+                continue
+            step = _Step()
+            Deferred(partial(entry[0], event)).done(step.done)\
+                    .fail(deferred.reject)
+            if not step.finished() and step.suspend(partial(
+                    self._async_notify, listeners, event, deferred)):
+                return
+        deferred.resolve(event)
 
 
-class Manager(object):
+class FrozenDispatcher(Dispatcher):
     """
-    Class that simplifies attaching listeners to dispatcher
+    Read-only dispatcher compiled from listeners of other dispatcher.
+
+    Listeners of all known event names are compiled up front and
+    consecutive synchronous listeners are fused together into generated
+    functions calling them one after another (see '_fuse'), so 'notify'
+    does only a dictionary lookup and calls the fused functions;
+    listeners which are not synchronous are called as in Dispatcher.
+    Events overriding propagation methods of Event are notified the same
+    way as by Dispatcher. Frozen dispatcher
+    can be shared between threads without locking. Attempts to attach
+    or detach listeners raise FrozenDispatcherError; use 'thaw' to get
+    mutable copy.
+
+    Example:
+
+    dispatcher = Dispatcher()
+    Manager(dispatcher).register_many(listeners)
+    dispatcher = dispatcher.freeze()
     """
 
     def __init__(self, dispatcher):
         """
-        Class initialization
+        Initializes class instance
         """
-        self.dispatcher = dispatcher
+        super(FrozenDispatcher, self).__init__()
+        self._chains = {}
+        self._copy_registry(dispatcher)
+        for name in self._listeners:
+            self._chain(name)
+
+    def _frozen(self, *args, **kwargs):
+        raise FrozenDispatcherError('Frozen dispatcher can not be changed')
+    attach = attach_many = detach = attach_pattern = detach_pattern = _frozen
+
+    def freeze(self):
+        """
+        Returns self - dispatcher is already frozen
+        """
+        return self
+
+    def thaw(self):
+        """
+        Returns new mutable Dispatcher with the same listeners
+        """
+        dispatcher = Dispatcher()
+        dispatcher._copy_registry(self)
+        dispatcher.profiler = self.profiler
+        return dispatcher
 
-    def register(self, listener):
+    def _chain(self, name):
         """
-        Registers event listeners to given dispatcher
+        Returns compiled chain of listeners attached to given event name:
+        tuple of (fused functions, listener) stages. Fused functions
+        (see '_fuse') are called before the listener; listener of the last
+        stage is None.
         """
-        # try to set dispatcher
         try:
-            listener.set_dispatcher(self.dispatcher)
-        except AttributeError:
-            pass
+            return self._chains[name]
+        except KeyError:
+            if name not in self._listeners and not self._patterns:
+                return ()
+            # chains are dropped together with compiled lists,
+            # which are counted by '_snapshot'
+            snapshot = self._snapshot(name)
+            if type(snapshot) is not tuple:
+                # filtered listeners are selected for each event
+                return self._store(self._chains, name, None,
+                        self._generation)
+            stages = []
+            syncs = []
+            for entry in snapshot:
+                if entry[1] is not None:
+                    syncs.append(entry[1])
+                else:
+                    stages.append((_fuse(syncs), entry[0]))
+                    syncs = []
+            if syncs:
+                stages.append((_fuse(syncs), None))
+            return self._store(self._chains, name, tuple(stages),
+                    self._generation)
 
-        for t in listener.mapping():
-            try:
-                priority = t[2]
-            except IndexError:
-                priority = None
-            self.dispatcher.attach(t[0], t[1], priority)
+    def _invalidate(self, name):
+        """
+        Drops compiled list and chain of listeners for given event name
+        (weak listeners are detached when they die).
+        Requires lock to be held
+        """
+        super(FrozenDispatcher, self)._invalidate(name)
+        self._chains.pop(name, None)
 
+    def _clear_compiled(self):
+        """
+        Drops compiled lists and chains of listeners
+        """
+        super(FrozenDispatcher, self)._clear_compiled()
+        self._chains.clear()
 
-class Listener(object):
-    """
-    Class that defines simple interface for classes to work with Dispatcher
-    """
+    def notify(self, name, event, timeout=None):
+        """
+        Notifies each listener about new event
+        """
+        if self.profiler is not None or timeout is not None or \
+                type(event).is_propagation_stopped != \
+                Event.is_propagation_stopped:
+            return super(FrozenDispatcher, self).notify(name, event, timeout)
+        chain = self._chain(name)
+        if chain is None:
+            return super(FrozenDispatcher, self).notify(name, event)
+        event.start_propagation().name = name
+        return Deferred(partial(self._chain_notify, iter(chain), event))\
+                .promise()
 
-    def mapping(self):
+    def _chain_notify(self, stages, event, deferred):
         """
-        Returns list of listeners to be attached to dispatcher.
-        [(event name, listener, priority), (event name, listener, priority)]
+        Works the same way as '_async_notify' for compiled chain
         """
-        raise NotImplementedError('Return list of tuples with ' +\
-            '(event, callback priority) mappings')
+        for fused, listener in stages:
+            for function in fused:
+                if not function(event):
+                    deferred.resolve(event)
+                    return
+            if listener is None:
+                break
+            step = _Step()
+            Deferred(partial(listener, event)).done(step.done)\
+                    .fail(deferred.reject)
+            if not step.finished() and step.suspend(partial(
+                    self._chain_notify, stages, event, deferred)):
+                return
+        deferred.resolve(event)
 
 
-class DispatcherAware(object):
+# maximum number of listeners fused into single function
+_FUSED = 100
+
+
+def _fuse(functions):
     """
-    Mixin for listeners that want to have dispatcher reference be given
+    Compiles run of synchronous listeners into tuple of generated
+    functions, each calling up to _FUSED listeners one after another
+    while propagation of the event is not stopped (checked before each
+    call by reading the flag directly). Functions return information
+    whether propagation goes on. Empty run gives single function only
+    checking propagation.
     """
+    fused = []
+    for start in range(0, max(len(functions), 1), _FUSED):
+        namespace = {}
+        lines = ['def fused(event):']
+        for i, function in enumerate(functions[start:start + _FUSED]):
+            namespace['f%d' % i] = function
+            lines.append('    if not event._propagate:')
+            lines.append('        return False')
+            lines.append('    f%d(event)' % i)
+        lines.append('    return event._propagate')
+        exec('\n'.join(lines), namespace)
+        fused.append(namespace['fused'])
+    return tuple(fused)
 
-    def set_dispatcher(self, dispatcher):
+
+class ShardedDispatcher(Dispatcher):
+    """
+    Dispatcher with per-shard (e.g. per-tenant) listener registries.
+
+    Listeners attached to the dispatcher itself form the global tier,
+    notified about all events. Listeners attached to a shard (see 'shard')
+    are notified only about events which 'route' function maps to the
+    shard key. Both tiers are merged in priority order (and order of
+    attaching within the same priority); merged lists are compiled once
+    per shard and event name, so cost of notification does not depend
+    on the number of listeners attached to other shards.
+
+    Example:
+
+    d = ShardedDispatcher(lambda event: event.parameters.get('tenant'))
+    d.attach('order.created', audit)
+    d.shard('acme').attach('order.created', send_invoice)
+    d.notify('order.created', Event(self, {'tenant': 'acme'}))
+    """
+
+    def __init__(self, route):
         """
-        Dispatcher setter
+        Initializes class instance.
+        'route' returns shard key of given event (or None)
         """
-        self.dispatcher = dispatcher
-        return self
+        super(ShardedDispatcher, self).__init__()
+        self.route = route
+        self._shards = {}
+        self._merged = {}
+        self._merged_bands = {}
+
+    def shard(self, key):
+        """
+        Returns registry of listeners of given shard (created on demand).
+        Use its 'attach', 'detach', etc. methods to manage listeners
+        of the shard; notify events through the sharded dispatcher
+        """
+        try:
+            return self._shards[key]
+        except KeyError:
+            with self._lock:
+                shard = self._shards.get(key)
+                if shard is None:
+                    shard = self._shards[key] = _Shard(self, key)
+            return shard
+
+    def shards(self):
+        """
+        Returns keys of existing shards
+        """
+        return list(self._shards)
+
+    def drop_shard(self, key):
+        """
+        Removes shard with all its listeners
+        """
+        with self._lock:
+            if self._shards.pop(key, None) is not None:
+                self._forget(key)
+
+    def freeze(self):
+        """
+        Sharded dispatchers can not be frozen
+        """
+        raise TypeError('Sharded dispatcher can not be frozen')
+
+    def _invalidate(self, name):
+        """
+        Drops compiled lists of listeners (global and merged)
+        for given event name. Requires lock to be held
+        """
+        super(ShardedDispatcher, self)._invalidate(name)
+        self._merged.pop(name, None)
+        self._merged_bands.pop(name, None)
+
+    def _clear_compiled(self):
+        """
+        Drops all compiled lists of listeners (global and merged)
+        """
+        super(ShardedDispatcher, self)._clear_compiled()
+        self._merged.clear()
+        self._merged_bands.clear()
+
+    def _forget(self, key, name=None):
+        """
+        Drops merged lists of listeners of given shard (and event name).
+        Requires lock to be held
+        """
+        self._generation += 1
+        for cache in (self._merged, self._merged_bands):
+            merged = cache if name is None else {name: cache.get(name, {})}
+            for snapshots in merged.values():
+                snapshots.pop(key, None)
+
+    def _route(self, event):
+        """
+        Returns shard given event is routed to or None
+        """
+        key = self.route(event)
+        if key is None:
+            return None
+        return self._shards.get(key)
+
+    def _merged_items(self, shard, name):
+        """
+        Returns (priority, counter, listener) items of both tiers
+        ordered by priority
+        """
+        shared = self._sorted(name)
+        own = shard._sorted(name)
+        if not own:
+            return shared
+        if not shared:
+            return own
+        return list(heapq.merge(shared, own))
+
+    def _tier(self, shard, name):
+        """
+        Returns compiled entries of listeners of given shard
+        (merged with global ones) attached to given event name
+        """
+        if shard is None:
+            return self._snapshot(name)
+        try:
+            return self._merged[name][shard.key]
+        except KeyError:
+            generation = self._generation
+            if shard._sorted(name):
+                snapshot = self._compile_items(self._merged_items(shard,
+                    name))
+            else:
+                # shard without own listeners shares the global list
+                snapshot = self._snapshot(name)
+            return self._store(self._merged.setdefault(name, {}), shard.key,
+                    snapshot, generation,
+                    name in self._listeners or name in shard._listeners)
+
+    def _tier_bands(self, shard, name):
+        """
+        Returns compiled entries of listeners of given shard (merged with
+        global ones) attached to given event name, grouped by priority
+        """
+        try:
+            return self._merged_bands[name][shard.key]
+        except KeyError:
+            generation = self._generation
+            if shard._sorted(name):
+                bands = self._compile_bands(self._merged_items(shard, name))
+            else:
+                bands = self._priority_bands(name)
+            return self._store(self._merged_bands.setdefault(name, {}),
+                    shard.key, bands, generation,
+                    name in self._listeners or name in shard._listeners)
+
+    def _select(self, name, event):
+        """
+        Returns compiled entries of listeners of the shard given event
+        is routed to (merged with global ones) which accept the event
+        """
+        snapshot = self._tier(self._route(event), name)
+        if type(snapshot) is tuple:
+            return snapshot
+        return snapshot.select(event)
+
+    def _select_bands(self, name, event):
+        """
+        Returns compiled entries of listeners of the shard given event
+        is routed to (merged with global ones) which accept the event,
+        grouped by priority
+        """
+        shard = self._route(event)
+        if shard is None:
+            return super(ShardedDispatcher, self)._select_bands(name, event)
+        snapshot = self._tier(shard, name)
+        if type(snapshot) is tuple:
+            return self._tier_bands(shard, name)
+        return snapshot.bands(event)
+
+    def notify_many(self, name, events):
+        """
+        Notifies listeners about each of given events
+        (see Dispatcher.notify_many). Events routed to the same shard
+        are notified together, shard after shard.
+        """
+        events = list(events)
+        groups = collections.OrderedDict()
+        for event in events:
+            event.start_propagation().name = name
+            groups.setdefault(self._route(event), []).append(event)
+        calls = itertools.chain.from_iterable(self._batch_calls(
+                self._select_batches(self._tier(shard, name), group)) \
+                for (shard, group) in groups.items())
+        return Deferred(partial(self._drive, calls, events)).promise()
+
+
+class _Shard(Dispatcher):
+    """
+    Listener registry of single shard of ShardedDispatcher
+    """
+
+    def __init__(self, dispatcher, key):
+        """
+        Initializes class instance
+        """
+        super(_Shard, self).__init__()
+        self.key = key
+        self._dispatcher = dispatcher
+        # shares lock and counter, so both tiers are ordered consistently
+        self._lock = dispatcher._lock
+        self.counter = dispatcher.counter
+        self.priority = dispatcher.priority
+        self.scheduler = dispatcher.scheduler
+
+    def _invalidate(self, name):
+        """
+        Drops compiled lists of listeners for given event name.
+        Requires lock to be held
+        """
+        super(_Shard, self)._invalidate(name)
+        self._dispatcher._forget(self.key, name)
+
+    def _invalidate_all(self):
+        """
+        Drops compiled lists of listeners for all event names.
+        Requires lock to be held
+        """
+        super(_Shard, self)._invalidate_all()
+        self._dispatcher._forget(self.key)
+
+    def freeze(self):
+        """
+        Shards can not be frozen
+        """
+        raise TypeError('Shard can not be frozen')
+
+
+class _Step(object):
+    """
+    Tracks completion of single listener call made by dispatcher loop.
+
+    When listener resolves its deferred before the loop asks for it,
+    the loop simply carries on. Otherwise the loop is suspended and
+    'resume' callback is called once the deferred is resolved.
+    Deferred may be resolved from other thread (e.g. by executor), so
+    finishing listener and suspending loop race for the step's token
+    (see '_take'); only the loser resumes the loop.
+    """
+    __slots__ = ('_resume', '_token')
+
+    def __init__(self):
+        self._resume = []
+        self._token = [True]
+
+    def done(self, *args, **kwargs):
+        """
+        Marks listener as finished and resumes suspended loop
+        """
+        if _take(self._token):
+            return
+        resume = _take(self._resume)
+        if resume:
+            resume()
+
+    def finished(self):
+        """
+        Returns information whether listener has already finished.
+        Valid only until the loop is suspended
+        """
+        return not self._token
+
+    def suspend(self, resume):
+        """
+        Suspends loop. Given callback will be called when listener finishes.
+        Returns False (and does not suspend) when listener has finished
+        in the meantime, so the loop should carry on
+        """
+        # callback has to be in place before the token is taken
+        self._resume.append(resume)
+        if _take(self._token):
+            return True
+        _take(self._resume)
+        return False
+
+
+class _ValueStep(_Step):
+    """
+    Step that keeps value listener resolved its deferred with
+    """
+    __slots__ = ('value',)
+
+    def done(self, *args, **kwargs):
+        """
+        Stores value and marks listener as finished
+        """
+        self.value = args[0] if args else None
+        super(_ValueStep, self).done()
+
+
+def _append(values, value):
+    """
+    Appends value to the list and returns the list
+    """
+    values.append(value)
+    return values
+
+
+class _FanOut(object):
+    """
+    Calls given listeners concurrently, at most 'limit' at once.
+    Given callback is called when all of them finish.
+
+    Listeners may finish in other threads, so counters are changed under
+    a lock. Only one thread calls listeners at a time; listeners finishing
+    meanwhile just free their slots for it.
+    """
+
+    def __init__(self, entries, event, limit, callback):
+        self._entries = iter(entries)
+        self._event = event
+        self._limit = limit or len(entries)
+        self._callback = callback
+        self._running = 0
+        self._filling = False
+        self._exhausted = False
+        self._lock = threading.Lock()
+        self.errors = []
+
+    def start(self):
+        """
+        Starts calling listeners
+        """
+        self._fill()
+
+    def _fill(self):
+        with self._lock:
+            if self._filling:
+                return
+            self._filling = True
+        while True:
+            with self._lock:
+                if self._exhausted or self._running >= self._limit:
+                    self._filling = False
+                    finished = self._exhausted and not self._running
+                    break
+                # the slot is taken before the listener is known
+                self._running += 1
+            try:
+                entry = next(self._entries)
+            except StopIteration:
+                with self._lock:
+                    self._running -= 1
+                    self._exhausted = True
+                continue
+            if entry[1] is not None:
+                try:
+                    entry[1](self._event)
+                except Exception as e:
+                    self.errors.append(e)
+                with self._lock:
+                    self._running -= 1
+                continue
+            Deferred(partial(entry[0], self._event)).done(self._done)\
+                    .fail(self._fail)
+        if finished:
+            self._callback()
+
+    def _done(self, *args, **kwargs):
+        with self._lock:
+            self._running -= 1
+        self._fill()
+
+    def _fail(self, *args, **kwargs):
+        self.errors.append(_error(args))
+        self._done()
+
+
+def _key(listener):
+    """
+    Returns key identifying listener in dictionaries.
+    Unhashable listeners are identified by id
+    """
+    try:
+        hash(listener)
+    except TypeError:
+        return id(listener)
+    return listener
+
+
+class _Selection(tuple):
+    """
+    Compiled entries of event name with filtered listeners.
+
+    Iterating yields entries of all listeners (filtered listeners check
+    their filters themselves); 'select' returns entries of listeners
+    accepting given event without their filtering wrappers. Listeners
+    with 'where' filter are indexed by value of their first parameter.
+    """
+
+    def __new__(cls, entries, plain, filters, priorities):
+        return super(_Selection, cls).__new__(cls, entries)
+
+    def __init__(self, entries, plain, filters, priorities):
+        self._plain = plain
+        self._filters = filters
+        self._priorities = priorities
+        self._always = []
+        self._checked = []
+        self._index = {}
+        self._residual = set()
+        for position, f in enumerate(filters):
+            if f is None:
+                self._always.append(position)
+            elif not f.where or not f.index(self._index, position):
+                self._checked.append(position)
+            elif f.when is not None or len(f.where) > 1:
+                self._residual.add(position)
+        self._always_entries = tuple(plain[p] for p in self._always)
+
+    def select(self, event):
+        """
+        Returns entries of listeners accepting given event
+        """
+        found = self._positions(event)
+        if found is None:
+            return self._always_entries
+        return tuple(self._plain[p] for p in found)
+
+    def bands(self, event):
+        """
+        Returns entries of listeners accepting given event
+        grouped by priority
+        """
+        found = self._positions(event)
+        if found is None:
+            found = self._always
+        priority = self._priorities.__getitem__
+        return tuple(tuple(self._plain[p] for p in band) \
+                for (k, band) in itertools.groupby(found, priority))
+
+    def batches(self, events):
+        """
+        Returns (entry, events) pairs: entries of listeners accepting
+        any of given events (ordered by priority) with events they accept
+        """
+        accepted = collections.defaultdict(list)
+        for event in events:
+            found = self._positions(event)
+            for position in self._always if found is None else found:
+                accepted[position].append(event)
+        return [(self._plain[p], accepted[p]) for p in sorted(accepted)]
+
+    def _positions(self, event):
+        """
+        Returns sorted positions of listeners accepting given event
+        or None when only unfiltered listeners accept it
+        """
+        found = []
+        for position in self._checked:
+            if self._filters[position].accepts(event):
+                found.append(position)
+        if self._index:
+            parameters = event.parameters
+            for key, values in self._index.items():
+                try:
+                    positions = values.get(parameters[key])
+                except (KeyError, TypeError):
+                    continue
+                if positions is None:
+                    continue
+                for position in positions:
+                    if position not in self._residual or \
+                            self._filters[position].accepts(event):
+                        found.append(position)
+        if not found:
+            return None
+        found.extend(self._always)
+        found.sort()
+        return found
+
+
+class _PatternIndex(object):
+    """
+    Trie of dot separated event name patterns.
+    Each node keeps items attached to pattern ending at this node.
+    """
+    __slots__ = ('children', 'items')
+
+    def __init__(self):
+        self.children = {}
+        self.items = []
+
+    def __bool__(self):
+        return bool(self.items or self.children)
+    __nonzero__ = __bool__
+
+    def add(self, pattern, item):
+        """
+        Stores (priority, counter, listener) item under given pattern
+        """
+        node = self
+        for segment in pattern.split('.'):
+            node = node.children.setdefault(segment, _PatternIndex())
+        node.items.append(item)
+
+    def walk(self, segments=()):
+        """
+        Yields (pattern, item) pairs of all stored items
+        """
+        for item in self.items:
+            yield ('.'.join(segments), item)
+        for segment, node in self.children.items():
+            for pair in node.walk(segments + (segment,)):
+                yield pair
+
+    def copy(self):
+        """
+        Returns copy of the index
+        """
+        index = _PatternIndex()
+        index.items = list(self.items)
+        index.children = dict((segment, node.copy()) for (segment, node) \
+                in self.children.items())
+        return index
+
+    def remove(self, pattern, listener):
+        """
+        Removes items with given listener stored under given pattern.
+        Returns information whether anything has been removed
+        """
+        return self._remove(pattern.split('.'), 0, listener)
+
+    def _remove(self, segments, position, listener):
+        if position == len(segments):
+            items = [i for i in self.items if i[2] != listener]
+            removed = len(items) != len(self.items)
+            self.items = items
+            return removed
+        node = self.children.get(segments[position])
+        if node is None:
+            return False
+        removed = node._remove(segments, position + 1, listener)
+        if not node:
+            del self.children[segments[position]]
+        return removed
+
+    def match(self, name):
+        """
+        Returns list of items stored under patterns matching given name
+        """
+        try:
+            segments = name.split('.')
+        except AttributeError:
+            return []
+        found = {}
+        self._match(segments, 0, found)
+        return list(found.values())
+
+    def _match(self, segments, position, found):
+        hash_node = self.children.get('#')
+        if hash_node is not None:
+            for i in range(position, len(segments) + 1):
+                hash_node._match(segments, i, found)
+        if position == len(segments):
+            for item in self.items:
+                found[item[1]] = item
+            return
+        for segment in (segments[position], '*'):
+            node = self.children.get(segment)
+            if node is not None:
+                node._match(segments, position + 1, found)
+
+
+class Scheduler(object):
+    """
+    Calls callbacks after given delay within single background thread.
+    Used to enforce timeouts (see 'timed' and Dispatcher.notify).
+    """
+
+    def __init__(self, clock=None):
+        """
+        Initializes class instance.
+        'clock' returns current time in seconds
+        """
+        self.clock = clock or getattr(time, 'monotonic', time.time)
+        self._heap = []
+        self._cancelled = 0
+        self._counter = itertools.count()
+        self._condition = threading.Condition(threading.Lock())
+        self._thread = None
+
+    def call_later(self, delay, callback):
+        """
+        Calls given callback after 'delay' seconds.
+        Returns timer whose 'cancel' method stops the call
+        """
+        timer = _Timer(callback, self)
+        item = (self.clock() + delay, next(self._counter), timer)
+        with self._condition:
+            heapq.heappush(self._heap, item)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                        name='pyevent-scheduler')
+                self._thread.daemon = True
+                self._thread.start()
+            elif self._heap[0] is item:
+                self._condition.notify()
+        return timer
+
+    def _run(self):
+        """
+        Calls due callbacks
+        """
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                delay = self._heap[0][0] - self.clock()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+                timer = heapq.heappop(self._heap)[2]
+                timer.scheduler = None
+                callback = timer.callback
+                if callback is None:
+                    self._cancelled -= 1
+                    continue
+            try:
+                callback()
+            except Exception:
+                sys.excepthook(*sys.exc_info())
+
+    def _cancel(self, timer):
+        """
+        Cancels given timer. Once more than half of the scheduled timers
+        are cancelled they are dropped, so timeouts of notifications that
+        finished in time do not pile up
+        """
+        with self._condition:
+            if timer.callback is None:
+                return
+            timer.callback = None
+            if timer.scheduler is None:
+                # already taken from the heap
+                return
+            self._cancelled += 1
+            if self._cancelled * 2 > len(self._heap):
+                self._heap = [i for i in self._heap \
+                        if i[2].callback is not None]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+
+class _Timer(object):
+    """
+    Callback scheduled by Scheduler
+    """
+    __slots__ = ('callback', 'scheduler')
+
+    def __init__(self, callback, scheduler):
+        self.callback = callback
+        self.scheduler = scheduler
+
+    def cancel(self):
+        """
+        Stops scheduled call
+        """
+        scheduler = self.scheduler
+        if scheduler is None:
+            self.callback = None
+        else:
+            scheduler._cancel(self)
+
+
+_scheduler = []
+
+
+def default_scheduler():
+    """
+    Returns Scheduler shared by dispatchers which have no own 'scheduler'
+    """
+    if not _scheduler:
+        # list.append is atomic; the first scheduler appended wins
+        _scheduler.append(Scheduler())
+    return _scheduler[0]
+
+
+def _deadline(notify, event, timeout, scheduler=None):
+    """
+    Calls 'notify' (returning promise) and returns promise rejected with
+    ListenerTimeout when the original one is not settled within 'timeout'
+    seconds. Propagation of the event is stopped on timeout, so remaining
+    listeners are not called
+    """
+    deferred = Deferred()
+    token = [True]
+
+    def expire():
+        if _take(token):
+            event.stop_propagation()
+            deferred.reject(ListenerTimeout('Listeners of %r did not finish ' \
+                    'within %s seconds' % (event.name, timeout)))
+
+    def settle(method, *args, **kwargs):
+        if _take(token):
+            timer.cancel()
+            method(*args, **kwargs)
+
+    timer = (scheduler or default_scheduler()).call_later(timeout, expire)
+    notify().done(partial(settle, deferred.resolve))\
+            .fail(partial(settle, deferred.reject))
+    return deferred.promise()
+
+
+def _take(token):
+    """
+    Takes the only item of given list. Returns False when it has been
+    already taken (list.pop is atomic, so it is safe between threads)
+    """
+    try:
+        return token.pop()
+    except IndexError:
+        return False
+
+
+class Histogram(object):
+    """
+    Latency histogram with fixed memory footprint (HDR histogram style).
+
+    Values (non negative integers, e.g. microseconds) are counted in
+    log-linear buckets: each power of two range is split into
+    2 ** precision buckets, so relative error of reported values is
+    below 2 ** -precision. Values above 2 ** max_bits are clamped.
+    """
+
+    def __init__(self, precision=4, max_bits=40):
+        """
+        Initializes class instance
+        """
+        self._sub = 1 << precision
+        self._shift = precision + 1
+        self._max = (1 << max_bits) - 1
+        self._buckets = [0] * ((max_bits - precision + 1) * self._sub)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        exponent = value.bit_length() - self._shift
+        if exponent <= 0:
+            return value
+        return (exponent + 1) * self._sub + (value >> exponent) - self._sub
+
+    def _value(self, index):
+        if index < 2 * self._sub:
+            return index
+        exponent = index // self._sub - 1
+        return (index % self._sub + self._sub) << exponent
+
+    def record(self, value):
+        """
+        Records given value
+        """
+        value = min(max(int(value), 0), self._max)
+        self._buckets[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def mean(self):
+        """
+        Returns mean of recorded values
+        """
+        if not self.count:
+            return 0
+        return self.total / float(self.count)
+
+    def percentile(self, percent):
+        """
+        Returns (lower bound of bucket holding) given percentile
+        of recorded values
+        """
+        if not self.count:
+            return 0
+        rank = max(1, int(round(self.count * percent / 100.0)))
+        seen = 0
+        for index, count in enumerate(self._buckets):
+            seen += count
+            if seen >= rank:
+                return max(self._value(index), self.min)
+        return self.max
+
+    def snapshot(self, percentiles=(50, 90, 99, 99.9)):
+        """
+        Returns statistics as a dictionary
+        """
+        result = {'count': self.count, 'sum': self.total, 'min': self.min,
+                'max': self.max, 'mean': self.mean()}
+        for percent in percentiles:
+            result['p%s' % percent] = self.percentile(percent)
+        return result
+
+
+class _EventStats(object):
+    """
+    Statistics of notifications about single event name
+    """
+    __slots__ = ('notifications', 'stopped', 'failures')
+
+    def __init__(self):
+        self.notifications = 0
+        self.stopped = 0
+        self.failures = 0
+
+    def snapshot(self):
+        return {'notifications': self.notifications, 'stopped': self.stopped,
+                'failures': self.failures}
+
+
+class _ListenerStats(object):
+    """
+    Statistics of calls of single listener
+    """
+    __slots__ = ('name', 'sync', 'deferred', 'failures', 'latency')
+
+    def __init__(self, name):
+        self.name = name
+        self.sync = 0
+        self.deferred = 0
+        self.failures = 0
+        self.latency = Histogram()
+
+    def record(self, seconds, sync):
+        """
+        Records finished listener call
+        """
+        if sync:
+            self.sync += 1
+        else:
+            self.deferred += 1
+        self.latency.record(seconds * 1e6)
+
+    def snapshot(self):
+        return {'listener': self.name, 'calls': self.sync + self.deferred,
+                'sync': self.sync, 'deferred': self.deferred,
+                'failures': self.failures,
+                'latency_us': self.latency.snapshot()}
+
+
+def _label(value):
+    """
+    Escapes Prometheus label value
+    """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')\
+            .replace('\n', '\\n')
+
+
+class Profiler(object):
+    """
+    Collects statistics of Dispatcher.notify calls:
+    number of notifications, propagation stops and failures per event name;
+    number of calls, synchronous and deferred completions, failures and
+    latency histogram per listener.
+
+    Example:
+
+    profiler = dispatcher.enable_profiling()
+    ...
+    profiler.snapshot()     # dictionary
+    profiler.prometheus()   # Prometheus text exposition format
+    """
+
+    def __init__(self, clock=None):
+        """
+        Initializes class instance.
+        'clock' returns current time in seconds
+        """
+        self.clock = clock or getattr(time, 'perf_counter', time.time)
+        self._events = {}
+        self._listeners = {}
+        self._labels = {}
+
+    def event(self, name):
+        """
+        Returns statistics of given event name
+        """
+        try:
+            return self._events[name]
+        except KeyError:
+            stats = self._events[name] = _EventStats()
+            return stats
+
+    def listener(self, name, listener):
+        """
+        Returns statistics of given listener attached to given event name.
+        Listeners of the same event sharing a name (e.g. lambdas) are
+        labelled 'name#2', 'name#3'... in order of their first call
+        """
+        key = (name, _key(listener))
+        try:
+            return self._listeners[key]
+        except KeyError:
+            label = getattr(listener, '__name__', None) or repr(listener)
+            # duplicate Prometheus series would make the scrape fail
+            count = self._labels[(name, label)] = \
+                    self._labels.get((name, label), 0) + 1
+            if count > 1:
+                label = '%s#%d' % (label, count)
+            stats = self._listeners[key] = _ListenerStats(label)
+            return stats
+
+    def reset(self):
+        """
+        Drops collected statistics
+        """
+        self._events.clear()
+        self._listeners.clear()
+        self._labels.clear()
+
+    def snapshot(self):
+        """
+        Returns collected statistics as a dictionary:
+        {'events': {name: {...}}, 'listeners': {name: [{...}, ...]}}
+        """
+        listeners = {}
+        for (name, key), stats in self._listeners.items():
+            listeners.setdefault(name, []).append(stats.snapshot())
+        return {'events': dict((name, stats.snapshot()) for (name, stats) \
+                    in self._events.items()),
+                'listeners': listeners}
+
+    def prometheus(self, prefix='pyevent'):
+        """
+        Returns collected statistics in Prometheus text exposition format
+        """
+        lines = []
+
+        def metric(name, kind, description, samples):
+            lines.append('# HELP %s_%s %s' % (prefix, name, description))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+            for suffix, labels, value in samples:
+                lines.append('%s_%s%s{%s} %s' % (prefix, name, suffix,
+                    ','.join('%s="%s"' % (k, _label(v)) for (k, v) in labels),
+                    value))
+
+        events = sorted(self._events.items(), key=lambda i: str(i[0]))
+        for field, description in (
+                ('notifications', 'Number of notifications'),
+                ('stopped', 'Number of notifications with stopped propagation'),
+                ('failures', 'Number of failed notifications')):
+            metric('event_%s_total' % field, 'counter', description,
+                    [('', [('event', name)], getattr(stats, field)) \
+                        for (name, stats) in events])
+
+        listeners = sorted(self._listeners.items(),
+                key=lambda i: (str(i[0][0]), i[1].name))
+        samples = []
+        for (name, key), stats in listeners:
+            labels = [('event', name), ('listener', stats.name)]
+            samples.append(('', labels + [('completion', 'sync')],
+                stats.sync))
+            samples.append(('', labels + [('completion', 'deferred')],
+                stats.deferred))
+        metric('listener_calls_total', 'counter',
+                'Number of finished listener calls', samples)
+        metric('listener_failures_total', 'counter',
+                'Number of failed listener calls',
+                [('', [('event', name), ('listener', stats.name)],
+                    stats.failures) for ((name, key), stats) in listeners])
+        samples = []
+        for (name, key), stats in listeners:
+            labels = [('event', name), ('listener', stats.name)]
+            for quantile in (0.5, 0.9, 0.99):
+                samples.append(('', labels + [('quantile', quantile)],
+                    stats.latency.percentile(quantile * 100) / 1e6))
+            samples.append(('_sum', labels, stats.latency.total / 1e6))
+            samples.append(('_count', labels, stats.latency.count))
+        metric('listener_latency_seconds', 'summary',
+                'Latency of listener calls', samples)
+        return '\n'.join(lines) + '\n'
+
+
+class LastWins(object):
+    """
+    Coalescing policy: only the last event notified within 'window'
+    seconds (counted from the first one) is dispatched
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.count = None
+
+    def key(self, event):
+        return None
+
+
+class MergeByKey(LastWins):
+    """
+    Coalescing policy: events are grouped by result of 'key(event)' and
+    the last event of each group notified within 'window' seconds
+    is dispatched
+    """
+
+    def __init__(self, key, window):
+        super(MergeByKey, self).__init__(window)
+        self.key = key
+
+
+class CountFlush(LastWins):
+    """
+    Coalescing policy: every 'count' events the last one is dispatched;
+    when 'window' is given pending event is dispatched also
+    after 'window' seconds
+    """
+
+    def __init__(self, count, window=None):
+        super(CountFlush, self).__init__(window)
+        self.count = count
+
+
+class Coalescer(object):
+    """
+    Coalesces bursts of events before notifying dispatcher.
+
+    Events with a name that has a policy set (see LastWins, MergeByKey,
+    CountFlush) are held back and superseded by newer ones; promises of
+    superseded events are settled together with the promise of the event
+    that actually gets dispatched. Events are dispatched when their policy
+    says so, on 'poll' calls for expired windows or on 'flush'.
+    Events without policy are dispatched immediately.
+
+    Example:
+
+    coalescer = Coalescer(dispatcher)
+    coalescer.policy('config.changed', LastWins(0.1))
+    coalescer.policy('cache.invalidate',
+            MergeByKey(lambda e: e.parameters['key'], 0.1))
+    coalescer.notify('config.changed', Event(self))
+    ...
+    coalescer.poll()    # e.g. every coalescer.timeout() seconds
+    """
+
+    def __init__(self, dispatcher, clock=None):
+        """
+        Initializes class instance.
+        'clock' returns current time in seconds
+        """
+        self.dispatcher = dispatcher
+        self.clock = clock or getattr(time, 'monotonic', time.time)
+        self.received = 0
+        self.dispatched = 0
+        self._policies = {}
+        self._pending = {}
+        self._due = None
+        self._lock = threading.Lock()
+
+    def policy(self, name, policy):
+        """
+        Sets coalescing policy of given event name;
+        None removes the policy and flushes pending events
+        """
+        if policy is None:
+            self._policies.pop(name, None)
+            self.flush(name)
+        else:
+            self._policies[name] = policy
+        return self
+
+    def notify(self, name, event):
+        """
+        Notifies dispatcher about event, possibly coalesced with other
+        events of the same name. Returns promise
+        """
+        try:
+            policy = self._policies[name]
+        except KeyError:
+            return self.dispatcher.notify(name, event)
+        key = policy.key(event)
+        now = self.clock()
+        ready = None
+        with self._lock:
+            self.received += 1
+            pending = self._pending.setdefault(name, {})
+            try:
+                slot = pending[key]
+                slot[0] = event
+                slot[3] += 1
+            except KeyError:
+                deadline = None if policy.window is None \
+                        else now + policy.window
+                deferred = Deferred()
+                slot = pending[key] = [event, deferred, deadline, 1,
+                        deferred.promise()]
+                if deadline is not None and \
+                        (self._due is None or deadline < self._due):
+                    self._due = deadline
+            if slot[3] == policy.count:
+                ready = [self._take(name, key)]
+        if ready is not None:
+            self._dispatch(ready)
+        if self._due is not None and self._due <= now:
+            self.poll()
+        return slot[4]
+
+    def _take(self, name, key):
+        """
+        Removes pending slot. Has to be called with the lock held
+        """
+        pending = self._pending[name]
+        slot = pending.pop(key)
+        if not pending:
+            del self._pending[name]
+        return (name, slot)
+
+    def _dispatch(self, ready):
+        """
+        Notifies dispatcher about taken events
+        """
+        for name, slot in ready:
+            self.dispatched += 1
+            self.dispatcher.notify(name, slot[0]).done(slot[1].resolve)\
+                    .fail(slot[1].reject)
+        return len(ready)
+
+    def poll(self):
+        """
+        Dispatches events whose window has expired.
+        Returns number of dispatched events
+        """
+        now = self.clock()
+        with self._lock:
+            ready = []
+            due = None
+            for name, pending in list(self._pending.items()):
+                for key, slot in list(pending.items()):
+                    if slot[2] is None:
+                        continue
+                    if slot[2] <= now:
+                        ready.append(self._take(name, key))
+                    elif due is None or slot[2] < due:
+                        due = slot[2]
+            self._due = due
+        return self._dispatch(ready)
+
+    def flush(self, name=None):
+        """
+        Dispatches all pending events (of given name).
+        Returns number of dispatched events
+        """
+        with self._lock:
+            names = list(self._pending) if name is None \
+                    else [name] if name in self._pending else []
+            ready = [self._take(n, key) for n in names \
+                    for key in list(self._pending[n])]
+        return self._dispatch(ready)
+
+    def timeout(self):
+        """
+        Returns number of seconds until the next window expires
+        or None when there is no pending window
+        """
+        if self._due is None:
+            return None
+        return max(0, self._due - self.clock())
+
+    def __len__(self):
+        """
+        Returns number of pending events
+        """
+        return sum(len(pending) for pending in self._pending.values())
+
+
+class EventQueue(object):
+    """
+    Bounded priority queue of events in front of a dispatcher.
+
+    Producers 'put' events and get promises settled once the event has been
+    dispatched; workers dispatch queued events with 'drain' or 'run'.
+    Events are dispatched by priority (lower first; 'priority' is either
+    a dictionary {name: priority} or a callable (name, event) -> priority),
+    events with the same priority in order of arrival.
+
+    When the queue is full the overflow policy applies:
+
+    BLOCK - 'put' waits for free space (up to 'timeout' seconds, then
+            the event is rejected); never use it when the producer
+            is the only worker
+    DROP_OLDEST - the longest queued event is dropped
+    DROP_NEWEST - the most recently queued event is dropped
+    REJECT - the new event is rejected
+
+    Promises of dropped and rejected events are rejected with QueueFull.
+    """
+
+    BLOCK = 'block'
+    DROP_OLDEST = 'drop_oldest'
+    DROP_NEWEST = 'drop_newest'
+    REJECT = 'reject'
+
+    def __init__(self, dispatcher, capacity=1024, overflow=BLOCK,
+            priority=None, clock=None):
+        """
+        Initializes class instance.
+        'clock' returns current time in seconds
+        """
+        if overflow not in (self.BLOCK, self.DROP_OLDEST, self.DROP_NEWEST,
+                self.REJECT):
+            raise ValueError('Unknown overflow policy %r' % overflow)
+        self.dispatcher = dispatcher
+        self.capacity = capacity
+        self.overflow = overflow
+        self.priority = priority
+        self.clock = clock or getattr(time, 'perf_counter', time.time)
+        self.enqueued = 0
+        self.dispatched = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self.latency = Histogram()
+        self._heap = []
+        self._age = collections.deque()
+        self._size = 0
+        self._counter = itertools.count()
+        self._condition = threading.Condition(threading.Lock())
+        self._closed = False
+
+    def _rank(self, name, event):
+        """
+        Returns priority of given event
+        """
+        if self.priority is None:
+            return 0
+        if callable(self.priority):
+            return self.priority(name, event)
+        return self.priority.get(name, 0)
+
+    def put(self, name, event, timeout=None):
+        """
+        Enqueues event. Returns promise resolved when the event
+        has been dispatched
+        """
+        deferred = Deferred()
+        # item: priority, sequence, name, event, deferred, enqueue time,
+        # is still queued
+        item = [self._rank(name, event), next(self._counter), name, event,
+                deferred, self.clock(), True]
+        victim = None
+        with self._condition:
+            if self._size >= self.capacity and self.overflow == self.BLOCK:
+                self._wait(timeout)
+            if self._size < self.capacity:
+                pass
+            elif self.overflow == self.DROP_OLDEST:
+                victim = self._evict(self._age.popleft)
+            elif self.overflow == self.DROP_NEWEST:
+                victim = self._evict(self._age.pop)
+            else:
+                victim = item
+                self.rejected += 1
+            if victim is not item:
+                self._push(item)
+        if victim is not None:
+            victim[4].reject(QueueFull('Queue of %d events is full' % \
+                    self.capacity))
+        return deferred.promise()
+
+    def _wait(self, timeout):
+        """
+        Waits for free space. Has to be called with the lock held
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while self._size >= self.capacity and not self._closed:
+            remaining = None if deadline is None else deadline - time.time()
+            if remaining is not None and remaining <= 0:
+                return
+            self._condition.wait(remaining)
+
+    def _push(self, item):
+        """
+        Adds item to the queue. Has to be called with the lock held
+        """
+        heapq.heappush(self._heap, item)
+        self._age.append(item)
+        self._size += 1
+        self.enqueued += 1
+        if self._size > self.max_depth:
+            self.max_depth = self._size
+        # removed items are deleted lazily; compact when they pile up
+        if len(self._age) > 2 * self._size + 64:
+            self._age = collections.deque(i for i in self._age if i[6])
+        if len(self._heap) > 2 * self._size + 64:
+            self._heap = [i for i in self._heap if i[6]]
+            heapq.heapify(self._heap)
+        self._wakeup()
+
+    def _evict(self, pop):
+        """
+        Removes item returned by 'pop' (skipping already removed ones).
+        Has to be called with the lock held
+        """
+        while True:
+            item = pop()
+            if item[6]:
+                item[6] = False
+                self._size -= 1
+                self.dropped += 1
+                return item
+
+    def _pop(self):
+        """
+        Removes and returns item with the highest priority or None.
+        Has to be called with the lock held
+        """
+        while self._heap:
+            item = heapq.heappop(self._heap)
+            if item[6]:
+                item[6] = False
+                self._size -= 1
+                self._condition.notify()
+                return item
+        return None
+
+    def _wakeup(self):
+        """
+        Wakes up worker waiting for events. Has to be called with the lock
+        held
+        """
+        self._condition.notify()
+
+    def _dispatched(self, item):
+        """
+        Records metrics of item taken from the queue
+        """
+        self.dispatched += 1
+        self.latency.record((self.clock() - item[5]) * 1e6)
+
+    def drain(self, limit=None):
+        """
+        Dispatches queued events (at most 'limit' of them) without waiting
+        for new ones. Returns number of dispatched events
+        """
+        count = 0
+        while limit is None or count < limit:
+            with self._condition:
+                item = self._pop()
+            if item is None:
+                break
+            self._dispatched(item)
+            self.dispatcher.notify(item[2], item[3]).done(item[4].resolve)\
+                    .fail(item[4].reject)
+            count += 1
+        return count
+
+    def run(self):
+        """
+        Dispatches queued events, waiting for new ones,
+        until the queue is closed and empty
+        """
+        while True:
+            with self._condition:
+                while not self._size and not self._closed:
+                    self._condition.wait()
+                if not self._size:
+                    return
+            self.drain()
+
+    def close(self):
+        """
+        Stops 'run' loops once queued events are dispatched
+        and releases blocked producers
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def __len__(self):
+        """
+        Returns number of queued events
+        """
+        return self._size
+
+    def snapshot(self):
+        """
+        Returns queue metrics as a dictionary; latency (time spent
+        in the queue) is given in microseconds
+        """
+        return {'depth': self._size, 'max_depth': self.max_depth,
+                'capacity': self.capacity, 'enqueued': self.enqueued,
+                'dispatched': self.dispatched, 'dropped': self.dropped,
+                'rejected': self.rejected,
+                'latency': self.latency.snapshot()}
+
+
+class Manager(object):
+    """
+    Class that simplifies attaching listeners to dispatcher
+    """
+
+    def __init__(self, dispatcher):
+        """
+        Class initialization
+        """
+        self.dispatcher = dispatcher
+
+    def register(self, listener, weak=False):
+        """
+        Registers event listeners to given dispatcher.
+        When 'weak' is True dispatcher holds listeners by weak references,
+        so they are detached once given listener is garbage collected.
+        """
+        self._set_dispatcher(listener)
+        options = {'weak': True} if weak else {}
+        for t in listener.mapping():
+            try:
+                priority = t[2]
+            except IndexError:
+                priority = None
+            self.dispatcher.attach(t[0], t[1], priority, **options)
+
+    def register_many(self, listeners, weak=False):
+        """
+        Registers event listeners of all given objects to dispatcher at once
+        (see Dispatcher.attach_many). Much faster than calling 'register'
+        for each of them when there are many listeners.
+        """
+        mappings = []
+        for listener in listeners:
+            self._set_dispatcher(listener)
+            mappings.extend(listener.mapping())
+        self.dispatcher.attach_many(mappings, weak)
+
+    def register_lazy(self, mapping):
+        """
+        Registers listeners given as "module:attribute" strings, imported
+        on first use (see Dispatcher.attach_lazy). Takes dictionary
+        {event name: target or (target, priority)} or iterable of
+        (event name, target[, priority]) tuples.
+        """
+        if hasattr(mapping, 'items'):
+            # targets may be unicode strings on Python 2
+            mapping = [(name,) + (tuple(t) if isinstance(t, (tuple, list)) \
+                    else (t,)) for (name, t) in mapping.items()]
+        self.dispatcher.attach_many((t[0], lazy(t[1])) + tuple(t[2:]) \
+                for t in mapping)
+
+    def _set_dispatcher(self, listener):
+        """
+        Tries to set dispatcher to given listener
+        """
+        try:
+            listener.set_dispatcher(self.dispatcher)
+        except AttributeError:
+            pass
+
+    def unregister(self, listener):
+        """
+        Detaches event listeners registered by 'register'
+        """
+        for t in listener.mapping():
+            self.dispatcher.detach(t[0], t[1])
+
+
+class Listener(object):
+    """
+    Class that defines simple interface for classes to work with Dispatcher
+    """
+
+    def mapping(self):
+        """
+        Returns list of listeners to be attached to dispatcher.
+        [(event name, listener, priority), (event name, listener, priority)]
+        """
+        raise NotImplementedError('Return list of tuples with ' +\
+            '(event, callback priority) mappings')
+
+
+class DispatcherAware(object):
+    """
+    Mixin for listeners that want to have dispatcher reference be given
+    """
+
+    def set_dispatcher(self, dispatcher):
+        """
+        Dispatcher setter
+        """
+        self.dispatcher = dispatcher
+        return self
+
+
+def batched(function):
+    """
+    Decorator that marks event listeners as accepting batches of events.
+
+    Decorated function is called as function(events, deferred) by
+    Dispatcher.notify_many and Dispatcher.notify_stream. When notified
+    about single event it receives one element list.
+    Can be combined with 'synchronous' decorator (applied first)
+    and with coroutine functions (notified by AsyncDispatcher).
+    """
+    @wraps(function)
+    def wrapper(event, deferred, *args, **kwargs):
+        return function([event], deferred, *args, **kwargs)
+    sync = getattr(function, '__synchronous__', None)
+    if sync is not None:
+        wrapper.__synchronous__ = lambda event, *args, **kwargs: \
+                sync([event], *args, **kwargs)
+    coroutine = _coroutine(function)
+    if coroutine is not None:
+        wrapper.__coroutine__ = lambda event: coroutine([event])
+    wrapper.__batched__ = function
+    return wrapper
+
+
+class _ListenerWrapper(object):
+    """
+    Base class for callables wrapping listeners.
+    Compares equal to wrapped listener.
+    """
+
+    def __init__(self, listener):
+        self.listener = listener
+
+    def __eq__(self, other):
+        if isinstance(other, _ListenerWrapper):
+            other = other.listener
+        return self.listener == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.listener)
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.listener)
+
+
+def _marker(listener, name):
+    """
+    Returns function stored by decorator in given attribute of the
+    listener (e.g. '__synchronous__') or None. Bound methods expose
+    attributes of their plain functions, so the function is bound
+    to the method's instance as well
+    """
+    function = getattr(listener, name, None)
+    if function is not None and \
+            getattr(listener, '__func__', None) is not None:
+        owner = getattr(listener, '__self__', None)
+        if owner is not None:
+            return types.MethodType(function, owner)
+    return function
+
+
+# code flag of coroutine ('async def') functions
+_CO_COROUTINE = 0x80
+
+
+def _coroutine(listener):
+    """
+    Returns function to be called with the event (returning awaitable)
+    for coroutine listeners: coroutine functions and listeners with
+    '__coroutine__' attribute (wrappers of coroutine functions).
+    Returns None for other listeners.
+    """
+    coroutine = getattr(listener, '__coroutine__', None)
+    if coroutine is not None:
+        return coroutine
+    function = listener
+    while isinstance(function, partial):
+        function = function.func
+    code = getattr(getattr(function, '__func__', function), '__code__', None)
+    if code is not None and code.co_flags & _CO_COROUTINE:
+        return listener
+    return None
+
+
+def _asyncio():
+    """
+    Returns asyncio backend. It is imported only when coroutine listeners
+    are wrapped, as it requires Python 3.5+
+    """
+    return importlib.import_module('pyevent_asyncio')
+
+
+class _Filtered(_ListenerWrapper):
+    """
+    Listener called only for events accepted by its filters
+    (see Dispatcher.attach)
+    """
+
+    def __init__(self, listener, when=None, where=None):
+        super(_Filtered, self).__init__(listener)
+        self.when = when
+        self.where = []
+        for key, value in sorted((where or {}).items()):
+            if isinstance(value, (set, frozenset, list, tuple)):
+                try:
+                    value = frozenset(value)
+                except TypeError:
+                    value = tuple(value)
+                self.where.append((key, value, True))
+            else:
+                self.where.append((key, value, False))
+        sync = _marker(listener, '__synchronous__')
+        if sync is not None:
+            self.__synchronous__ = partial(self._call_sync, sync)
+        coroutine = _coroutine(listener)
+        if coroutine is not None:
+            # returns no awaitable for rejected events
+            self.__coroutine__ = partial(self._call_sync, coroutine)
+
+    def index(self, index, position):
+        """
+        Adds listener at given position to {parameter: {value: positions}}
+        index by its first 'where' parameter. Returns False when values
+        can not be indexed
+        """
+        key, value, many = self.where[0]
+        values = value if many else (value,)
+        try:
+            for value in values:
+                hash(value)
+        except TypeError:
+            return False
+        values_index = index.setdefault(key, {})
+        for value in values:
+            positions = values_index.setdefault(value, [])
+            # the same value may be given twice
+            if not positions or positions[-1] != position:
+                positions.append(position)
+        return True
+
+    def accepts(self, event):
+        """
+        Checks whether listener accepts given event
+        """
+        if self.when is not None and not self.when(event):
+            return False
+        if self.where:
+            parameters = event.parameters
+            for key, value, many in self.where:
+                try:
+                    if (parameters[key] not in value) if many else \
+                            (parameters[key] != value):
+                        return False
+                except (KeyError, TypeError):
+                    return False
+        return True
+
+    def _call_sync(self, function, event):
+        if self.accepts(event):
+            return function(event)
+
+    def __call__(self, event, deferred):
+        if self.accepts(event):
+            self.listener(event, deferred=deferred)
+        else:
+            deferred.resolve()
+
+
+class _LazyListener(_ListenerWrapper):
+    """
+    Listener given as "module:attribute" string, imported on first use
+    """
+
+    def __init__(self, target):
+        super(_LazyListener, self).__init__(target)
+        self._resolved = None
+
+    def resolve(self):
+        """
+        Imports and returns the listener
+        """
+        if self._resolved is None:
+            module, _, path = self.listener.partition(':')
+            target = importlib.import_module(module)
+            for attribute in path.split('.') if path else ():
+                target = getattr(target, attribute)
+            self._resolved = target
+        return self._resolved
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+
+def lazy(target):
+    """
+    Returns listener that imports listener given as "module:attribute"
+    string when it is needed for the first time. Dispatcher resolves
+    such listeners when compiling listener list of the event,
+    so they are as fast as regular listeners afterwards.
+    """
+    return _LazyListener(target)
+
+
+class _WeakListener(_ListenerWrapper):
+    """
+    Listener held by weak reference.
+    Bound methods are held by weak reference to their instance.
+    Given callback is called with the wrapper once target dies.
+    Wrapper of synchronous (coroutine) listener is synchronous
+    (coroutine) as well.
+    """
+
+    def __init__(self, listener, callback):
+        self._hash = hash(listener)
+        self._callbacks = [callback]
+        die = lambda ref: self._die()
+        try:
+            self._func = listener.__func__
+            self._ref = weakref.ref(listener.__self__, die)
+        except AttributeError:
+            self._func = None
+            self._ref = weakref.ref(listener, die)
+        if getattr(listener, '__synchronous__', None) is not None:
+            self.__synchronous__ = self._call_sync
+        elif _coroutine(listener) is not None:
+            self.__coroutine__ = self._call_coroutine
+
+    @property
+    def listener(self):
+        """
+        Returns wrapped listener or None when it is already dead
+        """
+        target = self._ref()
+        if target is None or self._func is None:
+            return target
+        return self._func.__get__(target, type(target))
+
+    def watch(self, callback):
+        """
+        Adds callback called with the wrapper once target dies
+        """
+        self._callbacks = [c for c in self._callbacks if c.alive()]
+        self._callbacks.append(callback)
+
+    def _die(self):
+        for callback in self._callbacks:
+            callback(self)
+
+    def __hash__(self):
+        return self._hash
+
+    def _call_sync(self, event):
+        # synchronous function is looked up on live target only,
+        # so it does not hold the target
+        target = self._ref()
+        if target is None:
+            return None
+        if self._func is None:
+            return target.__synchronous__(event)
+        return self._func.__synchronous__(target, event)
+
+    def _call_coroutine(self, event):
+        # returns None when target is dead
+        listener = self.listener
+        if listener is not None:
+            return _coroutine(listener)(event)
+
+    def __call__(self, *args, **kwargs):
+        listener = self.listener
+        if listener is not None:
+            return listener(*args, **kwargs)
+        deferred = kwargs.get('deferred')
+        if deferred is not None:
+            deferred.resolve()
+
+
+class _Detacher(object):
+    """
+    Callback detaching dead weak listener from dispatcher
+    (held by weak reference, so listeners do not keep it alive)
+    """
+    __slots__ = ('_dispatcher', '_detach', '_name')
+
+    def __init__(self, dispatcher, detach, name):
+        self._dispatcher = weakref.ref(dispatcher)
+        self._detach = detach
+        self._name = name
+
+    def alive(self):
+        """
+        Returns information whether dispatcher still exists
+        """
+        return self._dispatcher() is not None
+
+    def __call__(self, listener):
+        dispatcher = self._dispatcher()
+        if dispatcher is not None:
+            dispatcher._died(getattr(dispatcher, self._detach), self._name,
+                    listener)
+
+
+def _watch(listener, dispatcher, detach, name):
+    """
+    Makes weak listener (possibly wrapped by other wrappers) copied to
+    other dispatcher detach itself from that dispatcher as well
+    """
+    while isinstance(listener, _ListenerWrapper):
+        if isinstance(listener, _WeakListener):
+            listener.watch(_Detacher(dispatcher, detach, name))
+            return
+        if isinstance(listener, _LazyListener):
+            return
+        listener = listener.listener
+
+
+class _Executed(_ListenerWrapper):
+    """
+    Listener called within executor
+    """
+
+    def __init__(self, listener, executor):
+        super(_Executed, self).__init__(listener)
+        self.executor = executor
+
+    def __call__(self, event, deferred):
+        self.executor.submit(self.listener, event)\
+                .add_done_callback(partial(_resolve_future, deferred))
+
+
+def _resolve_future(deferred, future):
+    """
+    Resolves (or rejects) deferred according to state of finished future
+    """
+    if future.cancelled():
+        deferred.reject(ListenerError('Listener call has been cancelled'))
+    elif future.exception() is not None:
+        deferred.reject(future.exception())
+    else:
+        deferred.resolve(future.result())
+
+
+class _Timed(_ListenerWrapper):
+    """
+    Listener that fails (or is skipped) when it does not finish in time
+    """
+
+    def __init__(self, listener, timeout, skip, scheduler):
+        super(_Timed, self).__init__(listener)
+        self.timeout = timeout
+        self.skip = skip
+        self.scheduler = scheduler
+        coroutine = _coroutine(listener)
+        if coroutine is not None:
+            self.__coroutine__ = _asyncio()._timed(self, coroutine)
+
+    def _timeout_error(self):
+        """
+        Returns error of listener which did not finish in time
+        """
+        return ListenerTimeout('Listener %r did not finish within %s ' \
+                'seconds' % (self.listener, self.timeout))
+
+    def __call__(self, event, deferred):
+        token = [True]
+
+        def expire():
+            if not _take(token):
+                return
+            if self.skip:
+                deferred.resolve()
+            else:
+                deferred.reject(self._timeout_error())
+
+        def settle(method, *args, **kwargs):
+            if _take(token):
+                timer.cancel()
+                method(*args, **kwargs)
+
+        timer = (self.scheduler or default_scheduler()).call_later(
+                self.timeout, expire)
+        Deferred(partial(self.listener, event))\
+                .done(partial(settle, deferred.resolve))\
+                .fail(partial(settle, deferred.reject))
+
+
+def timed(listener, timeout, skip=False, scheduler=None):
+    """
+    Returns listener that fails with ListenerTimeout (or, when 'skip' is
+    True, is skipped) when given listener does not resolve its deferred
+    within 'timeout' seconds. Late results of the listener are ignored.
+
+    Timeouts are enforced by given (or default) Scheduler, so dispatching
+    is resumed within the scheduler's thread. Synchronous listeners
+    can not be interrupted and are returned unchanged. Coroutine listeners
+    (notified by AsyncDispatcher) are cancelled on timeout instead.
+    """
+    if getattr(listener, '__synchronous__', None) is not None:
+        return listener
+    return _Timed(listener, timeout, skip, scheduler)
+
+
+class CircuitBreaker(_ListenerWrapper):
+    """
+    Listener wrapper that bypasses listener failing too often.
+
+    Outcomes of the last 'window' calls are tracked. When at least
+    'min_calls' of them are known and the failure rate reaches 'threshold'
+    the circuit opens: listener is skipped (its deferred is resolved
+    without calling it) for 'cooldown' seconds. Then single trial call
+    is let through (half open state); its success closes the circuit,
+    failure opens it again. Failures of listener are still reported
+    to the dispatcher. Combine with 'timed' to count timeouts as failures.
+
+    Example:
+
+    breaker = CircuitBreaker(timed(listener, 0.5), threshold=0.5)
+    dispatcher.attach('foo', breaker)
+    ...
+    breaker.state       # 'closed', 'open' or 'half_open'
+    breaker.snapshot()
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, listener, threshold=0.5, window=20, min_calls=10,
+            cooldown=30, clock=None):
+        """
+        Initializes class instance.
+        'clock' returns current time in seconds
+        """
+        super(CircuitBreaker, self).__init__(listener)
+        self.threshold = threshold
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.clock = clock or getattr(time, 'monotonic', time.time)
+        self.state = self.CLOSED
+        self.calls = 0
+        self.failures = 0
+        self.skipped = 0
+        self.opened = 0
+        self._outcomes = collections.deque(maxlen=window)
+        self._opened_at = None
+        self._lock = threading.Lock()
+        coroutine = _coroutine(listener)
+        if coroutine is not None:
+            self.__coroutine__ = _asyncio()._broken(self, coroutine)
+
+    def __call__(self, event, deferred):
+        if not self._admit():
+            deferred.resolve()
+            return
+        try:
+            Deferred(partial(self.listener, event))\
+                    .done(partial(self._settle, False, deferred.resolve))\
+                    .fail(partial(self._settle, True, deferred.reject))
+        except Exception:
+            self._record(True)
+            raise
+
+    def _admit(self):
+        """
+        Counts the call. Returns information whether listener may be called
+        """
+        with self._lock:
+            allowed = self._allow()
+            if allowed:
+                self.calls += 1
+            else:
+                self.skipped += 1
+        return allowed
+
+    def _allow(self):
+        """
+        Returns information whether listener may be called.
+        Has to be called with the lock held
+        """
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and \
+                self.clock() - self._opened_at >= self.cooldown:
+            self.state = self.HALF_OPEN
+            return True
+        return False
+
+    def _settle(self, failed, method, *args, **kwargs):
+        """
+        Records outcome of the call and settles dispatcher's deferred
+        """
+        self._record(failed)
+        method(*args, **kwargs)
+
+    def _record(self, failed):
+        """
+        Records outcome of the call and changes state of the circuit
+        """
+        with self._lock:
+            if failed:
+                self.failures += 1
+            if self.state == self.HALF_OPEN:
+                self._outcomes.clear()
+                if failed:
+                    self._open()
+                else:
+                    self.state = self.CLOSED
+                return
+            self._outcomes.append(failed)
+            if self.state == self.CLOSED and \
+                    len(self._outcomes) >= self.min_calls and \
+                    sum(self._outcomes) >= \
+                    self.threshold * len(self._outcomes):
+                self._outcomes.clear()
+                self._open()
+
+    def _open(self):
+        """
+        Opens the circuit. Has to be called with the lock held
+        """
+        self.state = self.OPEN
+        self.opened += 1
+        self._opened_at = self.clock()
+
+    def failure_rate(self):
+        """
+        Returns failure rate of recently tracked calls
+        """
+        if not self._outcomes:
+            return 0.0
+        return sum(self._outcomes) / float(len(self._outcomes))
+
+    def snapshot(self):
+        """
+        Returns state of the breaker as a dictionary
+        """
+        return {'state': self.state, 'calls': self.calls,
+                'failures': self.failures, 'skipped': self.skipped,
+                'opened': self.opened, 'failure_rate': self.failure_rate()}
+
+
+class ListenerCache(_ListenerWrapper):
+    """
+    Listener wrapper memoizing values listener resolves with
+    (returns, for synchronous listeners) in LRU cache of bounded size.
+
+    Listener has to be a pure function of the event (by default of its
+    parameters): on cache hit it is not called at all and its deferred
+    is resolved with the cached value. Entries expire after 'ttl' seconds
+    (if given). Concurrent calls with the same key made while the first
+    one is still in progress wait for its result instead of calling
+    the listener again. Failures are not cached. Keys have to be hashable:
+    events with unhashable keys (e.g. lists among parameters, for the
+    default key) are counted as misses and their values are not cached.
+    Coroutine listeners (notified by AsyncDispatcher) are supported
+    as well.
+
+    Example:
+
+    lookup = cached(price_lookup, lambda event: event.parameters['sku'])
+    dispatcher.attach('price', lookup)
+    ...
+    lookup.snapshot()   # hits, misses, evictions, collapsed, size
+    """
+
+    def __init__(self, listener, key=None, size=1024, ttl=None, clock=None):
+        """
+        Initializes class instance.
+        'key' returns cache key of given event,
+        'clock' returns current time in seconds
+        """
+        super(ListenerCache, self).__init__(listener)
+        self.key = key or _parameters_key
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock or getattr(time, 'monotonic', time.time)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.collapsed = 0
+        self._entries = collections.OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        sync = _marker(listener, '__synchronous__')
+        if sync is not None:
+            self.__synchronous__ = partial(self._call_sync, sync)
+        coroutine = _coroutine(listener)
+        if coroutine is not None:
+            self.__coroutine__ = _asyncio()._cached(self, coroutine)
+
+    def _key(self, event):
+        """
+        Returns cache key of given event, or _UNHASHABLE (counting a miss)
+        when the key can not be cached
+        """
+        key = self.key(event)
+        if key is not _UNHASHABLE:
+            try:
+                hash(key)
+                return key
+            except TypeError:
+                pass
+        with self._lock:
+            self.misses += 1
+        return _UNHASHABLE
+
+    def _get(self, key):
+        """
+        Returns (is hit, value) pair. Has to be called with the lock held
+        """
+        try:
+            value, expires = self._entries.pop(key)
+        except KeyError:
+            return (False, None)
+        if expires is not None and expires <= self.clock():
+            return (False, None)
+        # re-inserted entry becomes the most recently used one
+        self._entries[key] = (value, expires)
+        self.hits += 1
+        return (True, value)
+
+    def _store(self, key, value):
+        """
+        Stores value. Has to be called with the lock held
+        """
+        self._entries[key] = (value, None if self.ttl is None \
+                else self.clock() + self.ttl)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _call_sync(self, function, event):
+        """
+        Calls synchronous listener on cache miss
+        """
+        key = self._key(event)
+        if key is _UNHASHABLE:
+            return function(event)
+        with self._lock:
+            hit, value = self._get(key)
+            if not hit:
+                self.misses += 1
+        if hit:
+            return value
+        value = function(event)
+        with self._lock:
+            self._store(key, value)
+        return value
+
+    def __call__(self, event, deferred):
+        key = self._key(event)
+        if key is _UNHASHABLE:
+            return self.listener(event, deferred=deferred)
+        with self._lock:
+            hit, value = self._get(key)
+            if not hit:
+                waiters = self._pending.get(key)
+                if waiters is not None:
+                    self.collapsed += 1
+                    waiters.append(deferred)
+                    return
+                self._pending[key] = [deferred]
+                self.misses += 1
+        if hit:
+            deferred.resolve(value)
+            return
+        try:
+            Deferred(partial(self.listener, event))\
+                    .done(partial(self._done, key))\
+                    .fail(partial(self._fail, key))
+        except Exception as e:
+            self._fail(key, e)
+            raise
+
+    def _done(self, key, *args, **kwargs):
+        """
+        Stores value of finished call and resolves waiting deferreds
+        """
+        value = args[0] if args else None
+        with self._lock:
+            self._store(key, value)
+            waiters = self._pending.pop(key, ())
+        for deferred in waiters:
+            deferred.resolve(value)
+
+    def _fail(self, key, *args, **kwargs):
+        """
+        Rejects deferreds waiting for failed call
+        """
+        with self._lock:
+            waiters = self._pending.pop(key, ())
+        for deferred in waiters:
+            deferred.reject(*args, **kwargs)
+
+    def clear(self):
+        """
+        Drops cached values
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        """
+        Returns number of cached values
+        """
+        return len(self._entries)
+
+    def snapshot(self):
+        """
+        Returns cache statistics as a dictionary
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'collapsed': self.collapsed,
+                'size': len(self._entries)}
+
+
+# key of events whose values are not cached
+_UNHASHABLE = object()
+
+
+def _parameters_key(event):
+    """
+    Returns default cache key: items of event parameters
+    (_UNHASHABLE when names of parameters can not be ordered)
+    """
+    try:
+        return tuple(sorted(event.parameters.items()))
+    except TypeError:
+        return _UNHASHABLE
+
+
+def cached(listener, key=None, size=1024, ttl=None, clock=None):
+    """
+    Returns listener whose results are memoized (see ListenerCache).
+    Synchronous listeners stay synchronous
+    """
+    return ListenerCache(listener, key, size, ttl, clock)
+
+
+def executed(listener, executor):
+    """
+    Returns listener that submits listener(event) to given executor
+    (any object with concurrent.futures.Executor 'submit' method)
+    and resolves deferred with its result once finished.
+
+    Thread pools are suited for blocking I/O, process pools for CPU bound
+    work. When process pool is used both the listener and the event
+    have to be picklable and changes made to the event by the listener
+    are not visible to the caller - only the result is passed back.
+
+    Note that the deferred is resolved from the executor's thread,
+    so remaining listeners are notified within that thread.
+    """
+    return _Executed(listener, executor)
 
 
 def synchronous(function):
     """
     Decorator that marks event listeners as synchronous
-    It handles deferred object on behalf of decorated function
+    It handles deferred object on behalf of decorated function.
+    Dispatcher calls decorated function directly (through '__synchronous__'
+    attribute) without creating deferred object at all.
     """
     @wraps(function)
     def wrapper(event, deferred, *args, **kwargs):
         ret = function(event, *args, **kwargs)
         deferred.resolve(ret)
         return ret
+    wrapper.__synchronous__ = function
     return wrapper
@@ -0,0 +1,436 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+asyncio backend for pyevent.
+
+Requires Python 3.5 or newer.
+"""
+import asyncio
+import itertools
+import threading
+from functools import partial
+
+from promise import Deferred
+
+from pyevent import Dispatcher, EventQueue, ListenerErrors, ListenerTimeout, \
+        _UNHASHABLE, _append, _coroutine, _error
+
+
+class AsyncDispatcher(Dispatcher):
+    """
+    Dispatcher that notifies listeners from within asyncio coroutine.
+
+    Accepts three kinds of listeners:
+
+    coroutine functions (and their wrappers, e.g. 'timed', 'weak')
+        - awaited with event as the only argument
+    synchronous listeners (see 'synchronous' decorator) - called directly
+    regular listeners - called with (event, deferred) as in Dispatcher
+
+    Example:
+
+    async def listener(event):
+        await something(event.parameters)
+
+    d = AsyncDispatcher()
+    d.attach('foo', listener)
+    event = await d.notify('foo', Event(self))
+
+    All 'notify_*' methods (except 'notify_sync') are coroutines returning
+    what promises of their Dispatcher counterparts are resolved with.
+    """
+
+    def freeze(self):
+        """
+        Asynchronous dispatchers can not be frozen
+        (FrozenDispatcher does not await coroutine listeners)
+        """
+        raise TypeError('Asynchronous dispatcher can not be frozen')
+
+    def _entry(self, listener):
+        """
+        Prepares compiled listener entry:
+        (listener, synchronous function, coroutine function)
+        """
+        entry = super(AsyncDispatcher, self)._entry(listener)
+        return entry + (_coroutine(entry[0]),)
+
+    async def notify(self, name, event, timeout=None):
+        """
+        Notifies each listener about new event.
+        Returns the event once all listeners finish.
+        When listeners do not finish within 'timeout' seconds the running
+        one is cancelled, propagation of the event is stopped
+        and ListenerTimeout is raised
+        """
+        if timeout is not None:
+            try:
+                return await asyncio.wait_for(self.notify(name, event),
+                        timeout)
+            except asyncio.TimeoutError:
+                event.stop_propagation()
+                raise ListenerTimeout('Listeners of %r did not finish ' \
+                        'within %s seconds' % (name, timeout))
+        event.start_propagation().name = name
+        if self.profiler is not None:
+            return await self._profiled_notify(name, event)
+        for listener, sync, coroutine in self._select(name, event):
+            if event.is_propagation_stopped():
+                break
+            if sync is not None:
+                sync(event)
+            elif coroutine is not None:
+                awaitable = coroutine(event)
+                # dead weak listener returns None
+                if awaitable is not None:
+                    await awaitable
+            else:
+                await _call_deferred(listener, event)
+        return event
+
+    async def _profiled_notify(self, name, event):
+        """
+        Works the same way as 'notify' but records statistics
+        of the event and each listener call in the profiler
+        """
+        profiler = self.profiler
+        clock = profiler.clock
+        stats = profiler.event(name)
+        stats.notifications += 1
+        for listener, sync, coroutine in self._select(name, event):
+            if event.is_propagation_stopped():
+                stats.stopped += 1
+                break
+            listener_stats = profiler.listener(name, listener)
+            start = clock()
+            try:
+                if sync is not None:
+                    sync(event)
+                elif coroutine is not None:
+                    await _result(coroutine(event))
+                else:
+                    await _call_deferred(listener, event)
+            except Exception:
+                listener_stats.failures += 1
+                stats.failures += 1
+                raise
+            listener_stats.record(clock() - start, sync is not None)
+        return event
+
+    async def notify_collect(self, name, event):
+        """
+        Notifies each listener about new event.
+        Returns list of values returned by listeners
+        """
+        return await self._reduce(name, event, _append, [])
+
+    async def notify_until(self, name, event):
+        """
+        Notifies listeners about new event until one of them returns
+        value other than None. Such listener marks the event as processed
+        and remaining listeners are not called. Returns the value (or None)
+        """
+        return await self._reduce(name, event, None, None)
+
+    async def notify_reduce(self, name, event, function, initial=None):
+        """
+        Notifies each listener about new event.
+        Returns result of folding values returned by listeners:
+        function(function(initial, v1), v2)...
+        """
+        return await self._reduce(name, event, function, initial)
+
+    async def _reduce(self, name, event, function, result):
+        """
+        Notifies listeners and folds their values with given function;
+        no function means stopping at the first value other than None
+        """
+        event.start_propagation().name = name
+        for entry in self._select(name, event):
+            if event.is_propagation_stopped():
+                break
+            if entry[1] is not None:
+                value = entry[1](event)
+            else:
+                value = await _call(entry, event)
+            if function is not None:
+                result = function(result, value)
+            elif value is not None:
+                event.mark_processed()
+                return value
+        return result
+
+    async def notify_parallel(self, name, event, limit=None):
+        """
+        Notifies listeners about new event concurrently.
+
+        Listeners with the same priority are awaited together (at most
+        'limit' of them at once); next priority band is notified once
+        the previous one finishes. Propagation is checked between bands.
+        Raises ListenerErrors when any listener in a band fails.
+        Returns the event
+        """
+        event.start_propagation().name = name
+        semaphore = None if limit is None else asyncio.Semaphore(limit)
+        for band in self._select_bands(name, event):
+            if event.is_propagation_stopped():
+                break
+            errors = []
+            await asyncio.gather(*[_guarded(entry, event, semaphore, errors) \
+                    for entry in band])
+            if errors:
+                raise ListenerErrors(errors)
+        return event
+
+    async def notify_many(self, name, events):
+        """
+        Notifies listeners about each of given events.
+
+        Listeners are resolved once for the whole batch. Listeners marked
+        with 'batched' decorator are called once with list of events
+        (whose propagation has not been stopped and which they accept),
+        the others are called for each event. Returns list of events.
+        """
+        events = list(events)
+        for event in events:
+            event.start_propagation().name = name
+        for entry, accepted in self._select_batches(self._snapshot(name),
+                events):
+            batch = getattr(entry[0], '__batched__', None)
+            if batch is not None:
+                live = [e for e in accepted \
+                        if not e.is_propagation_stopped()]
+                if live:
+                    await _call(self._entry(batch), live)
+                continue
+            for event in accepted:
+                if event.is_propagation_stopped():
+                    continue
+                if entry[1] is not None:
+                    entry[1](event)
+                else:
+                    await _call(entry, event)
+        return events
+
+    async def notify_stream(self, name, events, size=1000):
+        """
+        Notifies listeners about events taken from given iterable
+        in batches of given size (see 'notify_many').
+        Returns number of notified events
+        """
+        events = iter(events)
+        count = 0
+        while True:
+            batch = list(itertools.islice(events, size))
+            if not batch:
+                return count
+            count += len(batch)
+            await self.notify_many(name, batch)
+
+
+class AsyncEventQueue(EventQueue):
+    """
+    EventQueue drained from within asyncio coroutine.
+
+    Dispatcher should be an AsyncDispatcher. Producers running in the
+    event loop must not use BLOCK overflow policy.
+
+    Example:
+
+    queue = AsyncEventQueue(AsyncDispatcher(), 1000, EventQueue.DROP_OLDEST)
+    worker = asyncio.ensure_future(queue.run())
+    queue.put('foo', Event(self))
+    """
+
+    def __init__(self, *args, **kwargs):
+        """
+        Initializes class instance
+        """
+        super(AsyncEventQueue, self).__init__(*args, **kwargs)
+        self._loop = None
+        self._waiter = None
+
+    def _wakeup(self):
+        """
+        Wakes up coroutine waiting for events (from any thread)
+        """
+        super(AsyncEventQueue, self)._wakeup()
+        if self._waiter is not None:
+            self._loop.call_soon_threadsafe(self._waiter.set)
+
+    async def drain(self, limit=None):
+        """
+        Dispatches queued events (at most 'limit' of them) without waiting
+        for new ones. Returns number of dispatched events
+        """
+        count = 0
+        while limit is None or count < limit:
+            with self._condition:
+                item = self._pop()
+            if item is None:
+                break
+            self._dispatched(item)
+            try:
+                item[4].resolve(await self.dispatcher.notify(item[2],
+                        item[3]))
+            except Exception as e:
+                item[4].reject(e)
+            count += 1
+        return count
+
+    async def run(self):
+        """
+        Dispatches queued events, waiting for new ones,
+        until the queue is closed and empty
+        """
+        self._loop = asyncio.get_event_loop()
+        self._waiter = asyncio.Event()
+        try:
+            while True:
+                with self._condition:
+                    self._waiter.clear()
+                    if not self._size and self._closed:
+                        return
+                if not await self.drain():
+                    await self._waiter.wait()
+        finally:
+            self._waiter = None
+
+    def close(self):
+        """
+        Stops 'run' loops once queued events are dispatched
+        """
+        super(AsyncEventQueue, self).close()
+        with self._condition:
+            self._wakeup()
+
+
+def _call_deferred(listener, event):
+    """
+    Calls (event, deferred) listener and returns future
+    bound to state of the deferred
+    """
+    loop = asyncio.get_event_loop()
+    future = loop.create_future()
+    thread = threading.current_thread()
+
+    def settle(method, value):
+        if future.done():
+            return
+        if threading.current_thread() is thread:
+            method(value)
+        else:
+            loop.call_soon_threadsafe(
+                    lambda: future.done() or method(value))
+
+    def done(*args, **kwargs):
+        settle(future.set_result, args[0] if args else None)
+
+    def fail(*args, **kwargs):
+        settle(future.set_exception, _error(args))
+
+    Deferred(lambda deferred: listener(event, deferred=deferred))\
+            .done(done).fail(fail)
+    return future
+
+
+async def _call(entry, event):
+    """
+    Calls listener of given compiled entry and returns its value
+    """
+    if entry[1] is not None:
+        return entry[1](event)
+    if entry[2] is not None:
+        return await _result(entry[2](event))
+    return await _call_deferred(entry[0], event)
+
+
+async def _guarded(entry, event, semaphore, errors):
+    """
+    Calls listener of given compiled entry (once the semaphore, if any,
+    lets it) and collects its error
+    """
+    try:
+        if semaphore is None:
+            await _call(entry, event)
+        else:
+            async with semaphore:
+                await _call(entry, event)
+    except Exception as e:
+        errors.append(e)
+
+
+def _timed(wrapper, coroutine):
+    """
+    Returns coroutine function cancelling coroutine listener wrapped
+    by 'timed' once it does not finish in time
+    """
+    async def call(event):
+        awaitable = coroutine(event)
+        if awaitable is None:
+            return None
+        try:
+            return await asyncio.wait_for(awaitable, wrapper.timeout)
+        except asyncio.TimeoutError:
+            if wrapper.skip:
+                return None
+            raise wrapper._timeout_error()
+    return call
+
+
+def _broken(wrapper, coroutine):
+    """
+    Returns coroutine function calling coroutine listener wrapped
+    by CircuitBreaker only when the circuit lets it through
+    """
+    async def call(event):
+        if not wrapper._admit():
+            return None
+        try:
+            value = await _result(coroutine(event))
+        except Exception:
+            wrapper._record(True)
+            raise
+        wrapper._record(False)
+        return value
+    return call
+
+
+def _cached(wrapper, coroutine):
+    """
+    Returns coroutine function awaiting coroutine listener wrapped
+    by ListenerCache on cache miss. Concurrent calls with the same key
+    await the same task
+    """
+    def settle(key, task):
+        with wrapper._lock:
+            del wrapper._pending[key]
+            if not task.cancelled() and task.exception() is None:
+                wrapper._store(key, task.result())
+
+    async def call(event):
+        key = wrapper._key(event)
+        if key is _UNHASHABLE:
+            return await _result(coroutine(event))
+        with wrapper._lock:
+            hit, value = wrapper._get(key)
+            if hit:
+                return value
+            task = wrapper._pending.get(key)
+            if task is None:
+                wrapper.misses += 1
+                task = asyncio.ensure_future(_result(coroutine(event)))
+                task.add_done_callback(partial(settle, key))
+                wrapper._pending[key] = task
+            else:
+                wrapper.collapsed += 1
+        # cancelled caller does not cancel the call awaited by others
+        return await asyncio.shield(task)
+    return call
+
+
+async def _result(awaitable):
+    """
+    Returns result of given awaitable (None for no awaitable)
+    """
+    return None if awaitable is None else await awaitable
@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Cross-process event bus for pyevent.
+
+Forwards selected events between Dispatchers living in different
+processes of the same machine (e.g. pre-forked workers) using Unix domain
+datagram sockets placed in a shared directory. No broker is needed: every
+process binds its own socket and sends events to all the other sockets
+found in the directory.
+
+Example:
+
+bus = SocketBus(dispatcher, '/run/myapp/bus', ['cache.invalidate'])
+dispatcher.notify('cache.invalidate', Event(self, {'key': 'foo'}))
+bus.flush()
+...
+# in sibling processes (e.g. when bus.fileno() is readable)
+bus.receive()
+"""
+import errno
+import marshal
+import os
+import socket
+import struct
+
+from pyevent import Event, synchronous
+
+
+# frame: total length, name length, name (utf-8), marshalled parameters
+_FRAME = struct.Struct('<IH')
+
+
+def pack_event(name, parameters):
+    """
+    Serializes event name and parameters into a binary frame.
+    Parameters have to be built of Python builtin types
+    (see 'marshal' module)
+    """
+    name = name.encode('utf-8')
+    data = marshal.dumps(parameters, 2)
+    return _FRAME.pack(_FRAME.size + len(name) + len(data), len(name)) + \
+            name + data
+
+
+def unpack_events(data):
+    """
+    Deserializes frames produced by 'pack_event'.
+    Yields (name, parameters) tuples
+    """
+    offset = 0
+    while offset < len(data):
+        length, name_length = _FRAME.unpack_from(data, offset)
+        start = offset + _FRAME.size
+        name = data[start:start + name_length].decode('utf-8')
+        parameters = marshal.loads(data[start + name_length:offset + length])
+        yield (name, parameters)
+        offset += length
+
+
+class SocketBus(object):
+    """
+    Forwards events between processes over Unix domain datagram sockets.
+
+    Events forwarded from other processes are notified to the local
+    dispatcher with the bus as the subject, and are never forwarded back.
+    Frames of forwarded events are buffered and sent in a single datagram
+    once 'batch' events are buffered, the datagram would exceed
+    'max_datagram' bytes or 'flush' is called.
+    When receive queue of other process is full the datagram is dropped,
+    unless 'timeout' is given - then sending waits up to 'timeout' seconds
+    (None means wait as long as needed). Events whose frame alone exceeds
+    'max_datagram' bytes are not forwarded at all. Dropped events are
+    counted (once per peer) in 'dropped'.
+    """
+
+    def __init__(self, dispatcher, directory, names=(), batch=1,
+            max_datagram=65000, priority=0, ident=None, timeout=0):
+        """
+        Initializes class instance.
+
+        dispatcher - local dispatcher
+        directory - directory shared by all processes on the bus
+        names - names of events to forward to other processes
+        batch - number of events sent in single datagram
+        max_datagram - maximal size of datagram
+        priority - priority of forwarding listener
+        ident - name of this process' socket (defaults to process id)
+        timeout - how long to wait for other process to receive events
+        """
+        self.dispatcher = dispatcher
+        self.directory = directory
+        self.batch = batch
+        self.max_datagram = max_datagram
+        self.priority = priority
+        self.path = os.path.join(directory, '%s.sock' % (ident or os.getpid()))
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self._frames = []
+        self._size = 0
+        self._listener = synchronous(self._forward)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(self.path)
+        self.socket.setblocking(False)
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.settimeout(timeout)
+        for name in names:
+            self.forward(name)
+
+    def forward(self, name):
+        """
+        Starts forwarding events with given name to other processes
+        """
+        self.dispatcher.attach(name, self._listener, self.priority)
+        return self
+
+    def forward_pattern(self, pattern):
+        """
+        Starts forwarding events matching given pattern
+        (see Dispatcher.attach_pattern) to other processes
+        """
+        self.dispatcher.attach_pattern(pattern, self._listener, self.priority)
+        return self
+
+    def stop_forwarding(self, name):
+        """
+        Stops forwarding events with given name
+        """
+        self.dispatcher.detach(name, self._listener)
+        return self
+
+    def _forward(self, event):
+        """
+        Buffers frame of given event
+        """
+        if event.subject is self:
+            return
+        frame = pack_event(event.name, event.parameters)
+        if len(frame) > self.max_datagram:
+            # would be truncated by receivers
+            self.dropped += len(self.peers())
+            return
+        if self._size + len(frame) > self.max_datagram:
+            self.flush()
+        self._frames.append(frame)
+        self._size += len(frame)
+        if len(self._frames) >= self.batch:
+            self.flush()
+
+    def peers(self):
+        """
+        Returns paths of sockets of the other processes
+        """
+        return [os.path.join(self.directory, f) for f in \
+                os.listdir(self.directory) if f.endswith('.sock') and \
+                os.path.join(self.directory, f) != self.path]
+
+    def flush(self):
+        """
+        Sends buffered events to all other processes
+        """
+        if not self._frames:
+            return
+        data = b''.join(self._frames)
+        count = len(self._frames)
+        self._frames = []
+        self._size = 0
+        for peer in self.peers():
+            try:
+                self._sender.sendto(data, peer)
+                self.sent += count
+            except socket.timeout:
+                self.dropped += count
+            except socket.error as e:
+                if e.errno in (errno.ECONNREFUSED, errno.ENOENT):
+                    # socket left by dead process
+                    try:
+                        os.unlink(peer)
+                    except OSError:
+                        pass
+                elif e.errno in (errno.EAGAIN, errno.EWOULDBLOCK,
+                        errno.ENOBUFS):
+                    # peer does not keep up
+                    self.dropped += count
+                else:
+                    raise
+
+    def fileno(self):
+        """
+        Returns file descriptor of the socket (readable when there are
+        events to receive)
+        """
+        return self.socket.fileno()
+
+    def receive(self, limit=None):
+        """
+        Notifies local dispatcher about events sent by other processes.
+        Does not block. Returns number of received events
+        """
+        count = 0
+        while limit is None or count < limit:
+            try:
+                data = self.socket.recv(self.max_datagram)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            for name, parameters in unpack_events(data):
+                self.dispatcher.notify(name, Event(self, parameters))
+                count += 1
+        self.received += count
+        return count
+
+    def close(self):
+        """
+        Flushes buffered events and removes the socket
+        """
+        self.flush()
+        self.socket.close()
+        self._sender.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Event journal for pyevent.
+
+Appends dispatched events (name, parameters, timestamp) to append-only
+segment files of length-prefixed binary records, so they can be read back
+(e.g. to reconstruct state after a crash) or replayed against another
+dispatcher.
+
+Example:
+
+journal = Journal('/var/lib/myapp/journal').attach(dispatcher)
+...
+journal.close()
+...
+replay('/var/lib/myapp/journal', Dispatcher(), speed=10)
+"""
+import marshal
+import mmap
+import os
+import struct
+import threading
+import time
+
+from pyevent import Event, synchronous
+
+
+# record: total length, name length, timestamp, name (utf-8),
+# marshalled parameters
+_RECORD = struct.Struct('<IHd')
+_SUFFIX = '.log'
+
+
+def pack_record(timestamp, name, parameters):
+    """
+    Serializes event into a binary record.
+    Parameters have to be built of Python builtin types
+    (see 'marshal' module)
+    """
+    name = name.encode('utf-8')
+    data = marshal.dumps(parameters, 2)
+    return _RECORD.pack(_RECORD.size + len(name) + len(data), len(name),
+            timestamp) + name + data
+
+
+def segments(directory):
+    """
+    Returns paths of journal segments in given directory, oldest first
+    """
+    return [os.path.join(directory, f) for f in \
+            sorted(os.listdir(directory)) if f.endswith(_SUFFIX)]
+
+
+def read_segment(path):
+    """
+    Reads records of single segment through memory map.
+    Yields (timestamp, name, parameters) tuples.
+    Incomplete record at the end (e.g. after a crash) is ignored.
+    """
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            offset = 0
+            size = len(data)
+            while offset + _RECORD.size <= size:
+                length, name_length, timestamp = \
+                        _RECORD.unpack_from(data, offset)
+                if length < _RECORD.size or offset + length > size:
+                    return
+                start = offset + _RECORD.size
+                name = data[start:start + name_length].decode('utf-8')
+                parameters = marshal.loads(
+                        data[start + name_length:offset + length])
+                yield (timestamp, name, parameters)
+                offset += length
+        finally:
+            data.close()
+
+
+def read(log):
+    """
+    Reads records of journal directory (or single segment file).
+    Yields (timestamp, name, parameters) tuples
+    """
+    paths = segments(log) if os.path.isdir(log) else [log]
+    for path in paths:
+        for record in read_segment(path):
+            yield record
+
+
+def replay(log, dispatcher, speed=None, subject=None, clock=None,
+        sleep=None):
+    """
+    Notifies dispatcher about events read from journal directory
+    (or single segment file), one by one.
+
+    When 'speed' is given, original intervals between events are kept
+    (divided by 'speed', so 2 means twice as fast). Listeners finishing
+    asynchronously are not waited for. Returns number of notified events.
+    """
+    clock = clock or getattr(time, 'monotonic', time.time)
+    sleep = sleep or time.sleep
+    count = 0
+    start = first = None
+    for timestamp, name, parameters in read(log):
+        if speed is not None:
+            if first is None:
+                start, first = clock(), timestamp
+            delay = (timestamp - first) / float(speed) - (clock() - start)
+            if delay > 0:
+                sleep(delay)
+        dispatcher.notify(name, Event(subject, parameters))
+        count += 1
+    return count
+
+
+class Journal(object):
+    """
+    Appends events to segment files in given directory.
+
+    Records are buffered and written in groups: when the buffer exceeds
+    'buffer_size' bytes, when 'flush_interval' seconds passed since the
+    last write or on 'flush'. Segment is closed and new one started
+    once it exceeds 'segment_size' bytes. Every Journal instance starts
+    a new segment, existing segments are never changed.
+    """
+
+    def __init__(self, directory, segment_size=64 * 1024 * 1024,
+            buffer_size=64 * 1024, flush_interval=1.0, fsync=False,
+            clock=None):
+        """
+        Initializes class instance.
+        'clock' returns current (wall clock) time in seconds
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.clock = clock or time.time
+        self.records = 0
+        self.listener = synchronous(self._record_event)
+        self._buffer = []
+        self._buffered = 0
+        self._written = 0
+        self._flushed_at = self.clock()
+        self._lock = threading.Lock()
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        existing = segments(directory)
+        self._segment = int(os.path.basename(existing[-1])[:-len(_SUFFIX)]) \
+                if existing else 0
+        self._file = None
+        self._rotate()
+
+    def attach(self, dispatcher, pattern='#', priority=-2 ** 31):
+        """
+        Starts recording events (matching given pattern) notified by given
+        dispatcher. By default journal is notified before other listeners,
+        so events are recorded even when their propagation is stopped
+        """
+        dispatcher.attach_pattern(pattern, self.listener, priority)
+        return self
+
+    def detach(self, dispatcher, pattern='#'):
+        """
+        Stops recording events notified by given dispatcher
+        """
+        dispatcher.detach_pattern(pattern, self.listener)
+        return self
+
+    def _record_event(self, event):
+        """
+        Records notified event
+        """
+        self.record(event.name, event.parameters)
+
+    def record(self, name, parameters, timestamp=None):
+        """
+        Appends event to the journal
+        """
+        now = self.clock()
+        record = pack_record(now if timestamp is None else timestamp, name,
+                parameters)
+        with self._lock:
+            self._buffer.append(record)
+            self._buffered += len(record)
+            self.records += 1
+            if self._buffered >= self.buffer_size or \
+                    now - self._flushed_at >= self.flush_interval:
+                self._flush(now)
+
+    def flush(self):
+        """
+        Writes buffered records to disk
+        """
+        with self._lock:
+            self._flush(self.clock())
+
+    def _flush(self, now):
+        """
+        Writes buffered records. Has to be called with the lock held
+        """
+        self._flushed_at = now
+        if not self._buffer:
+            return
+        data = b''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        if self._written and self._written + len(data) > self.segment_size:
+            self._rotate()
+        self._file.write(data)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        self._written += len(data)
+
+    def _rotate(self):
+        """
+        Closes current segment and starts new one
+        """
+        if self._file is not None:
+            self._file.close()
+        self._segment += 1
+        self.path = os.path.join(self.directory,
+                '%012d%s' % (self._segment, _SUFFIX))
+        self._file = open(self.path, 'ab')
+        self._written = 0
+
+    def close(self):
+        """
+        Writes buffered records and closes current segment
+        """
+        with self._lock:
+            self._flush(self.clock())
+            self._file.close()
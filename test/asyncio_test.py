@@ -0,0 +1,409 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# Uses coroutine syntax, so it is run only by Python 3.5+ (see runtest.py)
+
+##
+# python standard library
+#
+import asyncio
+import threading
+import unittest
+
+##
+# test helpers
+#
+from testutils import mock, IsA
+
+##
+# pypromise modules
+#
+from promise import Deferred
+
+##
+# event modules
+#
+from pyevent import CircuitBreaker, Event, EventQueue, ListenerCache, \
+        ListenerError, ListenerErrors, ListenerTimeout, batched, \
+        synchronous, timed
+from pyevent_asyncio import AsyncDispatcher, AsyncEventQueue
+
+
+def call_deferred(event, deferred):
+    deferred.resolve()
+
+
+class AsyncDispatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.event = Event('test')
+        self.loop = asyncio.new_event_loop()
+        self.calls = []
+
+    def tearDown(self):
+        self.loop.close()
+
+    def run_notify(self, dispatcher, name):
+        return self.loop.run_until_complete(dispatcher.notify(name,
+            self.event))
+
+    def listener(self, value):
+        async def listener(event):
+            await asyncio.sleep(0)
+            self.calls.append(value)
+        return listener
+
+    def test_notify_returns_event(self):
+        self.assertIs(self.event, self.run_notify(AsyncDispatcher(), 'foo'))
+        self.assertEqual('foo', self.event.name)
+
+    def test_notify_awaits_coroutine_listeners_in_priority_order(self):
+        d = AsyncDispatcher()
+        d.attach('foo', self.listener('b'), 20)
+        d.attach('foo', self.listener('a'), 10)
+        d.attach('foo', self.listener('c'), 30)
+
+        self.run_notify(d, 'foo')
+
+        self.assertEqual(['a', 'b', 'c'], self.calls)
+
+    def test_notify_supports_deferred_and_synchronous_listeners(self):
+        d = AsyncDispatcher()
+        foo = mock.MagicMock(side_effect=call_deferred)
+        bar = mock.MagicMock()
+        bar.__name__ = 'bar'
+        d.attach('foo', foo)
+        d.attach('foo', synchronous(bar))
+        d.attach('foo', self.listener('baz'))
+
+        self.run_notify(d, 'foo')
+
+        foo.assert_called_once_with(IsA(Event), deferred=IsA(Deferred))
+        bar.assert_called_once_with(IsA(Event))
+        self.assertEqual(['baz'], self.calls)
+
+    def test_notify_waits_for_deferred_resolved_later(self):
+        d = AsyncDispatcher()
+
+        def later(event, deferred):
+            asyncio.get_event_loop().call_soon(deferred.resolve)
+        d.attach('foo', later)
+        d.attach('foo', self.listener('bar'))
+
+        self.run_notify(d, 'foo')
+
+        self.assertEqual(['bar'], self.calls)
+
+    def test_notify_stops_when_propagation_is_stopped(self):
+        d = AsyncDispatcher()
+
+        async def stop(event):
+            event.stop_propagation()
+        d.attach('foo', stop)
+        d.attach('foo', self.listener('bar'))
+
+        self.run_notify(d, 'foo')
+
+        self.assertEqual([], self.calls)
+
+    def test_notify_awaits_weak_coroutine_method(self):
+        calls = self.calls
+
+        class Foo(object):
+            async def bar(self, event):
+                await asyncio.sleep(0)
+                calls.append('bar')
+        d = AsyncDispatcher()
+        foo = Foo()
+        d.attach('foo', foo.bar, weak=True)
+
+        self.run_notify(d, 'foo')
+
+        self.assertEqual(['bar'], self.calls)
+
+    def test_can_not_be_frozen(self):
+        self.assertRaises(TypeError, AsyncDispatcher().freeze)
+
+    def test_notify_raises_when_deferred_is_rejected(self):
+        d = AsyncDispatcher()
+        d.attach('foo', lambda event, deferred: deferred.reject('err'))
+
+        self.assertRaises(ListenerError, self.run_notify, d, 'foo')
+
+    def test_notify_records_calls_in_profiler(self):
+        async def fail(event):
+            raise ValueError()
+        d = AsyncDispatcher()
+        profiler = d.enable_profiling()
+        d.attach('foo', self.listener('a'))
+        d.attach('foo', synchronous(lambda event: None))
+        d.attach('bar', fail)
+
+        self.run_notify(d, 'foo')
+        self.assertRaises(ValueError, self.run_notify, d, 'bar')
+
+        snapshot = profiler.snapshot()
+        self.assertEqual({'notifications': 1, 'stopped': 0, 'failures': 0},
+                snapshot['events']['foo'])
+        self.assertEqual(1, snapshot['events']['bar']['failures'])
+        self.assertEqual([(0, 1), (1, 0)], sorted((s['sync'],
+            s['deferred']) for s in snapshot['listeners']['foo']))
+
+    def test_notify_awaits_timed_coroutine_listener(self):
+        d = AsyncDispatcher()
+        d.attach('foo', self.listener('bar'), timeout=10)
+
+        self.run_notify(d, 'foo')
+
+        self.assertEqual(['bar'], self.calls)
+
+    def test_timed_coroutine_listener_is_cancelled(self):
+        async def slow(event):
+            await asyncio.sleep(10)
+            self.calls.append('slow')
+        d = AsyncDispatcher()
+        d.attach('foo', slow, timeout=0.01)
+        d.attach('foo', self.listener('bar'))
+
+        self.assertRaises(ListenerTimeout, self.run_notify, d, 'foo')
+        self.assertEqual([], self.calls)
+
+    def test_timed_coroutine_listener_is_skipped(self):
+        async def slow(event):
+            await asyncio.sleep(10)
+        d = AsyncDispatcher()
+        d.attach('foo', timed(slow, 0.01, skip=True))
+        d.attach('foo', self.listener('bar'))
+
+        self.run_notify(d, 'foo')
+
+        self.assertEqual(['bar'], self.calls)
+
+    def test_notify_with_timeout_stops_propagation(self):
+        async def slow(event):
+            await asyncio.sleep(10)
+        d = AsyncDispatcher()
+        d.attach('foo', slow)
+        d.attach('foo', self.listener('bar'))
+
+        self.assertRaises(ListenerTimeout, self.loop.run_until_complete,
+                d.notify('foo', self.event, 0.01))
+        self.assertTrue(self.event.is_propagation_stopped())
+        self.assertEqual([], self.calls)
+
+    def test_circuit_breaker_of_coroutine_listener(self):
+        async def fail(event):
+            raise ValueError()
+        breaker = CircuitBreaker(fail, min_calls=1, cooldown=60)
+        d = AsyncDispatcher()
+        d.attach('foo', breaker)
+
+        self.assertRaises(ValueError, self.run_notify, d, 'foo')
+        self.run_notify(d, 'foo')
+
+        self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+        self.assertEqual(1, breaker.skipped)
+
+    def test_coroutine_listener_results_are_cached(self):
+        async def price(event):
+            await asyncio.sleep(0)
+            self.calls.append(event.parameters['sku'])
+            return event.parameters['sku'] * 10
+        d = AsyncDispatcher()
+        d.attach('foo', price, cache=True)
+
+        def notify(*skus):
+            return asyncio.gather(*[d.notify('foo', Event(None,
+                {'sku': sku})) for sku in skus])
+
+        async def run():
+            await notify(1, 1, 2)
+            await notify(1)
+        self.loop.run_until_complete(run())
+
+        listener = next(d.get_listeners('foo'))
+        self.assertIsInstance(listener, ListenerCache)
+        self.assertEqual([1, 2], self.calls)
+        self.assertEqual({'hits': 1, 'misses': 2, 'evictions': 0,
+            'collapsed': 1, 'size': 2}, listener.snapshot())
+
+    def test_coroutine_listener_failures_are_not_cached(self):
+        async def fail(event):
+            self.calls.append('fail')
+            raise ValueError()
+        d = AsyncDispatcher()
+        d.attach('foo', fail, cache=True)
+
+        for i in range(2):
+            self.assertRaises(ValueError, self.run_notify, d, 'foo')
+
+        self.assertEqual(['fail', 'fail'], self.calls)
+
+    def value(self, value):
+        async def listener(event):
+            await asyncio.sleep(0)
+            self.calls.append(value)
+            return value
+        return listener
+
+    def complete(self, awaitable):
+        return self.loop.run_until_complete(awaitable)
+
+    def test_notify_collect(self):
+        d = AsyncDispatcher()
+        d.attach('foo', self.value(1))
+        d.attach('foo', synchronous(lambda event: 2))
+        d.attach('foo', lambda event, deferred: deferred.resolve(3))
+
+        self.assertEqual([1, 2, 3], self.complete(d.notify_collect('foo',
+            self.event)))
+
+    def test_notify_until(self):
+        d = AsyncDispatcher()
+        d.attach('foo', self.value(None))
+        d.attach('foo', self.value('bar'))
+        d.attach('foo', self.value('baz'))
+
+        self.assertEqual('bar', self.complete(d.notify_until('foo',
+            self.event)))
+        self.assertTrue(self.event.is_processed())
+        self.assertEqual([None, 'bar'], self.calls)
+
+    def test_notify_reduce(self):
+        d = AsyncDispatcher()
+        d.attach('foo', self.value(1))
+        d.attach('foo', self.value(2))
+
+        self.assertEqual(13, self.complete(d.notify_reduce('foo', self.event,
+            lambda a, b: a + b, 10)))
+
+    def test_notify_parallel_awaits_band_together(self):
+        started = []
+
+        async def listener(event):
+            started.append(len(self.calls))
+            await asyncio.sleep(0)
+            self.calls.append('a')
+        d = AsyncDispatcher()
+        d.attach('foo', listener, 0)
+        d.attach('foo', listener, 0)
+        d.attach('foo', self.listener('b'), 1)
+
+        self.assertIs(self.event, self.complete(d.notify_parallel('foo',
+            self.event)))
+        self.assertEqual([0, 0], started)
+        self.assertEqual(['a', 'a', 'b'], self.calls)
+
+    def test_notify_parallel_limit(self):
+        running = []
+
+        async def listener(event):
+            running.append(None)
+            self.calls.append(len(running))
+            await asyncio.sleep(0)
+            running.pop()
+        d = AsyncDispatcher()
+        for i in range(4):
+            d.attach('foo', listener)
+
+        self.complete(d.notify_parallel('foo', self.event, 2))
+
+        self.assertEqual(2, max(self.calls))
+
+    def test_notify_parallel_raises_errors_of_band(self):
+        async def fail(event):
+            raise ValueError()
+        d = AsyncDispatcher()
+        d.attach('foo', fail, 0)
+        d.attach('foo', self.listener('a'), 0)
+        d.attach('foo', self.listener('b'), 1)
+
+        with self.assertRaises(ListenerErrors) as context:
+            self.complete(d.notify_parallel('foo', self.event))
+        self.assertEqual(1, len(context.exception.errors))
+        self.assertEqual(['a'], self.calls)
+
+    def test_notify_parallel_selects_filtered_listeners(self):
+        d = AsyncDispatcher()
+        d.attach('foo', self.listener('a'), where={'x': 1})
+        d.attach('foo', self.listener('b'), where={'x': 2})
+
+        self.complete(d.notify_parallel('foo', Event(None, {'x': 2})))
+
+        self.assertEqual(['b'], self.calls)
+
+    def test_notify_many(self):
+        async def batch(events):
+            self.calls.append(len(events))
+        d = AsyncDispatcher()
+        d.attach('foo', self.value('a'), where={'x': 1})
+        d.attach('foo', batched(batch))
+        events = [Event(None, {'x': x}) for x in (1, 2)]
+
+        self.assertEqual(events, self.complete(d.notify_many('foo', events)))
+        self.assertEqual(['a', 2], self.calls)
+
+    def test_notify_stream(self):
+        d = AsyncDispatcher()
+        d.attach('foo', self.value('a'))
+
+        self.assertEqual(3, self.complete(d.notify_stream('foo',
+            (Event(None) for i in range(3)), 2)))
+        self.assertEqual(['a'] * 3, self.calls)
+
+
+class AsyncEventQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.calls = []
+        self.dispatcher = AsyncDispatcher()
+
+        async def listener(event):
+            await asyncio.sleep(0)
+            self.calls.append(event)
+        self.dispatcher.attach('foo', listener)
+
+    def tearDown(self):
+        asyncio.set_event_loop(None)
+        self.loop.close()
+
+    def test_drain(self):
+        q = AsyncEventQueue(self.dispatcher)
+        e = Event(None)
+        callback = mock.MagicMock()
+        q.put('foo', e).done(callback)
+        self.assertEqual(1, self.loop.run_until_complete(q.drain()))
+        self.assertEqual([e], self.calls)
+        callback.assert_called_once_with(e)
+
+    def test_run_waits_for_events(self):
+        q = AsyncEventQueue(self.dispatcher)
+        events = [Event(None) for i in range(3)]
+
+        async def produce():
+            for e in events:
+                await asyncio.sleep(0.001)
+                q.put('foo', e)
+            q.close()
+
+        self.loop.run_until_complete(asyncio.gather(q.run(), produce()))
+        self.assertEqual(events, self.calls)
+
+    def test_run_with_producer_thread(self):
+        q = AsyncEventQueue(self.dispatcher, 1, EventQueue.BLOCK)
+        events = [Event(None) for i in range(20)]
+
+        def produce():
+            for e in events:
+                q.put('foo', e)
+            q.close()
+        producer = threading.Thread(target=produce)
+        producer.start()
+        self.loop.run_until_complete(q.run())
+        producer.join()
+        self.assertEqual(events, self.calls)
+
+
+if "__main__" == __name__:
+    unittest.main()
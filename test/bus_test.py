@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# python standard library
+#
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+##
+# test helpers
+#
+from testutils import mock
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher, synchronous
+from pyevent_bus import SocketBus, pack_event, unpack_events
+
+
+class CodecTestCase(unittest.TestCase):
+
+    def test_pack_and_unpack_single_event(self):
+        data = pack_event('foo', {'key': 'bar', 'n': [1, 2.5, None]})
+        self.assertEqual([('foo', {'key': 'bar', 'n': [1, 2.5, None]})],
+                list(unpack_events(data)))
+
+    def test_unpack_concatenated_frames(self):
+        data = pack_event('foo', {}) + pack_event(u'bąr', {'a': 1})
+        self.assertEqual([('foo', {}), (u'bąr', {'a': 1})],
+                list(unpack_events(data)))
+
+    def test_pack_rejects_unsupported_parameters(self):
+        self.assertRaises(ValueError, pack_event, 'foo', {'a': object()})
+
+
+@unittest.skipUnless(hasattr(socket, 'AF_UNIX'), 'Unix sockets unavailable')
+class SocketBusTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.local = Dispatcher()
+        self.remote = Dispatcher()
+        self.buses = []
+
+    def tearDown(self):
+        for bus in self.buses:
+            bus.close()
+        shutil.rmtree(self.directory)
+
+    def bus(self, dispatcher, ident, *args, **kwargs):
+        bus = SocketBus(dispatcher, self.directory, *args, ident=ident,
+                **kwargs)
+        self.buses.append(bus)
+        return bus
+
+    def listener(self, dispatcher, name):
+        m = mock.MagicMock()
+        dispatcher.attach(name, synchronous(m))
+        return m
+
+    def test_forwards_selected_events_to_other_process(self):
+        sender = self.bus(self.local, 'a', ['foo'])
+        receiver = self.bus(self.remote, 'b')
+        m = self.listener(self.remote, 'foo')
+        self.local.notify('foo', Event(None, {'key': 'x'}))
+        self.local.notify('bar', Event(None, {'key': 'y'}))
+        self.assertEqual(1, receiver.receive())
+        event = m.call_args[0][0]
+        self.assertEqual('foo', event.name)
+        self.assertEqual({'key': 'x'}, event.parameters)
+        self.assertIs(receiver, event.subject)
+        self.assertEqual(1, sender.sent)
+
+    def test_receive_without_pending_events_does_not_block(self):
+        receiver = self.bus(self.remote, 'b')
+        self.assertEqual(0, receiver.receive())
+
+    def test_received_events_are_not_forwarded_back(self):
+        self.bus(self.local, 'a', ['foo'])
+        receiver = self.bus(self.remote, 'b', ['foo'])
+        self.local.notify('foo', Event(None))
+        self.assertEqual(1, receiver.receive())
+        self.assertEqual(0, receiver.sent)
+
+    def test_broadcasts_to_all_peers(self):
+        third = Dispatcher()
+        self.bus(self.local, 'a', ['foo'])
+        receivers = [self.bus(self.remote, 'b'), self.bus(third, 'c')]
+        self.local.notify('foo', Event(None))
+        self.assertEqual([1, 1], [r.receive() for r in receivers])
+
+    def test_batches_events_in_single_datagram(self):
+        sender = self.bus(self.local, 'a', ['foo'], batch=3)
+        receiver = self.bus(self.remote, 'b')
+        m = self.listener(self.remote, 'foo')
+        for i in range(2):
+            self.local.notify('foo', Event(None, {'i': i}))
+        self.assertEqual(0, receiver.receive())
+        sender.flush()
+        self.assertEqual(2, receiver.receive())
+        self.assertEqual([0, 1], [c[0][0].parameters['i'] \
+                for c in m.call_args_list])
+
+    def test_flushes_when_batch_is_full(self):
+        self.bus(self.local, 'a', ['foo'], batch=2)
+        receiver = self.bus(self.remote, 'b')
+        for i in range(5):
+            self.local.notify('foo', Event(None, {'i': i}))
+        self.assertEqual(4, receiver.receive())
+
+    def test_flushes_before_exceeding_max_datagram(self):
+        self.bus(self.local, 'a', ['foo'], batch=100, max_datagram=100)
+        receiver = self.bus(self.remote, 'b')
+        for i in range(3):
+            self.local.notify('foo', Event(None, {'data': 'x' * 40}))
+        self.assertEqual(2, receiver.receive())
+
+    def test_drops_events_when_peer_does_not_keep_up(self):
+        sender = self.bus(self.local, 'a', ['foo'])
+        receiver = self.bus(self.remote, 'b')
+        for i in range(5000):
+            self.local.notify('foo', Event(None))
+        self.assertTrue(sender.dropped > 0)
+        self.assertEqual(5000, sender.sent + sender.dropped)
+        self.assertEqual(sender.sent, receiver.receive())
+
+    def test_drops_events_exceeding_max_datagram(self):
+        sender = self.bus(self.local, 'a', ['foo'], batch=10,
+                max_datagram=1000)
+        receiver = self.bus(self.remote, 'b')
+        m = self.listener(self.remote, 'foo')
+        self.local.notify('foo', Event(None, {'i': 1}))
+        self.local.notify('foo', Event(None, {'data': 'x' * 100000}))
+        self.local.notify('foo', Event(None, {'i': 2}))
+        sender.flush()
+        self.assertEqual(2, receiver.receive())
+        self.assertEqual([1, 2], [c[0][0].parameters['i'] \
+                for c in m.call_args_list])
+        self.assertEqual(1, sender.dropped)
+
+    def test_forward_pattern(self):
+        self.bus(self.local, 'a').forward_pattern('cache.*')
+        receiver = self.bus(self.remote, 'b')
+        self.local.notify('cache.invalidate', Event(None))
+        self.local.notify('other', Event(None))
+        self.assertEqual(1, receiver.receive())
+
+    def test_stop_forwarding(self):
+        self.bus(self.local, 'a', ['foo']).stop_forwarding('foo')
+        receiver = self.bus(self.remote, 'b')
+        self.local.notify('foo', Event(None))
+        self.assertEqual(0, receiver.receive())
+
+    def test_removes_sockets_of_dead_processes(self):
+        self.bus(self.local, 'a', ['foo'])
+        dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        path = os.path.join(self.directory, 'dead.sock')
+        dead.bind(path)
+        dead.close()
+        self.local.notify('foo', Event(None))
+        self.assertFalse(os.path.exists(path))
+
+    def test_close_removes_socket(self):
+        bus = SocketBus(self.local, self.directory, ident='a')
+        bus.close()
+        self.assertEqual([], os.listdir(self.directory))
+
+
+if "__main__" == __name__:
+    unittest.main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# python standard library
+#
+import unittest
+
+##
+# test helpers
+#
+from testutils import mock
+from fixtures import Clock
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher, ListenerCache, cached, synchronous
+
+
+def sku(event):
+    return event.parameters['sku']
+
+
+class ListenerCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.pending = []
+        self.dispatcher = Dispatcher()
+
+    def price(self, event):
+        self.calls.append(event.parameters['sku'])
+        return event.parameters['sku'] * 10
+
+    def slow_price(self, event, deferred):
+        self.calls.append(event.parameters['sku'])
+        self.pending.append((deferred, event.parameters['sku'] * 10))
+
+    def collect(self, sku, name='price'):
+        cb = mock.MagicMock()
+        self.dispatcher.notify_collect(name, Event(None, {'sku': sku}))\
+                .done(cb)
+        return cb
+
+    def test_hit_skips_listener(self):
+        listener = cached(synchronous(self.price), sku)
+        self.dispatcher.attach('price', listener)
+        self.collect(1).assert_called_once_with([10])
+        self.collect(1).assert_called_once_with([10])
+        self.collect(2).assert_called_once_with([20])
+        self.assertEqual([1, 2], self.calls)
+        self.assertEqual(1, listener.hits)
+        self.assertEqual(2, listener.misses)
+
+    def test_synchronous_listener_stays_synchronous(self):
+        listener = cached(synchronous(self.price), sku)
+        self.assertTrue(listener.__synchronous__ is not None)
+        self.dispatcher.attach('price', listener)
+        event = Event(None, {'sku': 3})
+        self.dispatcher.notify_sync('price', event)
+        self.dispatcher.notify_sync('price', event)
+        self.assertEqual([3], self.calls)
+
+    def test_default_key_is_built_of_parameters(self):
+        listener = cached(synchronous(self.price))
+        self.dispatcher.attach('price', listener)
+        self.collect(1)
+        self.collect(1)
+        self.assertEqual(1, len(self.calls))
+
+    def test_attach_option(self):
+        self.dispatcher.attach('price', synchronous(self.price), cache=sku)
+        self.collect(1)
+        self.collect(1)
+        self.assertEqual([1], self.calls)
+        self.assertIsInstance(next(self.dispatcher.get_listeners('price')),
+                ListenerCache)
+
+    def test_detach_by_wrapped_listener(self):
+        listener = synchronous(self.price)
+        self.dispatcher.attach('price', listener, cache=True)
+        self.dispatcher.detach('price', listener)
+        self.assertFalse('price' in self.dispatcher)
+
+    def test_lru_eviction(self):
+        listener = cached(synchronous(self.price), sku, size=2)
+        self.dispatcher.attach('price', listener)
+        for key in (1, 2, 1, 3, 1, 2):
+            self.collect(key)
+        self.assertEqual([1, 2, 3, 2], self.calls)
+        self.assertEqual(2, listener.evictions)
+        self.assertEqual(2, len(listener))
+
+    def test_ttl(self):
+        clock = Clock()
+        listener = cached(synchronous(self.price), sku, ttl=5, clock=clock)
+        self.dispatcher.attach('price', listener)
+        self.collect(1)
+        clock.now = 4
+        self.collect(1)
+        clock.now = 5
+        self.collect(1)
+        self.assertEqual([1, 1], self.calls)
+
+    def test_deferred_listener_result_is_cached(self):
+        listener = cached(self.slow_price, sku)
+        self.dispatcher.attach('price', listener)
+        cb = self.collect(1)
+        deferred, value = self.pending.pop()
+        deferred.resolve(value)
+        cb.assert_called_once_with([10])
+        self.collect(1).assert_called_once_with([10])
+        self.assertEqual([1], self.calls)
+
+    def test_concurrent_calls_are_collapsed(self):
+        listener = cached(self.slow_price, sku)
+        self.dispatcher.attach('price', listener)
+        callbacks = [self.collect(1) for i in range(3)]
+        self.assertEqual([1], self.calls)
+        for cb in callbacks:
+            cb.assert_never_called()
+        deferred, value = self.pending.pop()
+        deferred.resolve(value)
+        for cb in callbacks:
+            cb.assert_called_once_with([10])
+        self.assertEqual(2, listener.collapsed)
+
+    def test_failures_are_not_cached(self):
+        listener = cached(self.slow_price, sku)
+        self.dispatcher.attach('price', listener)
+        failed = [mock.MagicMock() for i in range(2)]
+        for cb in failed:
+            self.dispatcher.notify('price', Event(None, {'sku': 1}))\
+                    .fail(cb)
+        self.pending.pop()[0].reject('error')
+        for cb in failed:
+            cb.assert_called_once_with('error')
+        self.collect(1)
+        self.assertEqual([1, 1], self.calls)
+
+    def test_exception_releases_pending_key(self):
+        listener = cached(mock.MagicMock(side_effect=ValueError), sku)
+        self.dispatcher.attach('price', listener)
+        for i in range(2):
+            self.assertRaises(ValueError, self.dispatcher.notify, 'price',
+                    Event(None, {'sku': 1}))
+        self.assertEqual(2, listener.misses)
+
+    def test_events_with_unhashable_keys_are_not_cached(self):
+        listener = cached(synchronous(self.price))
+        self.dispatcher.attach('price', listener)
+        for i in range(2):
+            self.dispatcher.notify('price', Event(None, {'sku': [1]}))
+            self.dispatcher.notify_sync('price', Event(None, {'sku': [1]}))
+        self.assertEqual([[1]] * 4, self.calls)
+        self.assertEqual(4, listener.misses)
+        self.assertEqual(0, len(listener))
+
+    def test_events_with_parameters_of_mixed_types_are_not_cached(self):
+        listener = cached(mock.MagicMock(side_effect=lambda event, deferred: \
+                deferred.resolve()))
+        self.dispatcher.attach('price', listener)
+        for i in range(2):
+            self.dispatcher.notify('price', Event(None, {1: 'a', 'b': 2}))
+        self.assertEqual(2, listener.listener.call_count)
+        self.assertEqual(2, listener.misses)
+        self.assertEqual({'deferred': mock.ANY},
+                listener.listener.call_args[1])
+
+    def test_clear_and_snapshot(self):
+        listener = cached(synchronous(self.price), sku, size=1)
+        self.dispatcher.attach('price', listener)
+        for key in (1, 1, 2):
+            self.collect(key)
+        self.assertEqual({'hits': 1, 'misses': 2, 'evictions': 1,
+            'collapsed': 0, 'size': 1}, listener.snapshot())
+        listener.clear()
+        self.assertEqual(0, len(listener))
+
+
+if "__main__" == __name__:
+    unittest.main()
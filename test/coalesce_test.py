@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# python standard library
+#
+import unittest
+
+##
+# test helpers
+#
+from testutils import mock
+from fixtures import Clock
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher, Coalescer, LastWins, MergeByKey, \
+        CountFlush, synchronous
+
+
+class CoalescerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.dispatcher = Dispatcher()
+        self.listener = mock.MagicMock()
+        self.dispatcher.attach('foo', synchronous(self.listener))
+        self.coalescer = Coalescer(self.dispatcher, clock=self.clock)
+
+    def dispatched(self):
+        return [c[0][0] for c in self.listener.call_args_list]
+
+    def test_events_without_policy_are_dispatched_immediately(self):
+        e = Event(None)
+        self.coalescer.notify('foo', e)
+        self.assertEqual([e], self.dispatched())
+
+    def test_last_wins_within_window(self):
+        self.coalescer.policy('foo', LastWins(1))
+        events = [Event(None) for i in range(5)]
+        for e in events:
+            self.coalescer.notify('foo', e)
+        self.assertEqual([], self.dispatched())
+        self.assertEqual(1, len(self.coalescer))
+        self.clock.now = 1
+        self.assertEqual(1, self.coalescer.poll())
+        self.assertEqual([events[-1]], self.dispatched())
+        self.assertEqual(0, len(self.coalescer))
+
+    def test_window_is_counted_from_the_first_event(self):
+        self.coalescer.policy('foo', LastWins(1))
+        self.coalescer.notify('foo', Event(None))
+        self.clock.now = 0.5
+        self.coalescer.notify('foo', Event(None))
+        self.assertEqual(0.5, self.coalescer.timeout())
+        self.clock.now = 1
+        self.assertEqual(1, self.coalescer.poll())
+
+    def test_expired_window_is_dispatched_on_notify(self):
+        self.coalescer.policy('foo', LastWins(1))
+        first = Event(None)
+        self.coalescer.notify('foo', first)
+        self.clock.now = 2
+        second = Event(None)
+        self.coalescer.notify('foo', second)
+        self.assertEqual([second], self.dispatched())
+
+    def test_superseded_events_share_promise(self):
+        self.coalescer.policy('foo', LastWins(1))
+        callbacks = [mock.MagicMock() for i in range(3)]
+        events = [Event(None) for i in range(3)]
+        for e, callback in zip(events, callbacks):
+            self.coalescer.notify('foo', e).done(callback)
+        callbacks[0].assert_never_called()
+        self.coalescer.flush()
+        for callback in callbacks:
+            callback.assert_called_once_with(events[-1])
+
+    def test_merge_by_key(self):
+        self.coalescer.policy('foo',
+                MergeByKey(lambda e: e.parameters['key'], 1))
+        for key in ('a', 'b', 'a', 'a', 'b'):
+            self.coalescer.notify('foo', Event(None, {'key': key}))
+        self.assertEqual(2, len(self.coalescer))
+        self.clock.now = 1
+        self.coalescer.poll()
+        self.assertEqual(['a', 'b'], sorted(e.parameters['key'] \
+                for e in self.dispatched()))
+
+    def test_count_flush(self):
+        self.coalescer.policy('foo', CountFlush(3))
+        events = [Event(None) for i in range(7)]
+        for e in events:
+            self.coalescer.notify('foo', e)
+        self.assertEqual([events[2], events[5]], self.dispatched())
+        self.clock.now = 100
+        self.assertEqual(0, self.coalescer.poll())
+        self.assertIsNone(self.coalescer.timeout())
+        self.assertEqual(1, self.coalescer.flush('foo'))
+        self.assertEqual([events[2], events[5], events[6]], self.dispatched())
+
+    def test_count_flush_with_window(self):
+        self.coalescer.policy('foo', CountFlush(3, 1))
+        e = Event(None)
+        self.coalescer.notify('foo', e)
+        self.clock.now = 1
+        self.coalescer.poll()
+        self.assertEqual([e], self.dispatched())
+
+    def test_removing_policy_flushes_pending_events(self):
+        self.coalescer.policy('foo', LastWins(1))
+        e = Event(None)
+        self.coalescer.notify('foo', e)
+        self.coalescer.policy('foo', None)
+        self.assertEqual([e], self.dispatched())
+
+    def test_failure_rejects_all_coalesced_promises(self):
+        d = Dispatcher()
+        d.attach('foo', lambda event, deferred: deferred.reject('error'))
+        coalescer = Coalescer(d, clock=self.clock).policy('foo', LastWins(1))
+        callbacks = [mock.MagicMock() for i in range(2)]
+        for callback in callbacks:
+            coalescer.notify('foo', Event(None)).fail(callback)
+        coalescer.flush()
+        for callback in callbacks:
+            callback.assert_called_once_with('error')
+
+    def test_counters(self):
+        self.coalescer.policy('foo', LastWins(1))
+        for i in range(10):
+            self.coalescer.notify('foo', Event(None))
+        self.coalescer.flush()
+        self.assertEqual(10, self.coalescer.received)
+        self.assertEqual(1, self.coalescer.dispatched)
+
+
+if "__main__" == __name__:
+    unittest.main()
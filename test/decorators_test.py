@@ -66,6 +66,11 @@ class DecoratorsTestCase(unittest.TestCase):
         self.assertTrue(sync_notify('foo', d))
         d.resolve.assert_called_once_with(True)
 
+    def test_synchronous_exposes_decorated_function(self):
+        cb = mock.MagicMock()
+        cb.__name__ = 'callback'
+        self.assertIs(cb, synchronous(cb).__synchronous__)
+
 
 if "__main__" == __name__:
     unittest.main()
@@ -4,7 +4,14 @@
 ##
 # python standard library
 #
+import gc
+import sys
+import threading
 import unittest
+try:
+    from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = ProcessPoolExecutor = None
 
 ##
 # test helpers
@@ -19,12 +26,17 @@ from promise import Deferred, Promise
 ##
 # event modules
 #
-from pyevent import Event, Dispatcher
+import pyevent
+from pyevent import Event, Dispatcher, ListenerErrors, synchronous, \
+        executed, batched, FrozenDispatcher, FrozenDispatcherError
 
 
 def call_deferred(event, deferred):
     deferred.resolve()
 
+def square(event):
+    return event.parameters['value'] ** 2
+
 class DispatcherTestCase(unittest.TestCase):
 
     def setUp(self):
@@ -76,6 +88,181 @@ class DispatcherTestCase(unittest.TestCase):
         self.assertEqual('b', next(l))
         self.assertEqual('c', next(l))
 
+    def test_attach_keeps_order_of_listeners_read_between_attaches(self):
+        d = Dispatcher()
+        d.attach('test', 'b', 20)
+        self.assertEqual(['b'], list(d.get_listeners('test')))
+        d.attach('test', 'a', 10)
+        d.attach('other', 'x', 10)
+        self.assertEqual(['x'], list(d.get_listeners('other')))
+        d.attach('test', 'c', 30)
+        self.assertEqual(['a', 'b', 'c'], list(d.get_listeners('test')))
+
+    def test_compiled_listeners_are_reused_until_listeners_change(self):
+        d = Dispatcher()
+        d.attach('test', 'a')
+        d.attach('other', 'x')
+        snapshot = d._snapshot('test')
+        other = d._snapshot('other')
+        self.assertIs(snapshot, d._snapshot('test'))
+        d.attach('test', 'b')
+        self.assertIsNot(snapshot, d._snapshot('test'))
+        self.assertIs(other, d._snapshot('other'))
+
+    def test_attach_pattern_matches_single_segment_with_star(self):
+        d = Dispatcher()
+        d.attach_pattern('order.*', 'a')
+        d.attach_pattern('*.created', 'b')
+        self.assertEqual(['a', 'b'], list(d.get_listeners('order.created')))
+        self.assertEqual(['a'], list(d.get_listeners('order.paid')))
+        self.assertEqual([], list(d.get_listeners('order')))
+        self.assertEqual([], list(d.get_listeners('order.item.created')))
+
+    def test_attach_pattern_matches_many_segments_with_hash(self):
+        d = Dispatcher()
+        d.attach_pattern('order.#', 'a')
+        d.attach_pattern('#.created', 'b')
+        d.attach_pattern('#', 'c')
+        self.assertEqual(['a', 'c'], list(d.get_listeners('order')))
+        self.assertEqual(['a', 'b', 'c'],
+                list(d.get_listeners('order.item.created')))
+        self.assertEqual(['c'], list(d.get_listeners('user')))
+        self.assertEqual([], list(d.get_listeners(None)))
+
+    def test_attach_pattern_merges_listeners_by_priority(self):
+        d = Dispatcher()
+        d.attach('order.created', 'b', 20)
+        d.attach_pattern('order.*', 'a', 10)
+        d.attach_pattern('order.#', 'c', 30)
+        d.attach('order.created', 'd', 30)
+        self.assertEqual(['a', 'b', 'c', 'd'],
+                list(d.get_listeners('order.created')))
+        self.assertTrue('order.paid' in d)
+        self.assertFalse('user.created' in d)
+
+    def test_attach_pattern_invalidates_compiled_listeners(self):
+        d = Dispatcher()
+        d.attach('order.created', 'b', 20)
+        self.assertEqual(['b'], list(d.get_listeners('order.created')))
+        d.attach_pattern('order.*', 'a', 10)
+        self.assertEqual(['a', 'b'], list(d.get_listeners('order.created')))
+
+    def test_compiled_lists_of_names_matched_by_patterns_are_bounded(self):
+        calls = []
+        d = Dispatcher()
+        d.pattern_cache_size = 10
+        d.attach('order.created', synchronous(calls.append))
+        d.attach_pattern('order.*', synchronous(calls.append))
+        for i in range(100):
+            d.notify('user.%d.created' % i, Event(None))
+            d.notify('order.%d' % i, Event(None))
+            self.assertTrue(len(d._snapshots) <= 11)
+        d.notify('order.created', Event(None))
+        self.assertEqual(102, len(calls))
+        frozen = d.freeze()
+        for i in range(100):
+            frozen.notify('order.%d' % i, Event(None))
+            self.assertTrue(len(frozen._chains) <= 12)
+
+    def test_attach_many_merges_listeners_by_priority(self):
+        d = Dispatcher()
+        d.attach('test', 'b', 20)
+        d.attach_many([('test', 'd', 30), ('test', 'a', 10), ('other', 'x'),
+            ('test', 'c', 20)])
+        self.assertEqual(['a', 'b', 'c', 'd'], list(d.get_listeners('test')))
+        self.assertEqual(['x'], list(d.get_listeners('other')))
+        d.detach('test', 'c')
+        self.assertEqual(['a', 'b', 'd'], list(d.get_listeners('test')))
+
+    def test_detach_removes_listener(self):
+        d = Dispatcher()
+        d.attach('test', 'a', 10)
+        d.attach('test', 'b', 20)
+        d.attach('test', 'a', 30)
+        d.attach('test', 'c', 30)
+        d.detach('test', 'a')
+        self.assertEqual(['b', 'c'], list(d.get_listeners('test')))
+        d.detach('test', 'b')
+        d.detach('test', 'c')
+        self.assertFalse('test' in d)
+        self.assertEqual({}, d._listeners)
+
+    def test_detach_ignores_unknown_listeners(self):
+        d = Dispatcher()
+        d.attach('test', 'a')
+        d.detach('test', 'b')
+        d.detach('unknown', 'a')
+        self.assertEqual(['a'], list(d.get_listeners('test')))
+
+    def test_detach_pattern_removes_listener(self):
+        d = Dispatcher()
+        d.attach_pattern('order.*', 'a')
+        d.attach_pattern('order.*', 'b')
+        self.assertEqual(['a', 'b'], list(d.get_listeners('order.created')))
+        d.detach_pattern('order.*', 'a')
+        self.assertEqual(['b'], list(d.get_listeners('order.created')))
+        d.detach_pattern('order.*', 'b')
+        self.assertFalse(d._patterns)
+
+    def test_weak_listener_is_detached_when_garbage_collected(self):
+        class Foo(object):
+            def __call__(self, event, deferred):
+                deferred.resolve()
+
+            def bar(self, event, deferred):
+                deferred.resolve()
+        d = Dispatcher()
+        foo = Foo()
+        d.attach('test', foo, weak=True)
+        d.attach('test', foo.bar, weak=True)
+        d.attach_pattern('#', foo.bar, weak=True)
+        cb = mock.MagicMock()
+
+        d.notify('test', self.event).done(cb)
+        cb.assert_called_once_with(self.event)
+        self.assertEqual(3, len(list(d.get_listeners('test'))))
+        d.detach('test', foo.bar)
+        self.assertEqual(2, len(list(d.get_listeners('test'))))
+        del foo
+        gc.collect()
+        self.assertFalse('test' in d)
+        self.assertFalse(d._patterns)
+
+    def test_weak_synchronous_listener_stays_synchronous(self):
+        class Foo(object):
+            calls = []
+
+            @synchronous
+            def bar(self, event):
+                self.calls.append(event)
+        d = Dispatcher()
+        foo = Foo()
+        d.attach('test', foo.bar, weak=True)
+        d.attach('test', synchronous(Foo.calls.append), weak=True)
+        d.notify_sync('test', self.event)
+        self.assertEqual([self.event], Foo.calls)
+        self.assertEqual(1, len(list(d.get_listeners('test'))))
+        del foo
+        gc.collect()
+        self.assertFalse('test' in d)
+
+    def test_weak_listener_copied_by_thaw_is_detached_from_copy(self):
+        class Foo(object):
+            def bar(self, event, deferred):
+                deferred.resolve()
+        d = Dispatcher()
+        foo = Foo()
+        d.attach('test', foo.bar, weak=True)
+        d.attach_pattern('#', foo.bar, executor=mock.MagicMock(), weak=True)
+        frozen = d.freeze()
+        thawed = frozen.thaw()
+        self.assertEqual(2, len(list(thawed.get_listeners('test'))))
+        del foo
+        gc.collect()
+        for dispatcher in (d, frozen, thawed):
+            self.assertFalse('test' in dispatcher)
+            self.assertFalse(dispatcher._patterns)
+
     def test_get_listeners_always_returns_iterator(self):
         d = Dispatcher()
         d.attach('test', 'b')
@@ -179,6 +366,812 @@ class DispatcherTestCase(unittest.TestCase):
         foo.assert_called_once_with(IsA(Event), deferred=IsA(Deferred))
         cb.assert_called_once_with(IsA(Event))
 
+    def test_notify_does_not_grow_stack_with_number_of_listeners(self):
+        d = Dispatcher()
+        for i in range(sys.getrecursionlimit() * 2):
+            d.attach('foo', call_deferred)
+        cb = mock.MagicMock()
+
+        d.notify('foo', self.event).done(cb)
+
+        cb.assert_called_once_with(IsA(Event))
+
+    def test_notify_waits_for_deferred_listener_before_calling_next_one(self):
+        d = Dispatcher()
+        deferreds = []
+        foo = mock.MagicMock(side_effect=lambda event, deferred: \
+                deferreds.append(deferred))
+        bar = mock.MagicMock(side_effect=call_deferred)
+        cb = mock.MagicMock()
+
+        d.attach('foo', foo)
+        d.attach('foo', bar)
+        d.notify('foo', self.event).done(cb)
+
+        bar.assert_never_called()
+        cb.assert_never_called()
+        deferreds[0].resolve()
+        bar.assert_called_once_with(IsA(Event), deferred=IsA(Deferred))
+        cb.assert_called_once_with(IsA(Event))
+
+
+    def test_notify_calls_synchronous_listeners_without_deferred(self):
+        d = Dispatcher()
+        foo = mock.MagicMock()
+        foo.__name__ = 'foo'
+        cb = mock.MagicMock()
+
+        d.attach('foo', synchronous(foo))
+        d.notify('foo', self.event).done(cb)
+
+        foo.assert_called_once_with(IsA(Event))
+        cb.assert_called_once_with(IsA(Event))
+
+    def test_notify_sync_returns_event(self):
+        d = Dispatcher()
+        foo = mock.MagicMock(side_effect=lambda event: event.stop_propagation())
+        foo.__name__ = 'foo'
+        bar = mock.MagicMock()
+        bar.__name__ = 'bar'
+
+        d.attach('foo', synchronous(foo))
+        d.attach('foo', synchronous(bar))
+
+        self.assertIs(self.event, d.notify_sync('foo', self.event))
+        self.assertEqual('foo', self.event.name)
+        foo.assert_called_once_with(IsA(Event))
+        bar.assert_never_called()
+
+    def test_notify_sync_requires_synchronous_listeners(self):
+        d = Dispatcher()
+        foo = mock.MagicMock()
+        foo.__name__ = 'foo'
+
+        d.attach('foo', synchronous(foo))
+        d.attach('foo', call_deferred)
+
+        self.assertRaises(TypeError, d.notify_sync, 'foo', self.event)
+        foo.assert_never_called()
+
+    def test_notify_collect_returns_values_of_listeners(self):
+        d = Dispatcher()
+        d.attach('foo', synchronous(lambda event: 1))
+        d.attach('foo', lambda event, deferred: deferred.resolve(2))
+        d.attach('foo', call_deferred)
+        cb = mock.MagicMock()
+
+        d.notify_collect('foo', self.event).done(cb)
+        cb.assert_called_once_with([1, 2, None])
+
+    def test_notify_collect_resumes_after_deferred_listener(self):
+        d = Dispatcher()
+        pending = []
+        d.attach('foo', lambda event, deferred: pending.append(deferred))
+        d.attach('foo', synchronous(lambda event: 'b'))
+        cb = mock.MagicMock()
+
+        d.notify_collect('foo', self.event).done(cb)
+        cb.assert_never_called()
+        pending[0].resolve('a')
+        cb.assert_called_once_with(['a', 'b'])
+
+    def test_notify_collect_stops_when_propagation_stopped(self):
+        def stop(event):
+            event.stop_propagation()
+            return 1
+        d = Dispatcher()
+        d.attach('foo', synchronous(stop))
+        d.attach('foo', synchronous(lambda event: 2))
+        cb = mock.MagicMock()
+
+        d.notify_collect('foo', self.event).done(cb)
+        cb.assert_called_once_with([1])
+
+    def test_notify_collect_rejects_on_failure(self):
+        d = Dispatcher()
+        d.attach('foo', lambda event, deferred: deferred.reject('error'))
+        cb = mock.MagicMock()
+
+        d.notify_collect('foo', self.event).fail(cb)
+        cb.assert_called_once_with('error')
+
+    def test_notify_until_returns_first_value(self):
+        d = Dispatcher()
+        foo = mock.MagicMock(return_value=None)
+        bar = mock.MagicMock(return_value='bar')
+        baz = mock.MagicMock(return_value='baz')
+        for listener in (foo, bar, baz):
+            d.attach('foo', synchronous(listener))
+        cb = mock.MagicMock()
+
+        d.notify_until('foo', self.event).done(cb)
+        cb.assert_called_once_with('bar')
+        self.assertTrue(self.event.is_processed())
+        foo.assert_called_once_with(self.event)
+        baz.assert_never_called()
+
+    def test_notify_until_with_deferred_listener(self):
+        d = Dispatcher()
+        pending = []
+        baz = mock.MagicMock()
+        d.attach('foo', lambda event, deferred: pending.append(deferred))
+        d.attach('foo', synchronous(baz))
+        cb = mock.MagicMock()
+
+        d.notify_until('foo', self.event).done(cb)
+        pending[0].resolve('bar')
+        cb.assert_called_once_with('bar')
+        baz.assert_never_called()
+
+    def test_notify_until_without_value(self):
+        d = Dispatcher()
+        d.attach('foo', call_deferred)
+        cb = mock.MagicMock()
+
+        d.notify_until('foo', self.event).done(cb)
+        cb.assert_called_once_with(None)
+        self.assertFalse(self.event.is_processed())
+
+    def test_notify_reduce_folds_values(self):
+        d = Dispatcher()
+        pending = []
+        d.attach('foo', synchronous(square))
+        d.attach('foo', lambda event, deferred: pending.append(deferred))
+        d.attach('foo', synchronous(square))
+        cb = mock.MagicMock()
+
+        d.notify_reduce('foo', Event(None, {'value': 3}),
+                lambda total, value: total + value, 1).done(cb)
+        pending[0].resolve(5)
+        cb.assert_called_once_with(24)
+
+
+    def test_notify_parallel_runs_listeners_with_same_priority_concurrently(
+            self):
+        d = Dispatcher()
+        deferreds = []
+        hold = lambda event, deferred: deferreds.append(deferred)
+        foo = mock.MagicMock(side_effect=hold)
+        bar = mock.MagicMock(side_effect=hold)
+        baz = mock.MagicMock(side_effect=call_deferred)
+        cb = mock.MagicMock()
+
+        d.attach('foo', foo, 10)
+        d.attach('foo', bar, 10)
+        d.attach('foo', baz, 20)
+        d.notify_parallel('foo', self.event).done(cb)
+
+        self.assertEqual(2, len(deferreds))
+        baz.assert_never_called()
+        deferreds[1].resolve()
+        deferreds[0].resolve()
+        baz.assert_called_once_with(IsA(Event), deferred=IsA(Deferred))
+        cb.assert_called_once_with(IsA(Event))
+
+    def test_notify_parallel_respects_concurrency_limit(self):
+        d = Dispatcher()
+        deferreds = []
+        for i in range(3):
+            d.attach('foo', lambda event, deferred: deferreds.append(deferred))
+        cb = mock.MagicMock()
+
+        d.notify_parallel('foo', self.event, limit=2).done(cb)
+
+        self.assertEqual(2, len(deferreds))
+        deferreds[0].resolve()
+        self.assertEqual(3, len(deferreds))
+        deferreds[1].resolve()
+        deferreds[2].resolve()
+        cb.assert_called_once_with(IsA(Event))
+
+    def test_notify_parallel_aggregates_failures(self):
+        d = Dispatcher()
+        d.attach('foo', lambda event, deferred: deferred.reject('a'), 10)
+        d.attach('foo', call_deferred, 10)
+        d.attach('foo', lambda event, deferred: deferred.reject('b'), 10)
+        bar = mock.MagicMock(side_effect=call_deferred)
+        d.attach('foo', bar, 20)
+        errors = []
+
+        d.notify_parallel('foo', self.event).fail(errors.append)
+
+        self.assertEqual(1, len(errors))
+        self.assertTrue(isinstance(errors[0], ListenerErrors))
+        self.assertEqual([('a',), ('b',)], [e.args for e in errors[0].errors])
+        bar.assert_never_called()
+
+    def test_notify_parallel_stops_between_bands_when_propagation_stopped(
+            self):
+        d = Dispatcher()
+
+        def stop_propagation(event, deferred):
+            event.stop_propagation()
+            call_deferred(event, deferred)
+        foo = mock.MagicMock(side_effect=call_deferred)
+        bar = mock.MagicMock(side_effect=call_deferred)
+        d.attach('foo', stop_propagation, 10)
+        d.attach('foo', foo, 10)
+        d.attach('foo', bar, 20)
+
+        d.notify_parallel('foo', self.event)
+
+        foo.assert_called_once_with(IsA(Event), deferred=IsA(Deferred))
+        bar.assert_never_called()
+
+
+    def notify_in_executor(self, executor, listener):
+        d = Dispatcher()
+        d.attach('foo', listener, executor=executor)
+        finished = threading.Event()
+        results = []
+        d.notify('foo', self.event).done(results.append)\
+                .done(lambda event: finished.set())
+        self.assertTrue(finished.wait(10))
+        return results
+
+    @unittest.skipIf(ThreadPoolExecutor is None, 'concurrent.futures missing')
+    def test_attach_with_executor_calls_listener_in_thread_pool(self):
+        threads = []
+        with ThreadPoolExecutor(1) as executor:
+            results = self.notify_in_executor(executor,
+                    lambda event: threads.append(threading.current_thread()))
+        self.assertEqual([self.event], results)
+        self.assertIsNot(threading.current_thread(), threads[0])
+
+    @unittest.skipIf(ProcessPoolExecutor is None, 'concurrent.futures missing')
+    def test_executed_resolves_deferred_with_process_pool_result(self):
+        results = []
+        finished = threading.Event()
+        deferred = Deferred()
+        deferred.done(results.append).done(lambda value: finished.set())
+        with ProcessPoolExecutor(1) as executor:
+            executed(square, executor)(Event(None, {'value': 3}), deferred)
+            self.assertTrue(finished.wait(30))
+        self.assertEqual([9], results)
+
+    def test_attach_with_executor_rejects_promise_when_listener_fails(self):
+        future = mock.MagicMock()
+        future.cancelled.return_value = False
+        future.exception.return_value = ValueError('foo')
+        future.add_done_callback.side_effect = lambda cb: cb(future)
+        executor = mock.MagicMock()
+        executor.submit.return_value = future
+        listener = mock.MagicMock()
+        errors = []
+
+        d = Dispatcher()
+        d.attach('foo', listener, executor=executor)
+        d.notify('foo', self.event).fail(errors.append)
+
+        executor.submit.assert_called_once_with(listener, self.event)
+        self.assertIs(future.exception.return_value, errors[0])
+
+
+    def test_notify_many_calls_batched_listeners_once(self):
+        d = Dispatcher()
+        foo = mock.MagicMock(side_effect=call_deferred)
+        bar = mock.MagicMock()
+        bar.__name__ = 'bar'
+        events = [Event(None), Event(None)]
+        cb = mock.MagicMock()
+
+        d.attach('foo', foo)
+        d.attach('foo', batched(synchronous(bar)))
+        d.notify_many('foo', events).done(cb)
+
+        self.assertEqual(2, foo.call_count)
+        bar.assert_called_once_with(events)
+        cb.assert_called_once_with(events)
+        self.assertEqual(['foo', 'foo'], [e.name for e in events])
+
+    def test_notify_many_skips_events_with_stopped_propagation(self):
+        d = Dispatcher()
+        events = [Event(None), Event(None)]
+        d.attach('foo', lambda event, deferred: \
+                deferred.resolve(event is events[0] and \
+                    event.stop_propagation()))
+        bar = mock.MagicMock(side_effect=call_deferred)
+        bar.__name__ = 'bar'
+        d.attach('foo', batched(bar))
+
+        d.notify_many('foo', events)
+
+        bar.assert_called_once_with([events[1]], deferred=IsA(Deferred))
+
+    def test_batched_listener_receives_list_when_notified_about_one_event(
+            self):
+        d = Dispatcher()
+        foo = mock.MagicMock(side_effect=call_deferred)
+        foo.__name__ = 'foo'
+        d.attach('foo', batched(foo))
+
+        d.notify('foo', self.event)
+
+        foo.assert_called_once_with([self.event], IsA(Deferred))
+
+    def test_notify_stream_consumes_generator_in_batches(self):
+        d = Dispatcher()
+        foo = mock.MagicMock(side_effect=call_deferred)
+        foo.__name__ = 'foo'
+        d.attach('foo', batched(foo))
+        cb = mock.MagicMock()
+
+        d.notify_stream('foo', (Event(i) for i in range(5)), 2).done(cb)
+
+        self.assertEqual([2, 2, 1],
+                [len(c[0][0]) for c in foo.call_args_list])
+        cb.assert_called_once_with(5)
+
+
+
+class SynchronousMethodTestCase(unittest.TestCase):
+
+    class Foo(object):
+
+        def __init__(self):
+            self.calls = []
+
+        @synchronous
+        def bar(self, event):
+            self.calls.append(event)
+            return 'bar'
+
+        @batched
+        @synchronous
+        def baz(self, events):
+            self.calls.append(events)
+
+    def setUp(self):
+        self.dispatcher = Dispatcher()
+        self.foo = self.Foo()
+
+    def test_method_is_synchronous_when_attached_strongly_or_weakly(self):
+        for weak in (False, True):
+            self.dispatcher.attach('foo', self.foo.bar, weak=weak)
+            event = Event(None)
+            self.dispatcher.notify_sync('foo', event)
+            self.assertEqual([event], self.foo.calls)
+            self.dispatcher.detach('foo', self.foo.bar)
+            self.foo.calls = []
+
+    def test_filtered_and_cached_methods_are_synchronous(self):
+        self.dispatcher.attach('foo', self.foo.bar, where={'t': 1})
+        self.dispatcher.attach('bar', self.foo.bar, cache=True)
+        event = Event(None, {'t': 1})
+        self.dispatcher.notify_sync('foo', event)
+        self.dispatcher.notify_sync('bar', event)
+        self.dispatcher.notify_sync('bar', event)
+        self.assertEqual([event, event], self.foo.calls)
+
+    def test_batched_method(self):
+        self.dispatcher.attach('foo', self.foo.baz)
+        events = [Event(None), Event(None)]
+        self.dispatcher.notify_many('foo', events)
+        self.assertEqual([events], self.foo.calls)
+
+
+class DispatcherFilterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dispatcher = Dispatcher()
+        self.calls = []
+
+    def listener(self, label, sync=True):
+        if sync:
+            return synchronous(lambda event: self.calls.append(label))
+
+        def listener(event, deferred):
+            self.calls.append(label)
+            deferred.resolve()
+        return listener
+
+    def notify(self, **parameters):
+        self.calls = []
+        self.dispatcher.notify('foo', Event(None, parameters))
+        return self.calls
+
+    def test_when_predicate(self):
+        self.dispatcher.attach('foo', self.listener('a'),
+                when=lambda event: event.parameters.get('x') > 1)
+        self.dispatcher.attach('foo', self.listener('b'))
+        self.assertEqual(['b'], self.notify(x=1))
+        self.assertEqual(['a', 'b'], self.notify(x=2))
+
+    def test_where_equality(self):
+        self.dispatcher.attach('foo', self.listener('a', False),
+                where={'tenant': 'x'})
+        self.dispatcher.attach('foo', self.listener('b'),
+                where={'tenant': 'y'})
+        self.assertEqual(['a'], self.notify(tenant='x'))
+        self.assertEqual(['b'], self.notify(tenant='y'))
+        self.assertEqual([], self.notify(tenant='z'))
+        self.assertEqual([], self.notify())
+
+    def test_where_membership(self):
+        self.dispatcher.attach('foo', self.listener('a'),
+                where={'tenant': ['x', 'y', 'x']})
+        self.assertEqual(['a'], self.notify(tenant='x'))
+        self.assertEqual(['a'], self.notify(tenant='y'))
+        self.assertEqual([], self.notify(tenant='z'))
+
+    def test_where_many_parameters(self):
+        self.dispatcher.attach('foo', self.listener('a'),
+                where={'tenant': 'x', 'kind': set(['u', 'v'])})
+        self.assertEqual(['a'], self.notify(tenant='x', kind='u'))
+        self.assertEqual([], self.notify(tenant='x', kind='w'))
+        self.assertEqual([], self.notify(tenant='x'))
+
+    def test_where_and_when(self):
+        self.dispatcher.attach('foo', self.listener('a'), where={'t': 1},
+                when=lambda event: event.parameters.get('ok'))
+        self.assertEqual(['a'], self.notify(t=1, ok=True))
+        self.assertEqual([], self.notify(t=1, ok=False))
+
+    def test_unhashable_values(self):
+        self.dispatcher.attach('foo', self.listener('a'),
+                where={'t': [[1], [2]]})
+        self.dispatcher.attach('foo', self.listener('b'), where={'t': 1})
+        self.assertEqual(['a'], self.notify(t=[1]))
+        self.assertEqual(['b'], self.notify(t=1))
+
+    def test_priority_order_is_kept(self):
+        self.dispatcher.attach('foo', self.listener('c'), 3)
+        self.dispatcher.attach('foo', self.listener('a'), 1, where={'t': 1})
+        self.dispatcher.attach('foo', self.listener('d'), 4,
+                where={'t': [1, 2]})
+        self.dispatcher.attach('foo', self.listener('b'), 2,
+                when=lambda event: True)
+        self.assertEqual(['a', 'b', 'c', 'd'], self.notify(t=1))
+        self.assertEqual(['b', 'c', 'd'], self.notify(t=2))
+
+    def test_many_tenants(self):
+        for tenant in range(10000):
+            self.dispatcher.attach('foo', self.listener(tenant),
+                    where={'tenant': tenant})
+        self.assertEqual([1234], self.notify(tenant=1234))
+
+    def test_detach_filtered_listener(self):
+        listener = self.listener('a')
+        self.dispatcher.attach('foo', listener, where={'t': 1})
+        self.dispatcher.detach('foo', listener)
+        self.assertFalse('foo' in self.dispatcher)
+
+    def test_get_listeners_returns_filtered_listeners(self):
+        self.dispatcher.attach('foo', self.listener('a'), where={'t': 1})
+        self.assertEqual(1, len(list(self.dispatcher.get_listeners('foo'))))
+
+    def test_notify_sync(self):
+        self.dispatcher.attach('foo', self.listener('a'), where={'t': 1})
+        self.dispatcher.attach('foo', self.listener('b'))
+        self.dispatcher.notify_sync('foo', Event(None, {'t': 2}))
+        self.assertEqual(['b'], self.calls)
+
+    def test_notify_collect(self):
+        self.dispatcher.attach('foo', synchronous(lambda event: 1),
+                where={'t': 1})
+        self.dispatcher.attach('foo', synchronous(lambda event: 2))
+        cb = mock.MagicMock()
+        self.dispatcher.notify_collect('foo', Event(None, {'t': 3})).done(cb)
+        cb.assert_called_once_with([2])
+
+    def test_notify_many_and_parallel(self):
+        self.dispatcher.attach('foo', self.listener('a', False),
+                where={'t': 1})
+        self.dispatcher.notify_many('foo', [Event(None, {'t': 1}),
+            Event(None, {'t': 2})])
+        self.dispatcher.notify_parallel('foo', Event(None, {'t': 2}))
+        self.dispatcher.notify_parallel('foo', Event(None, {'t': 1}))
+        self.assertEqual(['a', 'a'], self.calls)
+
+    def test_notify_many_and_parallel_use_where_index(self):
+        for tenant in range(100):
+            self.dispatcher.attach('foo', self.listener(tenant, False),
+                    tenant % 2, where={'tenant': tenant})
+        self.dispatcher.attach('foo', self.listener('all', False), 1)
+        with mock.patch.object(pyevent._Filtered, 'accepts',
+                side_effect=AssertionError):
+            self.dispatcher.notify_parallel('foo', Event(None,
+                {'tenant': 7}))
+            self.dispatcher.notify_many('foo', [Event(None, {'tenant': t}) \
+                    for t in (8, 7)])
+        self.assertEqual([7, 'all', 8, 7, 'all', 'all'], self.calls)
+
+    def test_notify_many_passes_accepted_events_to_batched_listener(self):
+        batches = []
+        self.dispatcher.attach('foo', batched(synchronous(batches.append)),
+                where={'t': 1})
+        events = [Event(None, {'t': t}) for t in (1, 2, 1)]
+        self.dispatcher.notify_many('foo', events)
+        self.assertEqual([[events[0], events[2]]], batches)
+
+    def test_frozen_dispatcher(self):
+        self.dispatcher.attach('foo', self.listener('a'), where={'t': 1})
+        self.dispatcher.attach('bar', self.listener('b'))
+        frozen = self.dispatcher.freeze()
+        frozen.notify('foo', Event(None, {'t': 2}))
+        frozen.notify('foo', Event(None, {'t': 1}))
+        frozen.notify('bar', Event(None))
+        self.assertEqual(['a', 'b'], self.calls)
+
+    def test_pattern_listener_filter(self):
+        self.dispatcher.attach_pattern('*', self.listener('a'),
+                where={'t': 1})
+        self.assertEqual(['a'], self.notify(t=1))
+        self.assertEqual([], self.notify(t=2))
+
+
+class DispatcherThreadingTestCase(unittest.TestCase):
+
+    def listener(self, priority):
+        @synchronous
+        def listener(event):
+            event.parameters['seen'].append(priority)
+        listener.priority = priority
+        return listener
+
+    def test_concurrent_attach_detach_and_notify(self):
+        d = Dispatcher()
+        for i in range(10):
+            d.attach('foo', self.listener(i * 10), i * 10)
+        errors = []
+        running = threading.Event()
+        running.set()
+
+        def writer(seed):
+            try:
+                for i in range(300):
+                    priority = (seed * 7 + i * 13) % 100
+                    listener = self.listener(priority)
+                    d.attach('foo', listener, priority)
+                    d.attach_pattern('f*', listener, priority)
+                    d.detach('foo', listener)
+                    d.detach_pattern('f*', listener)
+            except Exception as e:
+                errors.append(e)
+
+        def reader():
+            try:
+                while running.is_set():
+                    seen = d.notify_sync('foo', Event(None, {'seen': []}))\
+                            .parameters['seen']
+                    if seen != sorted(seen):
+                        errors.append(seen)
+                    priorities = [l.priority for l in d.get_listeners('foo')]
+                    if priorities != sorted(priorities):
+                        errors.append(priorities)
+            except Exception as e:
+                errors.append(e)
+
+        readers = [threading.Thread(target=reader) for i in range(4)]
+        writers = [threading.Thread(target=writer, args=(i,)) \
+                for i in range(4)]
+        for t in readers + writers:
+            t.start()
+        for t in writers:
+            t.join()
+        running.clear()
+        for t in readers:
+            t.join()
+
+        self.assertEqual([], errors)
+        self.assertEqual([i * 10 for i in range(10)],
+                [l.priority for l in d.get_listeners('foo')])
+        self.assertFalse(d._patterns)
+        d.attach('foo', self.listener(5), 5)
+        self.assertEqual([0, 5] + [i * 10 for i in range(1, 10)],
+                d.notify_sync('foo', Event(None, {'seen': []}))\
+                        .parameters['seen'])
+
+    def test_compiled_listeners_published_during_store_are_dropped(self):
+        d = Dispatcher()
+        d.attach('foo', self.listener(1), 1)
+        late = self.listener(2)
+
+        class Snapshots(dict):
+            # writer publishes change right before reader stores
+            # its compiled tuple
+            def __setitem__(cache, key, value):
+                if key == 'foo' and late.priority:
+                    late.priority = None
+                    d.attach('foo', late, 2)
+                dict.__setitem__(cache, key, value)
+
+        d._snapshots = Snapshots()
+        d.notify_sync('foo', Event(None, {'seen': []}))
+        self.assertEqual([1, 2], d.notify_sync('foo',
+            Event(None, {'seen': []})).parameters['seen'])
+
+    def test_step_resumes_suspended_loop_once(self):
+        resume = mock.MagicMock()
+        step = pyevent._Step()
+        self.assertFalse(step.finished())
+        self.assertTrue(step.suspend(resume))
+        step.done()
+        step.done()
+        resume.assert_called_once_with()
+        step = pyevent._Step()
+        step.done()
+        self.assertTrue(step.finished())
+        self.assertFalse(step.suspend(resume))
+        step.done()
+        self.assertEqual(1, resume.call_count)
+
+    def test_listener_resolved_by_other_thread_before_loop_is_suspended(self):
+        pending = []
+        finished = pyevent._Step.finished
+
+        def resolve_in_window(step):
+            # listener finishes in other thread right after the loop
+            # found it unfinished
+            result = finished(step)
+            while pending:
+                t = threading.Thread(target=pending.pop().resolve)
+                t.start()
+                t.join()
+            return result
+
+        d = Dispatcher()
+        d.attach('foo', lambda event, deferred: pending.append(deferred))
+        d.attach('foo', self.listener(1))
+        cb = mock.MagicMock()
+        with mock.patch.object(pyevent._Step, 'finished', resolve_in_window):
+            d.notify('foo', Event(None, {'seen': []})).done(cb)
+        cb.assert_called_once_with(IsA(Event))
+        self.assertEqual([1], cb.call_args[0][0].parameters['seen'])
+
+    def test_notify_parallel_listeners_resolved_by_many_threads(self):
+        d = Dispatcher()
+        started = []
+        lock = threading.Lock()
+
+        def listener(event, deferred):
+            with lock:
+                started.append(deferred)
+
+        for i in range(50):
+            d.attach('foo', listener)
+        for limit in (None, 3):
+            del started[:]
+            cb = mock.MagicMock()
+            d.notify_parallel('foo', Event(None), limit).done(cb)
+            resolved = 0
+            while resolved < 50:
+                with lock:
+                    batch, started[:] = started[:], []
+                threads = [threading.Thread(target=deferred.resolve) \
+                        for deferred in batch]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+                resolved += len(batch)
+                self.assertTrue(batch)
+            cb.assert_called_once_with(IsA(Event))
+
+
+class FrozenDispatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.event = Event('test')
+        self.calls = []
+        self.dispatcher = Dispatcher()
+
+    def sync(self, value):
+        @synchronous
+        def listener(event):
+            self.calls.append(value)
+        return listener
+
+    def deferred(self, value):
+        def listener(event, deferred):
+            self.calls.append(value)
+            deferred.resolve()
+        return listener
+
+    def test_freeze_returns_frozen_dispatcher(self):
+        frozen = self.dispatcher.freeze()
+        self.assertTrue(isinstance(frozen, FrozenDispatcher))
+        self.assertIs(frozen, frozen.freeze())
+
+    def test_frozen_dispatcher_can_not_be_changed(self):
+        frozen = self.dispatcher.freeze()
+        self.assertRaises(FrozenDispatcherError, frozen.attach, 'a', 'b')
+        self.assertRaises(FrozenDispatcherError, frozen.attach_many, [])
+        self.assertRaises(FrozenDispatcherError, frozen.detach, 'a', 'b')
+        self.assertRaises(FrozenDispatcherError, frozen.attach_pattern, 'a',
+                'b')
+        self.assertRaises(FrozenDispatcherError, frozen.detach_pattern, 'a',
+                'b')
+
+    def test_frozen_dispatcher_is_not_affected_by_later_changes(self):
+        self.dispatcher.attach('foo', 'a')
+        self.dispatcher.attach_pattern('foo.*', 'x')
+        frozen = self.dispatcher.freeze()
+        self.dispatcher.attach('foo', 'b')
+        self.dispatcher.attach_pattern('foo.*', 'y')
+        self.assertEqual(['a'], list(frozen.get_listeners('foo')))
+        self.assertEqual(['x'], list(frozen.get_listeners('foo.bar')))
+
+    def test_notify_calls_listeners_in_priority_order(self):
+        d = self.dispatcher
+        d.attach('foo', self.sync('c'), 30)
+        d.attach('foo', self.sync('a'), 10)
+        d.attach('foo', self.deferred('b'), 20)
+        d.attach('foo', self.sync('d'), 40)
+        d.attach_pattern('foo.*', self.sync('e'), 50)
+        cb = mock.MagicMock()
+
+        d.freeze().notify('foo', self.event).done(cb)
+
+        self.assertEqual(['a', 'b', 'c', 'd'], self.calls)
+        cb.assert_called_once_with(self.event)
+        self.assertEqual('foo', self.event.name)
+
+    def test_notify_stops_when_propagation_is_stopped(self):
+        d = self.dispatcher
+        d.attach('foo', self.sync('a'))
+        d.attach('foo', synchronous(lambda event: event.stop_propagation()))
+        d.attach('foo', self.sync('b'))
+        d.attach('foo', self.deferred('c'))
+
+        d.freeze().notify('foo', self.event)
+
+        self.assertEqual(['a'], self.calls)
+
+    def test_notify_long_runs_of_synchronous_listeners(self):
+        d = self.dispatcher
+        for i in range(250):
+            d.attach('foo', self.sync(i), i)
+        d.attach('foo', self.deferred('x'), 100)
+        d.attach('foo', synchronous(lambda event: event.stop_propagation()),
+                230)
+        cb = mock.MagicMock()
+
+        d.freeze().notify('foo', self.event).done(cb)
+
+        self.assertEqual(list(range(101)) + ['x'] + list(range(101, 231)),
+                self.calls)
+        cb.assert_called_once_with(self.event)
+
+    def test_notify_event_with_own_propagation_methods(self):
+        calls = self.calls
+
+        class Stopped(Event):
+            __slots__ = ()
+
+            def is_propagation_stopped(self):
+                return 'stop' in calls
+
+        d = self.dispatcher
+        d.attach('foo', self.sync('a'))
+        d.attach('foo', self.sync('stop'))
+        d.attach('foo', self.sync('b'))
+        d.freeze().notify('foo', Stopped('test'))
+
+        self.assertEqual(['a', 'stop'], self.calls)
+
+    def test_notify_waits_for_deferred_listeners(self):
+        deferreds = []
+        d = self.dispatcher
+        d.attach('foo', lambda event, deferred: deferreds.append(deferred))
+        d.attach('foo', self.sync('a'))
+        cb = mock.MagicMock()
+
+        d.freeze().notify('foo', self.event).done(cb)
+        self.assertEqual([], self.calls)
+        deferreds[0].resolve()
+
+        self.assertEqual(['a'], self.calls)
+        cb.assert_called_once_with(self.event)
+
+    def test_thaw_returns_mutable_copy(self):
+        self.dispatcher.attach('foo', 'a', 10)
+        thawed = self.dispatcher.freeze().thaw()
+        thawed.attach('foo', 'b', 5)
+        thawed.detach('foo', 'a')
+        self.assertEqual(['b'], list(thawed.get_listeners('foo')))
+        self.assertEqual(['a'], list(self.dispatcher.get_listeners('foo')))
+
 
 if "__main__" == __name__:
     unittest.main()
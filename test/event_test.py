@@ -9,7 +9,7 @@ import unittest
 ##
 # event modules
 #
-from pyevent import Event
+from pyevent import Event, LightEvent
 
 
 class EventTestCase(unittest.TestCase):
@@ -99,6 +99,28 @@ class EventTestCase(unittest.TestCase):
         self.assertEqual(1, e.parameters['a'])
         self.assertTrue('a' in e.parameters)
 
+    def test_default_parameters_are_not_shared(self):
+        e = Event(None)
+        e.parameters['a'] = 1
+        self.assertEqual({}, Event(None).parameters)
+
+    def test_parameters_can_be_replaced(self):
+        e = Event(None)
+        e.parameters = {'a': 1}
+        self.assertEqual({'a': 1}, e.parameters)
+
+    def test_event_does_not_have_instance_dictionary(self):
+        self.assertFalse(hasattr(Event(None), '__dict__'))
+        self.assertFalse(hasattr(LightEvent(), '__dict__'))
+
+
+class LightEventTestCase(unittest.TestCase):
+
+    def test_init_does_not_require_arguments(self):
+        e = LightEvent()
+        self.assertIsNone(e.subject)
+        self.assertEqual({}, e.parameters)
+
 
 if "__main__" == __name__:
     unittest.main()
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# python standard library
+#
+import os
+import shutil
+import tempfile
+import unittest
+
+##
+# test helpers
+#
+from testutils import mock
+from fixtures import Clock
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher, synchronous
+from pyevent_journal import Journal, pack_record, read, read_segment, \
+        replay, segments
+
+
+class JournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clock = Clock(100.0)
+        self.journals = []
+
+    def tearDown(self):
+        for journal in self.journals:
+            journal.close()
+        shutil.rmtree(self.directory)
+
+    def journal(self, **kwargs):
+        kwargs.setdefault('clock', self.clock)
+        journal = Journal(self.directory, **kwargs)
+        self.journals.append(journal)
+        return journal
+
+    def test_records_notified_events(self):
+        d = Dispatcher()
+        journal = self.journal().attach(d)
+        d.notify('foo', Event(None, {'a': 1}))
+        self.clock.now = 101.0
+        d.notify('bar.baz', Event(None))
+        journal.flush()
+        self.assertEqual([(100.0, 'foo', {'a': 1}), (101.0, 'bar.baz', {})],
+                list(read(self.directory)))
+
+    def test_records_events_whose_propagation_is_stopped(self):
+        d = Dispatcher()
+        d.attach('foo', synchronous(lambda event: event.stop_propagation()),
+                0)
+        journal = self.journal().attach(d)
+        d.notify('foo', Event(None))
+        journal.flush()
+        self.assertEqual(1, len(list(read(self.directory))))
+
+    def test_records_events_matching_pattern_only(self):
+        d = Dispatcher()
+        journal = self.journal().attach(d, 'order.*')
+        d.notify('order.created', Event(None))
+        d.notify('user.created', Event(None))
+        journal.flush()
+        self.assertEqual(['order.created'],
+                [r[1] for r in read(self.directory)])
+
+    def test_detach(self):
+        d = Dispatcher()
+        journal = self.journal().attach(d).detach(d)
+        d.notify('foo', Event(None))
+        self.assertEqual(0, journal.records)
+
+    def test_records_are_buffered(self):
+        journal = self.journal(buffer_size=1024, flush_interval=10)
+        journal.record('foo', {})
+        self.assertEqual([], list(read(self.directory)))
+        self.assertEqual(0, os.path.getsize(journal.path))
+
+    def test_flushes_when_buffer_is_full(self):
+        journal = self.journal(buffer_size=100, flush_interval=10)
+        for i in range(10):
+            journal.record('foo', {'data': 'x' * 10})
+        self.assertTrue(len(list(read(self.directory))) >= 5)
+
+    def test_flushes_after_interval(self):
+        journal = self.journal(flush_interval=1)
+        journal.record('foo', {})
+        self.clock.now += 1
+        journal.record('foo', {})
+        self.assertEqual(2, len(list(read(self.directory))))
+
+    def test_rotates_segments(self):
+        journal = self.journal(segment_size=100, buffer_size=1)
+        for i in range(10):
+            journal.record('foo', {'i': i})
+        paths = segments(self.directory)
+        self.assertTrue(len(paths) > 1)
+        for path in paths:
+            self.assertTrue(os.path.getsize(path) <= 100)
+        self.assertEqual(list(range(10)),
+                [r[2]['i'] for r in read(self.directory)])
+
+    def test_new_journal_starts_new_segment(self):
+        self.journal().record('foo', {'i': 1})
+        self.journals.pop().close()
+        self.journal().record('foo', {'i': 2})
+        self.journals[-1].flush()
+        self.assertEqual(2, len(segments(self.directory)))
+        self.assertEqual([1, 2], [r[2]['i'] for r in read(self.directory)])
+
+    def test_incomplete_record_is_ignored(self):
+        path = os.path.join(self.directory, 'test.log')
+        with open(path, 'wb') as f:
+            f.write(pack_record(1.0, 'foo', {}))
+            f.write(pack_record(2.0, 'bar', {})[:-3])
+        self.assertEqual([(1.0, 'foo', {})], list(read_segment(path)))
+
+    def test_read_empty_segment(self):
+        path = os.path.join(self.directory, 'test.log')
+        open(path, 'wb').close()
+        self.assertEqual([], list(read_segment(path)))
+
+
+class ReplayTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        journal = Journal(self.directory)
+        journal.record('foo', {'i': 1}, 10.0)
+        journal.record('bar', {'i': 2}, 11.0)
+        journal.record('foo', {'i': 3}, 13.0)
+        journal.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_replay_notifies_dispatcher(self):
+        d = Dispatcher()
+        calls = []
+        d.attach('foo', synchronous(calls.append))
+        d.attach('bar', synchronous(calls.append))
+        self.assertEqual(3, replay(self.directory, d, subject='replay'))
+        self.assertEqual([1, 2, 3], [e.parameters['i'] for e in calls])
+        self.assertEqual(['foo', 'bar', 'foo'], [e.name for e in calls])
+        self.assertEqual('replay', calls[0].subject)
+
+    def test_replay_keeps_intervals(self):
+        clock = Clock(100.0)
+        sleep = mock.MagicMock()
+        replay(self.directory, Dispatcher(), speed=2, clock=clock,
+                sleep=sleep)
+        self.assertEqual([mock.call(0.5), mock.call(1.5)],
+                sleep.call_args_list)
+
+    def test_replay_without_speed_does_not_sleep(self):
+        sleep = mock.MagicMock()
+        replay(self.directory, Dispatcher(), sleep=sleep)
+        sleep.assert_never_called()
+
+    def test_replay_single_segment(self):
+        path = segments(self.directory)[0]
+        self.assertEqual(3, replay(path, Dispatcher()))
+
+
+if "__main__" == __name__:
+    unittest.main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# python standard library
+#
+import collections
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+##
+# test helpers
+#
+from testutils import mock
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher, Manager, lazy, synchronous
+
+
+MODULE = '''
+from pyevent import synchronous
+
+calls = []
+
+@synchronous
+def on_event(event):
+    calls.append(('on_event', event.name))
+
+def compute(event):
+    calls.append(('compute', event.name))
+
+class Handlers(object):
+
+    def handle(self, event, deferred):
+        calls.append(('handle', event.name))
+        deferred.resolve()
+
+handlers = Handlers()
+'''
+
+
+class LazyListenerTestCase(unittest.TestCase):
+
+    counter = itertools.count()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.module = 'lazy_listeners_%d' % next(self.counter)
+        with open(os.path.join(self.directory, self.module + '.py'), 'w') \
+                as f:
+            f.write(MODULE)
+        sys.path.insert(0, self.directory)
+
+    def tearDown(self):
+        sys.path.remove(self.directory)
+        sys.modules.pop(self.module, None)
+        shutil.rmtree(self.directory)
+
+    def target(self, attribute):
+        return '%s:%s' % (self.module, attribute)
+
+    def imported(self):
+        return self.module in sys.modules
+
+    def calls(self):
+        return sys.modules[self.module].calls
+
+    def test_module_is_imported_on_first_notify(self):
+        d = Dispatcher()
+        d.attach_lazy('foo', self.target('on_event'))
+        self.assertFalse(self.imported())
+        d.notify('bar', Event(None))
+        self.assertFalse(self.imported())
+        d.notify('foo', Event(None))
+        self.assertTrue(self.imported())
+        self.assertEqual([('on_event', 'foo')], self.calls())
+
+    def test_resolved_synchronous_listener_is_called_directly(self):
+        d = Dispatcher()
+        d.attach_lazy('foo', self.target('on_event'))
+        d.notify_sync('foo', Event(None))
+        self.assertEqual(1, len(self.calls()))
+        listener = next(d.get_listeners('foo'))
+        self.assertIs(sys.modules[self.module].on_event, listener)
+
+    def test_attribute_path(self):
+        d = Dispatcher()
+        d.attach_lazy('foo', self.target('handlers.handle'))
+        d.notify('foo', Event(None))
+        self.assertEqual([('handle', 'foo')], self.calls())
+
+    def test_priority_order_is_kept(self):
+        d = Dispatcher()
+        calls = []
+        d.attach('foo', synchronous(lambda event: calls.append('first')), 1)
+        d.attach_lazy('foo', self.target('on_event'), 2)
+        d.attach('foo', synchronous(lambda event: calls.append('last')), 3)
+        d.attach('foo', synchronous(lambda event: calls.append(
+            self.calls()[-1][0])), 2)
+        d.notify('foo', Event(None))
+        self.assertEqual(['first', 'on_event', 'last'], calls)
+
+    def test_detach_by_target(self):
+        d = Dispatcher()
+        d.attach_lazy('foo', self.target('on_event'))
+        d.detach('foo', self.target('on_event'))
+        self.assertFalse('foo' in d)
+        self.assertFalse(self.imported())
+
+    def test_lazy_listener_wrapped_by_other_listener(self):
+        d = Dispatcher()
+        executor = mock.MagicMock()
+        d.attach('foo', lazy(self.target('compute')), executor=executor)
+        d.notify('foo', Event(None))
+        self.assertFalse(self.imported())
+        function, event = executor.submit.call_args[0]
+        function(event)
+        self.assertEqual([('compute', 'foo')], self.calls())
+
+    def test_import_error_is_raised_on_notify(self):
+        d = Dispatcher()
+        d.attach_lazy('foo', 'missing_module_for_lazy_test:listener')
+        self.assertRaises(ImportError, d.notify, 'foo', Event(None))
+
+    def test_manager_register_lazy_tuples(self):
+        d = Dispatcher()
+        Manager(d).register_lazy([('foo', self.target('on_event'), 5),
+            ('bar', self.target('handlers.handle'))])
+        self.assertFalse(self.imported())
+        d.notify('foo', Event(None))
+        d.notify('bar', Event(None))
+        self.assertEqual([('on_event', 'foo'), ('handle', 'bar')],
+                self.calls())
+
+    def test_manager_register_lazy_dictionary(self):
+        d = Dispatcher()
+        calls = []
+        d.attach('foo', synchronous(lambda event: calls.append('first')), 1)
+        Manager(d).register_lazy({'foo': (self.target('on_event'), 0),
+            'bar': self.target('on_event')})
+        d.notify('foo', Event(None))
+        d.notify('bar', Event(None))
+        self.assertEqual([('on_event', 'foo'), ('on_event', 'bar')],
+                self.calls())
+        self.assertEqual(['first'], calls)
+
+    def test_manager_register_lazy_dictionary_of_string_like_targets(self):
+        # e.g. unicode targets on Python 2
+        d = mock.MagicMock()
+        target = collections.UserString(self.target('on_event')) \
+                if hasattr(collections, 'UserString') \
+                else unicode(self.target('on_event'))
+        Manager(d).register_lazy({'foo': target})
+        (name, listener), = d.attach_many.call_args[0][0]
+        self.assertEqual('foo', name)
+        self.assertEqual(target, listener.listener)
+
+
+if "__main__" == __name__:
+    unittest.main()
@@ -4,7 +4,12 @@
 ##
 # python standard library
 #
+import gc
 import unittest
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
 
 ##
 # test helpers
@@ -14,7 +19,7 @@ from testutils import mock, IsA
 ##
 # event modules
 #
-from pyevent import Manager
+from pyevent import Manager, Dispatcher, Listener
 
 
 class ManagerTestCase(unittest.TestCase):
@@ -73,5 +78,67 @@ class ManagerTestCase(unittest.TestCase):
         self.listener.set_dispatcher.assert_called_once_with(IsA(mock.MagicMock))
 
 
+    def test_register_can_attach_weak_references(self):
+        Manager(self.dispatcher).register(self.listener, weak=True)
+        self.dispatcher.attach.assert_called_once_with('a', 'b', None,
+                weak=True)
+
+    def test_register_many_calls_dispatcher_attach_many_method_once(self):
+        other = mock.MagicMock()
+        other.mapping = mock.MagicMock(return_value=[('c', 'd', 1)])
+        Manager(self.dispatcher).register_many([self.listener, other])
+        self.dispatcher.attach_many.assert_called_once_with(
+                [('a', 'b'), ('c', 'd', 1)], False)
+        self.listener.set_dispatcher.assert_called_once_with(self.dispatcher)
+        other.set_dispatcher.assert_called_once_with(self.dispatcher)
+
+    def test_unregister_calls_dispatcher_detach_method(self):
+        self.listener.mapping = mock.MagicMock(return_value=[('a', 'b', 1)])
+        Manager(self.dispatcher).unregister(self.listener)
+        self.dispatcher.detach.assert_called_once_with('a', 'b')
+
+
+class RequestListener(Listener):
+
+    def mapping(self):
+        return [('request', self.handle, 10), ('response', self.handle)]
+
+    def handle(self, event, deferred):
+        deferred.resolve()
+
+
+@unittest.skipIf(tracemalloc is None, 'tracemalloc requires Python 3.4+')
+class ManagerChurnTestCase(unittest.TestCase):
+
+    def churn(self, manager, weak):
+        for i in range(1000):
+            listener = RequestListener()
+            manager.register(listener, weak)
+            if not weak:
+                manager.unregister(listener)
+        gc.collect()
+
+    def assert_memory_is_flat(self, weak):
+        dispatcher = Dispatcher()
+        manager = Manager(dispatcher)
+        tracemalloc.start()
+        try:
+            self.churn(manager, weak)
+            before = tracemalloc.get_traced_memory()[0]
+            for i in range(5):
+                self.churn(manager, weak)
+            after = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        self.assertEqual({}, dispatcher._listeners)
+        self.assertLess(after - before, 10000)
+
+    def test_memory_is_flat_under_register_unregister_churn(self):
+        self.assert_memory_is_flat(False)
+
+    def test_memory_is_flat_under_weak_register_churn(self):
+        self.assert_memory_is_flat(True)
+
+
 if "__main__" == __name__:
     unittest.main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# python standard library
+#
+import unittest
+
+##
+# test helpers
+#
+from testutils import mock
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher, Histogram, Profiler, synchronous
+
+
+def call_deferred(event, deferred):
+    deferred.resolve()
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_init_state(self):
+        h = Histogram()
+        self.assertEqual(0, h.count)
+        self.assertEqual(0, h.mean())
+        self.assertEqual(0, h.percentile(50))
+
+    def test_record_updates_statistics(self):
+        h = Histogram()
+        for value in (1, 2, 3, 10):
+            h.record(value)
+        self.assertEqual(4, h.count)
+        self.assertEqual(16, h.total)
+        self.assertEqual(1, h.min)
+        self.assertEqual(10, h.max)
+        self.assertEqual(4.0, h.mean())
+
+    def test_percentile_has_bounded_relative_error(self):
+        h = Histogram(precision=4)
+        for value in range(1, 100001):
+            h.record(value)
+        for percent in (50, 90, 99):
+            expected = percent * 1000
+            self.assertLessEqual(h.percentile(percent), expected)
+            self.assertGreater(h.percentile(percent), expected * (1 - 1 / 16.))
+
+    def test_record_clamps_values(self):
+        h = Histogram(max_bits=10)
+        h.record(-5)
+        h.record(10 ** 9)
+        self.assertEqual(0, h.min)
+        self.assertEqual(1023, h.max)
+
+
+class ProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.time = [0.0]
+        self.profiler = Profiler(clock=lambda: self.time[0])
+        self.dispatcher = Dispatcher()
+        self.dispatcher.enable_profiling(self.profiler)
+
+    def tick(self, seconds):
+        self.time[0] += seconds
+
+    def test_notify_does_not_record_anything_when_profiling_is_disabled(self):
+        self.dispatcher.attach('foo', call_deferred)
+        self.assertIs(self.profiler, self.dispatcher.disable_profiling())
+        self.dispatcher.notify('foo', Event(None))
+        self.assertEqual({'events': {}, 'listeners': {}},
+                self.profiler.snapshot())
+
+    def test_notify_records_listener_calls(self):
+        deferreds = []
+
+        @synchronous
+        def foo(event):
+            self.tick(0.001)
+
+        def bar(event, deferred):
+            deferreds.append(deferred)
+        self.dispatcher.attach('foo', foo)
+        self.dispatcher.attach('foo', bar)
+        cb = mock.MagicMock()
+
+        self.dispatcher.notify('foo', Event(None)).done(cb)
+        self.tick(0.002)
+        deferreds[0].resolve()
+
+        cb.assert_called_once_with(mock.ANY)
+        snapshot = self.profiler.snapshot()
+        self.assertEqual({'notifications': 1, 'stopped': 0, 'failures': 0},
+                snapshot['events']['foo'])
+        bar_stats, foo_stats = sorted(snapshot['listeners']['foo'],
+                key=lambda s: s['listener'])
+        self.assertEqual(('bar', 1, 0, 1), (bar_stats['listener'],
+            bar_stats['calls'], bar_stats['sync'], bar_stats['deferred']))
+        self.assertEqual(2000, bar_stats['latency_us']['max'])
+        self.assertEqual(('foo', 1, 1, 0), (foo_stats['listener'],
+            foo_stats['calls'], foo_stats['sync'], foo_stats['deferred']))
+        self.assertEqual(1000, foo_stats['latency_us']['max'])
+
+    def test_notify_records_stopped_propagation_and_failures(self):
+        self.dispatcher.attach('foo', lambda event, deferred: \
+                deferred.resolve(event.stop_propagation()))
+        self.dispatcher.attach('foo', call_deferred)
+        self.dispatcher.attach('bar', lambda event, deferred: \
+                deferred.reject('err'))
+
+        self.dispatcher.notify('foo', Event(None))
+        self.dispatcher.notify('bar', Event(None))
+
+        events = self.profiler.snapshot()['events']
+        self.assertEqual(1, events['foo']['stopped'])
+        self.assertEqual(1, events['bar']['failures'])
+        self.assertEqual(1,
+                self.profiler.snapshot()['listeners']['bar'][0]['failures'])
+
+    def test_prometheus_exports_text_format(self):
+        def foo(event, deferred):
+            deferred.resolve()
+        self.dispatcher.attach('foo', foo)
+        self.dispatcher.notify('foo', Event(None))
+
+        text = self.profiler.prometheus()
+
+        self.assertTrue('# TYPE pyevent_event_notifications_total counter\n'
+                in text)
+        self.assertTrue('pyevent_event_notifications_total{event="foo"} 1\n'
+                in text)
+        self.assertTrue('pyevent_listener_calls_total{event="foo",' \
+                'listener="foo",completion="sync"} 1\n' in text)
+        self.assertTrue('pyevent_listener_latency_seconds_count{event="foo",' \
+                'listener="foo"} 1\n' in text)
+
+
+    def test_prometheus_labels_of_listeners_sharing_name_are_unique(self):
+        self.dispatcher.attach('foo', lambda event, deferred: \
+                deferred.resolve())
+        self.dispatcher.attach('foo', lambda event, deferred: \
+                deferred.resolve())
+        self.dispatcher.notify('foo', Event(None))
+
+        lines = [l for l in self.profiler.prometheus().splitlines() \
+                if l.startswith('pyevent_listener_calls_total{')]
+
+        self.assertEqual(4, len(lines))
+        self.assertEqual(len(lines), len(set(lines)))
+        self.assertTrue('pyevent_listener_calls_total{event="foo",' \
+                'listener="<lambda>#2",completion="sync"} 1' in lines)
+
+
+if "__main__" == __name__:
+    unittest.main()
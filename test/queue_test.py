@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# python standard library
+#
+import threading
+import unittest
+
+##
+# test helpers
+#
+from testutils import mock, IsA
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher, EventQueue, QueueFull, synchronous
+
+
+class EventQueueTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dispatcher = Dispatcher()
+        self.calls = []
+        self.dispatcher.attach('foo', synchronous(self.calls.append))
+        self.dispatcher.attach('bar', synchronous(self.calls.append))
+
+    def queue(self, *args, **kwargs):
+        return EventQueue(self.dispatcher, *args, **kwargs)
+
+    def test_events_are_not_dispatched_before_drain(self):
+        q = self.queue()
+        q.put('foo', Event(None))
+        self.assertEqual([], self.calls)
+        self.assertEqual(1, len(q))
+        self.assertEqual(1, q.drain())
+        self.assertEqual(1, len(self.calls))
+        self.assertEqual(0, len(q))
+
+    def test_put_returns_promise_resolved_after_dispatch(self):
+        q = self.queue()
+        e = Event(None)
+        callback = mock.MagicMock()
+        q.put('foo', e).done(callback)
+        callback.assert_never_called()
+        q.drain()
+        callback.assert_called_once_with(e)
+
+    def test_fifo_within_same_priority(self):
+        q = self.queue()
+        events = [Event(None) for i in range(5)]
+        for e in events:
+            q.put('foo', e)
+        q.drain()
+        self.assertEqual(events, self.calls)
+
+    def test_priority_by_name(self):
+        q = self.queue(priority={'bar': -1})
+        foo, bar = Event(None), Event(None)
+        q.put('foo', foo)
+        q.put('bar', bar)
+        q.drain()
+        self.assertEqual([bar, foo], self.calls)
+
+    def test_priority_by_event_field(self):
+        q = self.queue(priority=lambda name, event: event.parameters['p'])
+        events = [Event(None, {'p': p}) for p in (3, 1, 2)]
+        for e in events:
+            q.put('foo', e)
+        q.drain()
+        self.assertEqual([1, 2, 3], [e.parameters['p'] for e in self.calls])
+
+    def test_drain_limit(self):
+        q = self.queue()
+        for i in range(5):
+            q.put('foo', Event(None))
+        self.assertEqual(2, q.drain(2))
+        self.assertEqual(3, len(q))
+
+    def test_unknown_overflow_policy(self):
+        self.assertRaises(ValueError, self.queue, overflow='foo')
+
+    def fill(self, q, count):
+        events = [Event(None, {'i': i}) for i in range(count)]
+        failed = mock.MagicMock()
+        for e in events:
+            q.put('foo', e).fail(failed)
+        return events, failed
+
+    def test_reject(self):
+        q = self.queue(2, EventQueue.REJECT)
+        events, failed = self.fill(q, 3)
+        failed.assert_called_once_with(IsA(QueueFull))
+        q.drain()
+        self.assertEqual(events[:2], self.calls)
+        self.assertEqual(1, q.rejected)
+
+    def test_drop_oldest(self):
+        q = self.queue(2, EventQueue.DROP_OLDEST)
+        events, failed = self.fill(q, 4)
+        self.assertEqual(2, failed.call_count)
+        q.drain()
+        self.assertEqual(events[2:], self.calls)
+        self.assertEqual(2, q.dropped)
+
+    def test_drop_oldest_ignores_priority(self):
+        q = self.queue(2, EventQueue.DROP_OLDEST, priority={'bar': -1})
+        foo, bar, baz = Event(None), Event(None), Event(None)
+        q.put('bar', bar)
+        q.put('foo', foo)
+        q.put('foo', baz)
+        q.drain()
+        self.assertEqual([foo, baz], self.calls)
+
+    def test_drop_newest(self):
+        q = self.queue(2, EventQueue.DROP_NEWEST)
+        events, failed = self.fill(q, 4)
+        self.assertEqual(2, failed.call_count)
+        q.drain()
+        self.assertEqual([events[0], events[3]], self.calls)
+
+    def test_dropped_events_are_not_kept(self):
+        q = self.queue(10, EventQueue.DROP_OLDEST)
+        for i in range(1000):
+            q.put('foo', Event(None))
+            if i % 3:
+                q.drain(1)
+        self.assertTrue(len(q._heap) < 100)
+        self.assertTrue(len(q._age) < 100)
+
+    def test_block_with_timeout_rejects(self):
+        q = self.queue(1, EventQueue.BLOCK)
+        self.fill(q, 1)
+        failed = mock.MagicMock()
+        q.put('foo', Event(None), timeout=0.01).fail(failed)
+        failed.assert_called_once_with(IsA(QueueFull))
+
+    def test_block_waits_for_worker(self):
+        q = self.queue(1, EventQueue.BLOCK)
+        events = [Event(None) for i in range(50)]
+
+        def produce():
+            for e in events:
+                q.put('foo', e)
+            q.close()
+        producer = threading.Thread(target=produce)
+        producer.start()
+        q.run()
+        producer.join()
+        self.assertEqual(events, self.calls)
+        self.assertEqual(1, q.max_depth)
+
+    def test_close_releases_blocked_producer(self):
+        q = self.queue(1, EventQueue.BLOCK)
+        self.fill(q, 1)
+        failed = mock.MagicMock()
+        t = threading.Timer(0.01, q.close)
+        t.start()
+        q.put('foo', Event(None)).fail(failed)
+        t.join()
+        failed.assert_called_once_with(IsA(QueueFull))
+
+    def test_run_until_closed_in_worker_thread(self):
+        q = self.queue()
+        worker = threading.Thread(target=q.run)
+        worker.start()
+        for i in range(100):
+            q.put('foo', Event(None))
+        q.close()
+        worker.join()
+        self.assertEqual(100, len(self.calls))
+
+    def test_failed_dispatch_rejects_promise(self):
+        d = Dispatcher()
+        d.attach('foo', lambda event, deferred: deferred.reject('error'))
+        q = EventQueue(d)
+        failed = mock.MagicMock()
+        q.put('foo', Event(None)).fail(failed)
+        q.drain()
+        failed.assert_called_once_with('error')
+
+    def test_snapshot(self):
+        times = iter([0.0, 0.001, 0.002])
+        q = self.queue(1, EventQueue.REJECT, clock=lambda: next(times))
+        q.put('foo', Event(None))
+        q.put('foo', Event(None))
+        q.drain()
+        snapshot = q.snapshot()
+        self.assertEqual(0, snapshot['depth'])
+        self.assertEqual(1, snapshot['max_depth'])
+        self.assertEqual(1, snapshot['enqueued'])
+        self.assertEqual(1, snapshot['dispatched'])
+        self.assertEqual(1, snapshot['rejected'])
+        self.assertEqual(0, snapshot['dropped'])
+        self.assertEqual(2000, snapshot['latency']['max'])
+
+
+if "__main__" == __name__:
+    unittest.main()
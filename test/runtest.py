@@ -6,7 +6,15 @@ import sys
 import unittest
 
 TEST_MODULES = ['event_test', 'dispatcher_test', 'listener_test', \
-        'decorators_test', 'manager_test', 'dispatcher_aware_test']
+        'decorators_test', 'manager_test', 'dispatcher_aware_test', \
+        'profiler_test', 'bus_test', \
+        'coalesce_test', 'queue_test', 'timeout_test', \
+        'journal_test', 'cache_test', 'lazy_test', \
+        'sharded_test']
+
+# coroutine syntax can not be even compiled by older interpreters
+if sys.version_info >= (3, 5):
+    TEST_MODULES.append('asyncio_test')
 
 
 def all():
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# python standard library
+#
+import threading
+import unittest
+
+##
+# test helpers
+#
+from testutils import mock
+
+##
+# event modules
+#
+from pyevent import Event, ShardedDispatcher, synchronous
+
+
+def tenant(event):
+    return event.parameters.get('tenant')
+
+
+class ShardedDispatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.dispatcher = ShardedDispatcher(tenant)
+        self.calls = []
+
+    def listener(self, label, sync=True):
+        if sync:
+            return synchronous(lambda event: self.calls.append(label))
+
+        def listener(event, deferred):
+            self.calls.append(label)
+            deferred.resolve()
+        return listener
+
+    def notify(self, t=None, name='foo'):
+        self.calls = []
+        self.dispatcher.notify(name, Event(None, {'tenant': t}))
+        return self.calls
+
+    def test_global_listeners_are_notified_about_all_events(self):
+        self.dispatcher.attach('foo', self.listener('global'))
+        self.dispatcher.shard('a')
+        self.assertEqual(['global'], self.notify('a'))
+        self.assertEqual(['global'], self.notify('b'))
+        self.assertEqual(['global'], self.notify())
+
+    def test_shard_listeners_are_notified_about_routed_events(self):
+        self.dispatcher.shard('a').attach('foo', self.listener('a'))
+        self.dispatcher.shard('b').attach('foo', self.listener('b', False))
+        self.assertEqual(['a'], self.notify('a'))
+        self.assertEqual(['b'], self.notify('b'))
+        self.assertEqual([], self.notify('c'))
+        self.assertEqual([], self.notify())
+
+    def test_tiers_are_merged_by_priority(self):
+        d = self.dispatcher
+        d.attach('foo', self.listener('g1'), 1)
+        d.shard('a').attach('foo', self.listener('a2'), 2)
+        d.attach('foo', self.listener('g3'), 3)
+        d.shard('a').attach('foo', self.listener('a0'), 0)
+        d.attach('foo', self.listener('g2'), 2)
+        self.assertEqual(['a0', 'g1', 'a2', 'g2', 'g3'], self.notify('a'))
+
+    def test_changes_of_both_tiers_invalidate_merged_list(self):
+        d = self.dispatcher
+        shared = self.listener('g')
+        own = self.listener('a')
+        d.attach('foo', shared)
+        self.assertEqual(['g'], self.notify('a'))
+        d.shard('a').attach('foo', own)
+        self.assertEqual(['g', 'a'], self.notify('a'))
+        d.detach('foo', shared)
+        self.assertEqual(['a'], self.notify('a'))
+        d.shard('a').detach('foo', own)
+        self.assertEqual([], self.notify('a'))
+
+    def test_patterns_of_both_tiers(self):
+        d = self.dispatcher
+        d.attach_pattern('foo.*', self.listener('g'))
+        d.shard('a').attach_pattern('#', self.listener('a'))
+        self.assertEqual(['g', 'a'], self.notify('a', 'foo.bar'))
+        self.assertEqual(['g'], self.notify('b', 'foo.bar'))
+        d.shard('a').detach_pattern('#', self.listener('a'))
+
+    def test_drop_shard(self):
+        d = self.dispatcher
+        d.shard('a').attach('foo', self.listener('a'))
+        self.notify('a')
+        d.drop_shard('a')
+        self.assertEqual([], d.shards())
+        self.assertEqual([], self.notify('a'))
+
+    def test_shard_filters(self):
+        self.dispatcher.shard('a').attach('foo', self.listener('a'),
+                where={'tenant': 'a', 'x': 1})
+        self.calls = []
+        self.dispatcher.notify('foo', Event(None, {'tenant': 'a', 'x': 1}))
+        self.assertEqual(['a'], self.calls)
+        self.assertEqual([], self.notify('a'))
+
+    def test_notify_sync(self):
+        self.dispatcher.attach('foo', self.listener('g'))
+        self.dispatcher.shard('a').attach('foo', self.listener('a'))
+        self.dispatcher.shard('b').attach('foo', self.listener('b', False))
+        self.dispatcher.notify_sync('foo', Event(None, {'tenant': 'a'}))
+        self.assertEqual(['g', 'a'], self.calls)
+        self.assertRaises(TypeError, self.dispatcher.notify_sync, 'foo',
+                Event(None, {'tenant': 'b'}))
+
+    def test_notify_collect(self):
+        self.dispatcher.attach('foo', synchronous(lambda event: 'g'), 1)
+        self.dispatcher.shard('a').attach('foo',
+                synchronous(lambda event: 'a'), 0)
+        cb = mock.MagicMock()
+        self.dispatcher.notify_collect('foo', Event(None, {'tenant': 'a'}))\
+                .done(cb)
+        cb.assert_called_once_with(['a', 'g'])
+
+    def test_notify_parallel(self):
+        self.dispatcher.attach('foo', self.listener('g', False), 1)
+        self.dispatcher.shard('a').attach('foo', self.listener('a', False),
+                0)
+        self.dispatcher.notify_parallel('foo', Event(None, {'tenant': 'a'}))
+        self.dispatcher.notify_parallel('foo', Event(None, {'tenant': 'b'}))
+        self.assertEqual(['a', 'g', 'g'], self.calls)
+
+    def test_notify_parallel_reuses_merged_bands(self):
+        d = self.dispatcher
+        d.attach('foo', self.listener('g', False), 1)
+        d.shard('a').attach('foo', self.listener('a', False), 0)
+        d.notify_parallel('foo', Event(None, {'tenant': 'a'}))
+        bands = d._merged_bands['foo']['a']
+        d.notify_parallel('foo', Event(None, {'tenant': 'a'}))
+        self.assertIs(bands, d._merged_bands['foo']['a'])
+        d.shard('a').attach('foo', self.listener('a1', False), 1)
+        d.attach('foo', self.listener('g2', False), 2)
+        self.calls = []
+        d.notify_parallel('foo', Event(None, {'tenant': 'a'}))
+        self.assertEqual(['a', 'g', 'a1', 'g2'], self.calls)
+        d.drop_shard('a')
+        self.assertEqual({}, d._merged_bands['foo'])
+
+    def test_shards_without_own_listeners_share_global_lists(self):
+        d = self.dispatcher
+        d.attach('foo', self.listener('g', False))
+        d.shard('b').attach('bar', self.listener('b'))
+        for t in ('a', 'b'):
+            self.assertEqual(['g'], self.notify(t))
+            d.notify_parallel('foo', Event(None, {'tenant': t}))
+            self.assertIs(d._snapshot('foo'), d._tier(d.shard(t), 'foo'))
+            self.assertIs(d._priority_bands('foo'),
+                    d._tier_bands(d.shard(t), 'foo'))
+        d.shard('a').attach('foo', self.listener('a'))
+        self.assertEqual(['g', 'a'], self.notify('a'))
+        self.assertEqual(['g'], self.notify('b'))
+
+    def test_notify_many_groups_events_by_shard(self):
+        self.dispatcher.attach('foo', self.listener('g'))
+        self.dispatcher.shard('a').attach('foo', self.listener('a'))
+        cb = mock.MagicMock()
+        events = [Event(None, {'tenant': t}) for t in ('a', 'b', 'a')]
+        self.dispatcher.notify_many('foo', events).done(cb)
+        cb.assert_called_once_with(events)
+        self.assertEqual(['g', 'g', 'a', 'a', 'g'], self.calls)
+
+    def test_many_shards(self):
+        for t in range(1000):
+            self.dispatcher.shard(t).attach('foo', self.listener(t))
+        self.assertEqual([567], self.notify(567))
+
+    def test_can_not_be_frozen(self):
+        self.assertRaises(TypeError, self.dispatcher.freeze)
+        self.assertRaises(TypeError, self.dispatcher.shard('a').freeze)
+
+    def test_concurrent_attach_and_notify(self):
+        d = self.dispatcher
+        d.attach('foo', synchronous(lambda event: None))
+        errors = []
+
+        def writer(t):
+            try:
+                for i in range(200):
+                    listener = synchronous(lambda event: None)
+                    d.shard(t).attach('foo', listener)
+                    d.shard(t).detach('foo', listener)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer, args=(t,)) \
+                for t in range(4)]
+        for thread in threads:
+            thread.start()
+        for i in range(2000):
+            d.notify('foo', Event(None, {'tenant': i % 4}))
+        for thread in threads:
+            thread.join()
+        self.assertEqual([], errors)
+        for t in range(4):
+            self.assertEqual(1, len(d._select('foo',
+                Event(None, {'tenant': t}))))
+
+
+if "__main__" == __name__:
+    unittest.main()
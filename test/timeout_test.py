@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+##
+# python standard library
+#
+import threading
+import unittest
+
+##
+# test helpers
+#
+from testutils import mock, IsA
+from fixtures import Clock
+
+##
+# event modules
+#
+from pyevent import Event, Dispatcher, ListenerTimeout, Scheduler, \
+        CircuitBreaker, timed, synchronous
+
+
+class ManualScheduler(object):
+
+    def __init__(self):
+        self.timers = []
+
+    def call_later(self, delay, callback):
+        timer = mock.MagicMock()
+        timer.delay = delay
+        timer.callback = callback
+        self.timers.append(timer)
+        return timer
+
+    def fire(self):
+        for timer in self.timers:
+            if not timer.cancel.called:
+                timer.callback()
+
+
+def call_deferred(event, deferred):
+    deferred.resolve('ok')
+
+
+def fail_deferred(event, deferred):
+    deferred.reject('error')
+
+
+class SchedulerTestCase(unittest.TestCase):
+
+    def test_calls_callbacks_in_order_of_deadlines(self):
+        scheduler = Scheduler()
+        calls = []
+        finished = threading.Event()
+        scheduler.call_later(0.02, lambda: (calls.append(2), finished.set()))
+        scheduler.call_later(0.01, lambda: calls.append(1))
+        self.assertTrue(finished.wait(5))
+        self.assertEqual([1, 2], calls)
+
+    def test_cancelled_callback_is_not_called(self):
+        scheduler = Scheduler()
+        callback = mock.MagicMock()
+        finished = threading.Event()
+        scheduler.call_later(0.01, callback).cancel()
+        scheduler.call_later(0.02, finished.set)
+        self.assertTrue(finished.wait(5))
+        callback.assert_never_called()
+
+    def test_cancelled_timers_are_dropped(self):
+        scheduler = Scheduler()
+        callback = mock.MagicMock()
+        scheduler.call_later(30, callback)
+        for i in range(1000):
+            timer = scheduler.call_later(30, callback)
+            timer.cancel()
+            timer.cancel()
+        self.assertLessEqual(len(scheduler._heap), 3)
+        self.assertEqual(1, len([i for i in scheduler._heap \
+                if i[2].callback is not None]))
+
+
+class TimedListenerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = ManualScheduler()
+        self.pending = []
+        self.slow = lambda event, deferred: self.pending.append(deferred)
+
+    def test_slow_listener_fails_with_timeout(self):
+        d = Dispatcher()
+        d.scheduler = self.scheduler
+        after = mock.MagicMock()
+        failed = mock.MagicMock()
+        d.attach('foo', self.slow, timeout=1)
+        d.attach('foo', synchronous(after))
+
+        d.notify('foo', Event(None)).fail(failed)
+        self.assertEqual(1, self.scheduler.timers[0].delay)
+        failed.assert_never_called()
+        self.scheduler.fire()
+        failed.assert_called_once_with(IsA(ListenerTimeout))
+        after.assert_never_called()
+
+    def test_slow_listener_is_skipped(self):
+        d = Dispatcher()
+        after = mock.MagicMock()
+        done = mock.MagicMock()
+        d.attach('foo', timed(self.slow, 1, True, self.scheduler))
+        d.attach('foo', synchronous(after))
+
+        d.notify('foo', Event(None)).done(done)
+        self.scheduler.fire()
+        done.assert_called_once_with(IsA(Event))
+        after.assert_called_once_with(IsA(Event))
+
+    def test_late_result_is_ignored(self):
+        d = Dispatcher()
+        after = mock.MagicMock()
+        d.attach('foo', timed(self.slow, 1, True, self.scheduler))
+        d.attach('foo', synchronous(after))
+
+        d.notify('foo', Event(None))
+        self.scheduler.fire()
+        self.pending[0].resolve()
+        self.assertEqual(1, after.call_count)
+
+    def test_timer_is_cancelled_when_listener_finishes(self):
+        d = Dispatcher()
+        done = mock.MagicMock()
+        d.attach('foo', timed(call_deferred, 1, scheduler=self.scheduler))
+
+        d.notify('foo', Event(None)).done(done)
+        done.assert_called_once_with(IsA(Event))
+        self.assertTrue(self.scheduler.timers[0].cancel.called)
+
+    def test_failure_is_passed_through(self):
+        d = Dispatcher()
+        failed = mock.MagicMock()
+        d.attach('foo', timed(fail_deferred, 1, scheduler=self.scheduler))
+
+        d.notify('foo', Event(None)).fail(failed)
+        failed.assert_called_once_with('error')
+
+    def test_synchronous_listener_is_not_wrapped(self):
+        listener = synchronous(lambda event: None)
+        self.assertIs(listener, timed(listener, 1))
+
+    def test_detach_timed_listener(self):
+        d = Dispatcher()
+        d.attach('foo', self.slow, timeout=1)
+        d.detach('foo', self.slow)
+        self.assertFalse('foo' in d)
+
+    def test_default_scheduler(self):
+        d = Dispatcher()
+        finished = threading.Event()
+        d.attach('foo', self.slow, timeout=0.01)
+        d.notify('foo', Event(None)).fail(lambda error: finished.set())
+        self.assertTrue(finished.wait(5))
+
+
+class NotifyTimeoutTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = ManualScheduler()
+        self.pending = []
+        self.dispatcher = Dispatcher()
+        self.dispatcher.scheduler = self.scheduler
+        self.after = mock.MagicMock()
+        self.dispatcher.attach('foo',
+                lambda event, deferred: self.pending.append(deferred))
+        self.dispatcher.attach('foo', synchronous(self.after))
+
+    def test_notify_timeout_rejects_promise(self):
+        event = Event(None)
+        failed = mock.MagicMock()
+        self.dispatcher.notify('foo', event, timeout=2).fail(failed)
+        self.scheduler.fire()
+        failed.assert_called_once_with(IsA(ListenerTimeout))
+        self.assertTrue(event.is_propagation_stopped())
+        self.pending[0].resolve()
+        self.after.assert_never_called()
+
+    def test_notify_in_time(self):
+        done = mock.MagicMock()
+        failed = mock.MagicMock()
+        self.dispatcher.notify('foo', Event(None), timeout=2).done(done)\
+                .fail(failed)
+        self.pending[0].resolve()
+        done.assert_called_once_with(IsA(Event))
+        self.scheduler.fire()
+        failed.assert_never_called()
+
+    def test_frozen_dispatcher_notify_timeout(self):
+        failed = mock.MagicMock()
+        self.dispatcher.freeze().notify('foo', Event(None), timeout=2)\
+                .fail(failed)
+        self.scheduler.fire()
+        failed.assert_called_once_with(IsA(ListenerTimeout))
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.fail = True
+        self.listener = mock.MagicMock(side_effect=self.call)
+        self.breaker = CircuitBreaker(self.listener, threshold=0.5, window=4,
+                min_calls=4, cooldown=10, clock=self.clock)
+        self.dispatcher = Dispatcher()
+        self.dispatcher.attach('foo', self.breaker)
+
+    def call(self, event, deferred):
+        if self.fail:
+            deferred.reject('error')
+        else:
+            deferred.resolve()
+
+    def notify(self, count=1):
+        for i in range(count):
+            self.dispatcher.notify('foo', Event(None))
+
+    def test_closed_circuit_passes_failures(self):
+        failed = mock.MagicMock()
+        self.dispatcher.notify('foo', Event(None)).fail(failed)
+        failed.assert_called_once_with('error')
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+
+    def test_opens_when_failure_rate_exceeds_threshold(self):
+        self.notify(4)
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+        self.notify(3)
+        self.assertEqual(4, self.listener.call_count)
+        self.assertEqual(3, self.breaker.skipped)
+
+    def test_stays_closed_below_threshold(self):
+        self.notify(1)
+        self.fail = False
+        self.notify(10)
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+
+    def test_skipped_listener_resolves(self):
+        self.notify(4)
+        done = mock.MagicMock()
+        self.dispatcher.notify('foo', Event(None)).done(done)
+        done.assert_called_once_with(IsA(Event))
+
+    def test_half_open_success_closes_circuit(self):
+        self.notify(4)
+        self.clock.now = 10
+        self.fail = False
+        self.notify(1)
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+        self.assertEqual(5, self.listener.call_count)
+
+    def test_half_open_failure_opens_circuit(self):
+        self.notify(4)
+        self.clock.now = 10
+        self.notify(2)
+        self.assertEqual(CircuitBreaker.OPEN, self.breaker.state)
+        self.assertEqual(5, self.listener.call_count)
+        self.assertEqual(2, self.breaker.opened)
+
+    def test_only_single_trial_call_in_half_open_state(self):
+        pending = []
+        self.notify(4)
+        self.clock.now = 10
+        self.listener.side_effect = lambda event, deferred: \
+                pending.append(deferred)
+        self.notify(3)
+        self.assertEqual(CircuitBreaker.HALF_OPEN, self.breaker.state)
+        self.assertEqual(5, self.listener.call_count)
+        pending[0].resolve()
+        self.assertEqual(CircuitBreaker.CLOSED, self.breaker.state)
+
+    def test_timeouts_count_as_failures(self):
+        scheduler = ManualScheduler()
+        breaker = CircuitBreaker(timed(lambda event, deferred: None, 1,
+            scheduler=scheduler), window=2, min_calls=2)
+        d = Dispatcher()
+        d.attach('foo', breaker)
+        for i in range(2):
+            d.notify('foo', Event(None))
+        scheduler.fire()
+        self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+
+    def test_exception_counts_as_failure(self):
+        breaker = CircuitBreaker(mock.MagicMock(side_effect=ValueError),
+                min_calls=1)
+        d = Dispatcher()
+        d.attach('foo', breaker)
+        self.assertRaises(ValueError, d.notify, 'foo', Event(None))
+        self.assertEqual(CircuitBreaker.OPEN, breaker.state)
+
+    def test_detach_by_wrapped_listener(self):
+        self.dispatcher.detach('foo', self.listener)
+        self.assertFalse('foo' in self.dispatcher)
+
+    def test_snapshot(self):
+        self.notify(4)
+        self.notify(1)
+        self.assertEqual({'state': 'open', 'calls': 4, 'failures': 4,
+            'skipped': 1, 'opened': 1, 'failure_rate': 0.0},
+            self.breaker.snapshot())
+
+
+if "__main__" == __name__:
+    unittest.main()